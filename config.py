@@ -3,6 +3,8 @@ Configuración del juego Trivia LAN
 Modifica estos valores para personalizar el juego
 """
 
+import os
+
 # Configuración principal del juego
 GAME_CONFIG = {
     # Puntos necesarios para ganar la partida
@@ -26,7 +28,70 @@ GAME_CONFIG = {
     "MAX_PLAYERS_PER_ROOM": 0,
     
     # Tiempo de espera antes de mostrar resultados (segundos)
-    "RESULTS_DELAY": 2
+    "RESULTS_DELAY": 2,
+    
+    # Jugadores a partir de los cuales una sala se considera "grande" (0 = desactivado).
+    # En salas grandes round_end solo lleva el top-K y cada jugador recibe su posición aparte
+    "LARGE_ROOM_THRESHOLD": 30,
+    
+    # Tamaño del leaderboard compartido en salas grandes
+    "LEADERBOARD_TOP_K": 10,
+    
+    # Máximo de respuestas guardadas por jugador en cada ronda (se descartan las más antiguas,
+    # y una respuesta aceptada por el host solo re-evalúa las que siguen guardadas)
+    "MAX_ANSWERS_PER_PLAYER": 20,
+    
+    # Las respuestas que acepta un host se guardan en el CSV del banco y valen para todas
+    # las salas. Cualquiera puede crear una sala y ser su host, así que solo conviene
+    # activarlo en una LAN de confianza; desactivado valen solo en la ronda de esa sala
+    "SHARE_HOST_ALIASES": False,
+    
+    # Limpieza automática de salas (segundos)
+    "ROOM_IDLE_TTL": 1800,      # Sala sin actividad
+    "ROOM_FINISHED_TTL": 300,   # Sala con partida terminada
+    "ROOM_EMPTY_TTL": 60,       # Sala sin jugadores conectados
+    "RECONNECT_GRACE": 60,      # Tiempo para volver con el mismo nombre y conservar los puntos
+    "REAPER_INTERVAL": 30,      # Cada cuánto se revisan las salas
+    
+    # Cada cuánto se envía a los espectadores el resumen de actividad (segundos)
+    "SPECTATOR_FLUSH_INTERVAL": 1.0,
+    
+    # Caché de veredictos (pregunta, respuesta normalizada) -> correcta/incorrecta
+    "VERDICT_CACHE_SIZE": 20000,  # Entradas máximas (se descartan las menos usadas)
+    "VERDICT_CACHE_TTL": 600,     # Segundos de validez de cada entrada
+    
+    # Comandos que el actor de una sala procesa juntos antes de enviar sus eventos
+    "ROOM_COMMAND_BATCH": 64,
+    
+    # Elegir preguntas según su tasa de acierto histórica, ej: (0.2, 0.8) evita las
+    # que casi nadie o casi todos aciertan (None = sin filtro por dificultad)
+    "DIFFICULTY_BAND": None,
+    
+    # Jugadores que deben haber visto una pregunta antes de usar su tasa de acierto
+    "DIFFICULTY_MIN_PLAYERS": 20,
+    
+    # Cada cuánto se guardan en disco las estadísticas de preguntas (segundos)
+    "STATS_FLUSH_INTERVAL": 2.0,
+    
+    # Torneos: jugadores por sala, rondas por partida (o hasta TARGET_POINTS si se
+    # alcanza antes) y segundos de espera antes de la primera ronda de cada etapa
+    "TOURNAMENT_ROOM_SIZE": 8,
+    "TOURNAMENT_ROUNDS_PER_MATCH": 5,
+    "TOURNAMENT_START_DELAY": 5,
+    
+    # Partidas masivas: jugadores por fragmento (cada uno es una sala de Socket.IO con
+    # su propio estado y actor; el coordinador une sus resultados)
+    "MEGA_SHARD_SIZE": 500,
+    
+    # Salas cerradas que se conservan en el historial exportable (/history/export) y
+    # rondas que se guardan por partida (en partidas más largas se descartan las más viejas)
+    "HISTORY_MAX_ROOMS": 5000,
+    "HISTORY_MAX_ROUNDS_PER_MATCH": 200,
+    
+    # Directorio de salas (/rooms): segundos que una página puede servirse desactualizada
+    # y máximo de salas por página
+    "DIRECTORY_CACHE_TTL": 1.0,
+    "DIRECTORY_PAGE_SIZE": 50
 }
 
 # Configuración del servidor
@@ -41,7 +106,50 @@ SERVER_CONFIG = {
     "DEBUG": False,
     
     # Habilitar recarga automática en desarrollo
-    "RELOAD": False
+    "RELOAD": False,
+    
+    # Ofrecer msgpack (binario) a los clientes que lo soporten; si es False todos usan JSON
+    "ALLOW_MSGPACK": True,
+    
+    # Procesos de uvicorn. El estado del juego vive en memoria, así que debe ser 1
+    "WORKERS": 1,
+    
+    # Nivel de log de uvicorn (critical, error, warning, info, debug)
+    "LOG_LEVEL": "info",
+    
+    # Conexiones pendientes de aceptar y segundos de keep-alive HTTP
+    "BACKLOG": 2048,
+    "TIMEOUT_KEEP_ALIVE": 5,
+    
+    # Engine.IO: intervalo y espera de ping (segundos) y tamaño máximo de mensaje (bytes)
+    "PING_INTERVAL": 25,
+    "PING_TIMEOUT": 20,
+    "MAX_HTTP_BUFFER_SIZE": 1_000_000,
+    
+    # Aceptar solo WebSocket (sin long-polling HTTP); los clientes se adaptan vía /wire
+    "WEBSOCKET_ONLY": False,
+    
+    # Paquetes pendientes por conexión a partir de los cuales se descartan eventos de
+    # actividad y se colapsan las listas de jugadores (0 = sin límite)
+    "OUTBOUND_QUEUE_LIMIT": 64,
+    
+    # Cada cuánto se reintenta enviar los eventos colapsados (segundos)
+    "BACKPRESSURE_FLUSH_INTERVAL": 0.5,
+    
+    # Token de los endpoints /admin (perfilado y memoria); vacío = desactivados.
+    # Conviene definirlo con la variable de entorno TRIVIA_ADMIN_TOKEN
+    "ADMIN_TOKEN": "",
+    
+    # Duración máxima de un perfil de CPU (segundos)
+    "PROFILE_MAX_SECONDS": 60,
+    
+    # Cada cuánto se mide el retraso del event loop (segundos)
+    "LOOP_LAG_INTERVAL": 0.5,
+    
+    # Panel en vivo (/admin/dashboard): cada cuánto se publica la foto agregada y cuánto
+    # dura cada conexión SSE antes de que el navegador se reconecte (segundos)
+    "DASHBOARD_INTERVAL": 1.0,
+    "DASHBOARD_STREAM_SECONDS": 60
 }
 
 # Configuración de archivos
@@ -53,7 +161,13 @@ FILES_CONFIG = {
     "STATIC_DIR": "static",
     
     # Archivo HTML del cliente
-    "CLIENT_HTML": "client.html"
+    "CLIENT_HTML": "client.html",
+    
+    # Base SQLite con estadísticas por pregunta
+    "STATS_DB": "data/question_stats.sqlite3",
+    
+    # Dimensiones y miniaturas de las imágenes ya calculadas (se regenera si falta)
+    "IMAGE_META_CACHE": "data/image_meta.json"
 }
 
 # Mensajes del juego (para internacionalización)
@@ -68,5 +182,32 @@ MESSAGES = {
     "ANSWER_ALREADY_SUBMITTED": "Ya enviaste tu respuesta",
     "EMPTY_ANSWER": "La respuesta no puede estar vacía",
     "GAME_NOT_ACTIVE": "El juego no está activo",
-    "ROUND_IN_PROGRESS": "Ya hay una ronda en curso"
+    "ROUND_IN_PROGRESS": "Ya hay una ronda en curso",
+    "ROOM_FULL": "La sala está llena",
+    "ROOM_CLOSED": "La sala fue cerrada por inactividad"
 }
+
+
+def apply_env_overrides(config: dict, prefix: str = "TRIVIA_") -> dict:
+    """
+    Sobrescribe valores con variables de entorno (ej: TRIVIA_PORT=9000),
+    convirtiéndolas al tipo del valor por defecto
+    """
+    for key, default in config.items():
+        raw = os.environ.get(prefix + key)
+        if raw is None:
+            continue
+        
+        if isinstance(default, bool):
+            config[key] = raw.strip().lower() in ("1", "true", "yes", "si", "sí", "on")
+        elif isinstance(default, int):
+            config[key] = int(raw)
+        elif isinstance(default, float):
+            config[key] = float(raw)
+        else:
+            config[key] = raw
+    
+    return config
+
+
+apply_env_overrides(SERVER_CONFIG)
@@ -0,0 +1,99 @@
+"""
+Panel de administración en vivo de Trivia LAN
+El motor suma cada respuesta evaluada a unos pocos contadores (LiveStats) y una tarea
+del servidor arma una vez por segundo la foto agregada de todo el servidor: salas por
+estado, jugadores, respuestas por segundo, tasa de aciertos, latencia de evaluación y
+retraso del event loop. La foto se serializa una sola vez como evento SSE y todos los
+paneles abiertos reciben el mismo texto (DashboardFeed), así el costo no crece con la
+cantidad de paneles ni de salas
+"""
+
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+
+class LiveStats:
+    """
+    Contadores acumulados de las respuestas evaluadas en todas las salas. sample()
+    devuelve lo ocurrido desde la muestra anterior
+    """
+
+    def __init__(self):
+        self.submissions = 0
+        self.correct = 0
+        self.grading_seconds = 0.0
+        self.grading_max = 0.0  # Evaluación más lenta desde la última muestra
+        self.last_sample: Optional[Tuple[float, int, int, float]] = None  # (momento, respuestas, aciertos, segundos)
+
+    def record_answer(self, correct: bool, grading_seconds: float):
+        self.submissions += 1
+        self.correct += correct
+        self.grading_seconds += grading_seconds
+        if grading_seconds > self.grading_max:
+            self.grading_max = grading_seconds
+
+    def sample(self, now: float) -> Dict:
+        """
+        Respuestas por segundo, tasa de aciertos y latencia de evaluación desde la
+        muestra anterior (la primera cuenta desde el arranque)
+        """
+        started, submissions, correct, grading = self.last_sample or (now, 0, 0, 0.0)
+        elapsed = now - started
+        submissions = self.submissions - submissions
+        correct = self.correct - correct
+        grading = self.grading_seconds - grading
+        grading_max, self.grading_max = self.grading_max, 0.0
+        self.last_sample = (now, self.submissions, self.correct, self.grading_seconds)
+        return {
+            "per_second": round(submissions / elapsed, 2) if elapsed > 0 else 0.0,
+            "correct_rate": round(correct / submissions, 4) if submissions else 0.0,
+            "grading_avg_ms": round(grading / submissions * 1000, 3) if submissions else 0.0,
+            "grading_max_ms": round(grading_max * 1000, 3),
+            "total": self.submissions,
+            "correct_total": self.correct
+        }
+
+
+class DashboardFeed:
+    """
+    Última foto del panel ya serializada como evento SSE. Cada panel conectado espera
+    la siguiente publicación y envía el mismo texto; un panel lento se saltea fotos en
+    vez de acumularlas
+    """
+
+    def __init__(self, retry_ms: int = 2000):
+        self.retry_ms = retry_ms
+        self.snapshot: Optional[Dict] = None
+        self.frame: Optional[str] = None
+        self.version = 0
+        self.subscribers = 0
+        self.published = asyncio.Event()
+
+    def publish(self, snapshot: Dict):
+        self.snapshot = snapshot
+        self.version += 1
+        self.frame = f"id: {self.version}\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+        published, self.published = self.published, asyncio.Event()
+        published.set()
+
+    async def stream(self, max_seconds: float) -> AsyncIterator[str]:
+        """
+        Eventos SSE durante `max_seconds` segundos; después se corta y EventSource se
+        reconecta solo (así una conexión abierta no frena el apagado del servidor)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_seconds
+        self.subscribers += 1
+        try:
+            published = self.published
+            yield f"retry: {self.retry_ms}\n\n" + (self.frame or "")
+            while loop.time() < deadline:
+                try:
+                    await asyncio.wait_for(published.wait(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    return
+                published = self.published
+                yield self.frame
+        finally:
+            self.subscribers -= 1
@@ -0,0 +1,1698 @@
+"""
+Motor del juego Trivia LAN
+Reglas de salas, rondas, evaluación y puntuación sin depender de Socket.IO: los
+eventos se envían a un EventSink y el tiempo se lee de un reloj intercambiable,
+así el mismo código corre en el servidor y en simulaciones con reloj virtual
+"""
+
+import asyncio
+import csv
+import heapq
+import json
+import os
+import random
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from config import FILES_CONFIG, GAME_CONFIG
+from dashboard import LiveStats
+from image_meta import annotate_questions
+from match_history import MatchHistory
+from question_stats import QuestionStatsStore
+from room_directory import RoomDirectory
+
+# Configuración del juego
+TARGET_POINTS_DEFAULT = 15  # Puntos necesarios para ganar
+ROUND_SECONDS = 30  # Duración de cada ronda en segundos
+FIRST_CORRECT_POINTS = 3  # Puntos para el primero que acierta
+OTHER_CORRECT_POINTS = 1  # Puntos para otros que aciertan
+MAX_SUBMISSIONS_PER_SECOND = 5  # Límite antispam
+LARGE_ROOM_THRESHOLD = GAME_CONFIG["LARGE_ROOM_THRESHOLD"]  # Jugadores para modo sala grande (0 = nunca)
+LEADERBOARD_TOP_K = GAME_CONFIG["LEADERBOARD_TOP_K"]  # Tamaño del leaderboard en salas grandes
+MAX_PLAYERS_PER_ROOM = GAME_CONFIG["MAX_PLAYERS_PER_ROOM"]  # Límite de jugadores por sala (0 = sin límite)
+MAX_ANSWERS_PER_PLAYER = GAME_CONFIG["MAX_ANSWERS_PER_PLAYER"]  # Historial de respuestas por jugador y ronda
+ROOM_IDLE_TTL = GAME_CONFIG["ROOM_IDLE_TTL"]  # Segundos sin actividad antes de cerrar una sala
+ROOM_FINISHED_TTL = GAME_CONFIG["ROOM_FINISHED_TTL"]  # Segundos que se conserva una partida terminada
+ROOM_EMPTY_TTL = GAME_CONFIG["ROOM_EMPTY_TTL"]  # Segundos que se conserva una sala sin jugadores
+RECONNECT_GRACE = GAME_CONFIG["RECONNECT_GRACE"]  # Segundos en que un jugador desconectado conserva su lugar
+FUZZY_MATCH_THRESHOLD = GAME_CONFIG["FUZZY_MATCH_THRESHOLD"]  # Similitud mínima (0-100) para aceptar
+DIFFICULTY_BAND = GAME_CONFIG["DIFFICULTY_BAND"]  # (mín, máx) de tasa de acierto para elegir preguntas
+DIFFICULTY_MIN_PLAYERS = GAME_CONFIG["DIFFICULTY_MIN_PLAYERS"]  # Muestra mínima para confiar en la tasa
+
+# Estado global del juego
+game_state = {
+    "rooms": {},  # room_id -> room_data
+    "questions": [],  # Lista de preguntas cargadas del CSV
+    "spectators": {},  # sid -> room_id de cada espectador
+    "spectator_dirty_rooms": set(),  # salas con actividad pendiente de enviar a espectadores
+    "tournaments": {},  # tournament_id -> datos del torneo (ver tournament.py)
+    "mega_rooms": {},  # mega_id -> partida masiva repartida en fragmentos (ver mega_room.py)
+}
+
+
+class SystemClock:
+    """
+    Reloj real: hora del sistema y timers del event loop de asyncio
+    """
+    
+    def now(self) -> float:
+        return time.time()
+    
+    def call_later(self, delay: float, callback: Callable, *args):
+        return asyncio.get_running_loop().call_later(delay, callback, *args)
+
+
+class VirtualTimer:
+    """
+    Timer pendiente de un VirtualClock
+    """
+    
+    def __init__(self, when: float, callback: Callable, args: tuple):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+    
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock:
+    """
+    Reloj simulado: el tiempo solo avanza cuando se ejecuta el próximo timer, así
+    una ronda de 30 segundos se resuelve al instante
+    """
+    
+    def __init__(self, start: float = 0.0):
+        self.current = start
+        self.timers = []  # heap de (momento, orden, timer)
+        self.sequence = 0
+    
+    def now(self) -> float:
+        return self.current
+    
+    def call_later(self, delay: float, callback: Callable, *args) -> VirtualTimer:
+        timer = VirtualTimer(self.current + delay, callback, args)
+        self.sequence += 1
+        heapq.heappush(self.timers, (timer.when, self.sequence, timer))
+        return timer
+    
+    def run_next(self) -> bool:
+        """
+        Avanza hasta el próximo timer y lo ejecuta. Devuelve False si no quedan
+        """
+        while self.timers:
+            when, _, timer = heapq.heappop(self.timers)
+            if timer.cancelled:
+                continue
+            self.current = max(self.current, when)
+            timer.callback(*timer.args)
+            return True
+        return False
+    
+    def advance(self, seconds: float):
+        """
+        Avanza el reloj ejecutando en orden los timers que venzan en ese lapso
+        """
+        target = self.current + seconds
+        while self.timers and self.timers[0][0] <= target:
+            self.run_next()
+        self.current = target
+
+
+class EventSink:
+    """
+    Destino de los eventos del motor. Esta base los descarta; el servidor usa
+    RoomOutbox (Socket.IO) y la simulación un sink que solo los cuenta
+    """
+    
+    def emit(self, event: str, data: Dict, room):
+        pass
+    
+    def error(self, sid: str, message: str):
+        self.emit("error", {"message": message}, room=sid)
+    
+    def enter_room(self, sid: str, room: str):
+        pass
+    
+    def leave_room(self, sid: str, room: str):
+        pass
+    
+    def close_room(self, room: str):
+        pass
+
+
+def run_command_now(room_id: str, command, *args):
+    """
+    Ejecuta un comando en el momento, enviando sus eventos al sink por defecto
+    """
+    return command(room_id, default_sink, *args)
+
+
+# Dependencias intercambiables del motor (ver configure)
+clock = SystemClock()
+default_sink = EventSink()
+dispatch = run_command_now  # Cómo se ejecutan los comandos disparados por timers
+log = print
+persist_alias = None  # Callable(question_id, alias); None = los alias valen solo en la ronda de su sala
+
+
+CONFIGURABLE = {"clock", "dispatch", "default_sink", "log", "question_stats", "match_history", "persist_alias",
+                "room_directory", "live_stats"}
+
+
+def configure(**overrides):
+    """
+    Reemplaza dependencias del motor: clock, dispatch, default_sink, log,
+    question_stats, match_history, room_directory, live_stats (None desactiva las
+    estadísticas, el historial, el directorio de salas o los contadores del panel)
+    o persist_alias (cómo guardar en el banco las respuestas que acepta el host; None
+    las deja solo en la ronda de su sala)
+    """
+    unknown = set(overrides) - CONFIGURABLE
+    if unknown:
+        raise ValueError(f"Dependencias desconocidas: {', '.join(sorted(unknown))}")
+    globals().update(overrides)
+
+
+def current_time() -> float:
+    """
+    Hora actual según el reloj del motor
+    """
+    return clock.now()
+
+
+def question_bank_path() -> str:
+    """
+    CSV del banco de preguntas: items_images.csv si existe, si no items.csv
+    """
+    csv_path = os.path.join("data", "items_images.csv")
+    if os.path.exists(csv_path):
+        return csv_path
+    return os.path.join("data", "items.csv")
+
+
+def load_questions() -> List[Dict]:
+    """
+    Carga las preguntas desde el archivo CSV (con soporte para imágenes)
+    """
+    questions = []
+    csv_path = question_bank_path()
+    
+    if not os.path.exists(csv_path):
+        print(f"⚠️ Archivo {csv_path} no encontrado")
+        return questions
+    
+    try:
+        with open(csv_path, newline="", encoding="utf-8") as file:
+            reader = csv.DictReader(file)
+            rows = list(reader)
+            columns = reader.fieldnames or []
+        
+        for row in rows:
+            # Dividir respuestas por punto y coma
+            respuestas = [resp.strip() for resp in (row['respuestas'] or '').split(';')]
+            
+            question = {
+                'id': int(row['id']),
+                'tipo': row['tipo'] or '',
+                'respuestas': respuestas,
+                # Respuestas ya normalizadas para no repetir el trabajo en cada intento
+                'respuestas_normalizadas': [normalize_text(resp) for resp in respuestas]
+            }
+            
+            # Verificar si es formato con imágenes o texto
+            if 'imagen' in columns:
+                question['pregunta'] = row['pregunta'] or ''
+                question['imagen'] = row['imagen'] or ''
+                question['es_imagen'] = True
+            else:
+                question['texto'] = row['texto'] or ''
+                question['es_imagen'] = False
+            
+            questions.append(question)
+        
+        print(f"✅ Cargadas {len(questions)} preguntas desde {csv_path}")
+        
+    except Exception as e:
+        print(f"❌ Error al cargar preguntas: {e}")
+    
+    return questions
+
+
+# Las escrituras al CSV del banco se hacen de a una (pueden venir de varios hilos)
+bank_lock = threading.Lock()
+
+
+def csv_field_spans(record: str) -> List[Tuple[int, int]]:
+    """
+    Posición (inicio, fin) de cada campo en el texto crudo de una fila del CSV, con
+    sus comillas, para reemplazar uno sin tocar cómo están escritos los demás
+    """
+    spans = []
+    start = 0
+    quoted = False
+    for position, char in enumerate(record):
+        if char == '"':
+            quoted = not quoted
+        elif char == "," and not quoted:
+            spans.append((start, position))
+            start = position + 1
+    spans.append((start, len(record.rstrip("\r\n"))))
+    return spans
+
+
+def save_alias(question_id: int, alias: str, csv_path: Optional[str] = None) -> bool:
+    """
+    Agrega una respuesta aceptada por el host a la pregunta en el CSV del banco.
+    Solo reescribe el campo `respuestas` de esa pregunta (el resto del archivo,
+    comillas incluidas, queda igual) y reemplaza el archivo de forma atómica.
+    Devuelve False si no hubo cambios
+    """
+    csv_path = csv_path or question_bank_path()
+    with bank_lock:
+        with open(csv_path, newline="", encoding="utf-8") as file:
+            lines = file.read().splitlines(keepends=True)
+        
+        reader = csv.reader(lines)
+        header = next(reader)
+        id_column, answers_column = header.index("id"), header.index("respuestas")
+        start = reader.line_num
+        for row in reader:
+            end = reader.line_num
+            if row and row[id_column].strip() == str(question_id):
+                answers = row[answers_column].split(";")
+                if normalize_text(alias) in (normalize_text(answer) for answer in answers):
+                    return False
+                record = "".join(lines[start:end])
+                field_start, field_end = csv_field_spans(record)[answers_column]
+                value = ";".join(answers + [alias])
+                if record[field_start:field_end].startswith('"') or any(char in value for char in ',"\r\n'):
+                    value = '"' + value.replace('"', '""') + '"'
+                lines[start:end] = [record[:field_start] + value + record[field_end:]]
+                break
+            start = end
+        else:
+            return False
+        
+        temporary = csv_path + ".tmp"
+        with open(temporary, "w", newline="", encoding="utf-8") as file:
+            file.writelines(lines)
+        os.replace(temporary, csv_path)
+    return True
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza texto eliminando tildes y convirtiendo a minúsculas
+    """
+    # Texto ASCII: no hay tildes que quitar (caso más común, evita recorrer carácter por carácter)
+    if text.isascii():
+        return text.lower().strip()
+    
+    # Remover tildes
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(char for char in text if unicodedata.category(char) != 'Mn')
+    # Convertir a minúsculas y eliminar espacios extra
+    return text.lower().strip()
+
+
+# rapidfuzz se importa recién en la primera comparación difusa (o al cargar las preguntas):
+# al importarse también carga pandas si está instalado, y eso no debe pagarlo quien solo
+# importa el motor
+fuzz = None
+
+
+def load_fuzzy_matcher():
+    """
+    Importa rapidfuzz si todavía no se importó
+    """
+    global fuzz
+    if fuzz is None:
+        from rapidfuzz import fuzz as rapidfuzz_fuzz
+        fuzz = rapidfuzz_fuzz
+    return fuzz
+
+
+def check_normalized_answer(user_normalized: str, correct_normalized: List[str]) -> bool:
+    """
+    Compara una respuesta ya normalizada contra respuestas correctas ya normalizadas
+    """
+    for correct in correct_normalized:
+        # Coincidencia exacta
+        if user_normalized == correct:
+            return True
+        
+        # Coincidencia difusa con el umbral configurado
+        similarity = (fuzz or load_fuzzy_matcher()).ratio(user_normalized, correct)
+        if similarity >= FUZZY_MATCH_THRESHOLD:
+            return True
+    
+    return False
+
+
+def check_answer(user_answer: str, correct_answers: List[str]) -> bool:
+    """
+    Verifica si la respuesta del usuario es correcta usando coincidencia difusa
+    """
+    return check_normalized_answer(normalize_text(user_answer),
+                                   [normalize_text(correct) for correct in correct_answers])
+
+
+class VerdictCache:
+    """
+    Caché LRU con expiración de veredictos de corrección. En una sala llena muchos
+    jugadores escriben lo mismo, así que cada respuesta distinta se evalúa una vez
+    por pregunta y se comparte entre todas las salas
+    """
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # clave -> (veredicto, vence)
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable) -> Optional[bool]:
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+    
+    def put(self, key: Hashable, verdict: bool):
+        self.entries[key] = (verdict, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def discard_question(self, question_id: int):
+        """
+        Olvida los veredictos de una pregunta (cambiaron sus respuestas válidas)
+        """
+        for key in [key for key in self.entries if key[0] == question_id]:
+            del self.entries[key]
+    
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+verdict_cache = VerdictCache(GAME_CONFIG["VERDICT_CACHE_SIZE"], GAME_CONFIG["VERDICT_CACHE_TTL"])
+
+# Estadísticas por pregunta (se guardan en SQLite en segundo plano)
+question_stats = QuestionStatsStore(
+    FILES_CONFIG["STATS_DB"],
+    normalize=normalize_text,
+    flush_interval=GAME_CONFIG["STATS_FLUSH_INTERVAL"]
+)
+
+# Historial de rondas por sala para exportar (ver match_history.py)
+match_history = MatchHistory(max_rooms=GAME_CONFIG["HISTORY_MAX_ROOMS"],
+                             max_rounds_per_match=GAME_CONFIG["HISTORY_MAX_ROUNDS_PER_MATCH"])
+
+# Índice de salas abiertas para listarlas sin recorrer game_state (ver room_directory.py)
+room_directory = RoomDirectory(ttl=GAME_CONFIG["DIRECTORY_CACHE_TTL"])
+
+# Contadores de respuestas de todas las salas para el panel en vivo (ver dashboard.py)
+live_stats = LiveStats()
+
+
+def grade_answer(question: Dict, user_answer: str) -> bool:
+    """
+    Verifica una respuesta para una pregunta del banco usando la caché de veredictos
+    """
+    user_normalized = normalize_text(user_answer)
+    key = (question["id"], user_normalized)
+    
+    verdict = verdict_cache.get(key)
+    if verdict is None:
+        verdict = check_normalized_answer(user_normalized, question["respuestas_normalizadas"])
+        verdict_cache.put(key, verdict)
+    
+    return verdict
+
+
+def grade_room_answer(room: Dict, question: Dict, user_answer: str) -> bool:
+    """
+    grade_answer más las respuestas que el host de la sala aceptó en esta ronda
+    """
+    if grade_answer(question, user_answer):
+        return True
+    return bool(room["round_aliases"]) and check_normalized_answer(normalize_text(user_answer), room["round_aliases"])
+
+
+def reload_questions():
+    """
+    (Re)carga el banco de preguntas; los veredictos en caché dejan de ser válidos
+    """
+    load_fuzzy_matcher()
+    questions = load_questions()
+    computed = annotate_questions(questions)
+    if computed:
+        print(f"🖼️ Metadatos calculados para {computed} imágenes")
+    game_state["questions"] = questions
+    verdict_cache.clear()
+
+
+def create_room(room_id: str, host_sid: str) -> Dict:
+    """
+    Crea una nueva sala de juego
+    """
+    room_data = {
+        "id": room_id,
+        "host": host_sid,
+        "players": {},  # sid -> player_data
+        "session_tokens": {},  # sid -> token de sesión del cliente (no se envía a nadie)
+        "departed": {},  # nombre en minúsculas -> jugador desconectado que aún puede volver
+        "game_started": False,
+        "current_question": None,
+        "round_start_time": None,
+        "round_timer": None,  # Timer de fin de ronda (cancelable)
+        "round_number": 0,  # Se incrementa en cada ronda (descarta timers viejos)
+        "command_queue": None,  # Comandos pendientes del actor de la sala (lo crea el servidor)
+        "actor_task": None,  # Tarea que procesa command_queue
+        "target_points": TARGET_POINTS_DEFAULT,
+        "round_answers": {},  # sid -> lista de respuestas con timestamps
+        "round_correct_players": set(),  # jugadores que ya acertaron en esta ronda
+        "round_aliases": [],  # Respuestas normalizadas que el host aceptó solo para esta ronda
+        "player_submission_times": {},  # sid -> lista de timestamps para antispam
+        "used_questions": set(),  # IDs de preguntas ya usadas
+        "game_finished": False,
+        "winner": None,
+        "last_activity": clock.now(),  # Para cerrar salas inactivas
+        "finished_at": None,  # Momento en que terminó la partida
+        "round_payload": None,  # Datos de round_start de la ronda activa
+        "round_deadline": None,  # Momento (epoch) en que vence la ronda activa
+        "spectators": set(),  # sids que solo miran (no cuentan como jugadores)
+        "round_activity": {"answers": 0, "correct": 0},  # Contadores agregados para espectadores
+        "roster_version": 0,  # Se incrementa cada vez que entra o sale un jugador
+        "snapshot": None,  # Estado para los que llegan tarde (se parchea con cada cambio)
+        "snapshot_json": None,  # El mismo estado ya serializado
+        "tournament": None,  # ID del torneo si la sala es una partida de torneo
+        "on_round_end": None,  # Callback(room_id, sink) al terminar cada ronda (torneos)
+        "on_close": None,  # Callback(room, sink) cuando se cierra la sala (torneos)
+        "mega": None,  # ID de la partida masiva si la sala es uno de sus fragmentos
+        "on_all_correct": None  # Callback(room_id, sink) en lugar de end_round cuando acertaron todos
+    }
+    
+    game_state["rooms"][room_id] = room_data
+    index_room(room_data)
+    return room_data
+
+
+def index_room(room: Dict):
+    """
+    Actualiza la entrada de la sala en el directorio (jugadores, estado o host)
+    """
+    if room_directory is not None:
+        room_directory.update(room)
+
+
+def unindex_room(room_id: str):
+    """
+    Quita la sala del directorio al cerrarse
+    """
+    if room_directory is not None:
+        room_directory.remove(room_id)
+
+
+def get_room(room_id: str) -> Optional[Dict]:
+    """
+    Obtiene los datos de una sala
+    """
+    return game_state["rooms"].get(room_id)
+
+
+def spectator_room(room_id: str) -> str:
+    """
+    Nombre de la sala de Socket.IO donde se agrupan los espectadores
+    """
+    return f"{room_id}:spectators"
+
+
+def room_audience(room_id: str) -> List[str]:
+    """
+    Salas de Socket.IO que reciben los eventos principales (jugadores + espectadores)
+    """
+    return [room_id, spectator_room(room_id)]
+
+
+def touch_room(room: Dict):
+    """
+    Registra actividad en la sala para que el limpiador no la cierre
+    """
+    room["last_activity"] = clock.now()
+
+
+def is_room_full(room: Dict) -> bool:
+    """
+    Indica si la sala alcanzó MAX_PLAYERS_PER_ROOM
+    """
+    return MAX_PLAYERS_PER_ROOM > 0 and len(room["players"]) >= MAX_PLAYERS_PER_ROOM
+
+
+def add_player_to_room(room_id: str, sid: str, player_name: str, score: int = 0) -> bool:
+    """
+    Agrega un jugador a una sala (con sus puntos anteriores si se está reconectando)
+    """
+    room = get_room(room_id)
+    if not room:
+        return False
+    
+    # Verificar que el nombre no esté en uso
+    for player_data in room["players"].values():
+        if player_data["name"].lower() == player_name.lower():
+            return False
+    
+    room["players"][sid] = {
+        "name": player_name,
+        "score": score,
+        "connected": True
+    }
+    room["roster_version"] += 1
+    patch_snapshot_join(room, room["players"][sid])
+    
+    # Una sala que quedó sin jugadores (pero con espectadores) no tiene host
+    if room["host"] is None:
+        room["host"] = sid
+    index_room(room)
+    
+    return True
+
+
+def remove_player_from_room(room_id: str, sid: str):
+    """
+    Elimina un jugador de una sala
+    """
+    room = get_room(room_id)
+    if not room:
+        return
+    
+    if sid in room["players"]:
+        player = room["players"].pop(sid)
+        room["roster_version"] += 1
+        patch_snapshot_leave(room, player)
+    
+    # Si era el host, asignar nuevo host o eliminar sala
+    if room["host"] == sid:
+        if room["players"]:
+            # Asignar nuevo host al primer jugador
+            room["host"] = list(room["players"].keys())[0]
+        elif room["spectators"] or prune_departed(room):
+            # Quedan espectadores o jugadores que pueden volver: la sala sigue abierta
+            # hasta que el limpiador la cierre
+            room["host"] = None
+        else:
+            # Eliminar sala vacía
+            del game_state["rooms"][room_id]
+            unindex_room(room_id)
+            if match_history is not None:
+                match_history.archive(room_id, "empty", clock.now())
+            return
+    
+    index_room(room)
+
+
+def prune_departed(room: Dict) -> Dict:
+    """
+    Olvida a los jugadores desconectados cuyo plazo para volver ya venció y devuelve
+    los que quedan (se guardan en orden de salida)
+    """
+    now = clock.now()
+    departed = room["departed"]
+    for name in list(departed):
+        if now - departed[name]["left_at"] < RECONNECT_GRACE:
+            break
+        del departed[name]
+    return departed
+
+
+def in_difficulty_band(question: Dict, band) -> bool:
+    """
+    Indica si la tasa de acierto histórica de una pregunta cae dentro de la banda.
+    Las preguntas sin datos suficientes siempre entran
+    """
+    if question_stats is None:
+        return True
+    rate = question_stats.correct_rate(question["id"], DIFFICULTY_MIN_PLAYERS)
+    return rate is None or band[0] <= rate <= band[1]
+
+
+def get_random_question(used_questions: Set[int], band=DIFFICULTY_BAND) -> Optional[Dict]:
+    """
+    Obtiene una pregunta aleatoria que no haya sido usada, dentro de la banda de
+    dificultad si está configurada
+    """
+    if not game_state["questions"]:
+        return None
+    
+    # Filtrar preguntas no usadas
+    available_questions = [q for q in game_state["questions"] if q["id"] not in used_questions]
+    
+    # Si no hay preguntas disponibles, reiniciar la lista
+    if not available_questions:
+        available_questions = game_state["questions"]
+        used_questions.clear()
+    
+    # Filtrar por dificultad; si ninguna pregunta entra en la banda se ignora el filtro
+    if band:
+        in_band = [q for q in available_questions if in_difficulty_band(q, band)]
+        if in_band:
+            available_questions = in_band
+    
+    return random.choice(available_questions)
+
+
+def cancel_round_timer(room: Dict):
+    """
+    Cancela el timer de fin de ronda si sigue pendiente
+    """
+    if room["round_timer"] is not None:
+        room["round_timer"].cancel()
+    room["round_timer"] = None
+
+
+def start_round(room_id: str, sink: EventSink, question: Optional[Dict] = None,
+                deadline: Optional[float] = None):
+    """
+    Inicia una nueva ronda en una sala. Los fragmentos de una partida masiva reciben
+    la pregunta y el vencimiento compartidos: su fin de ronda lo decide el coordinador
+    """
+    room = get_room(room_id)
+    if not room or room["game_finished"]:
+        return
+    
+    # Cancelar cualquier timer anterior
+    cancel_round_timer(room)
+    
+    # Seleccionar pregunta aleatoria que no haya sido usada
+    question = question or get_random_question(room["used_questions"])
+    if not question:
+        sink.emit("error", {"message": "No hay preguntas disponibles"}, room=room_id)
+        return
+    
+    # Marcar pregunta como usada
+    room["used_questions"].add(question["id"])
+    touch_room(room)
+    
+    # Configurar ronda
+    room["round_number"] += 1
+    room["current_question"] = question
+    room["round_start_time"] = clock.now()
+    room["round_deadline"] = deadline or room["round_start_time"] + ROUND_SECONDS
+    room["round_activity"] = {"answers": 0, "correct": 0}
+    room["round_answers"] = {}
+    room["round_correct_players"] = set()
+    room["round_aliases"] = []
+    room["player_submission_times"] = {}
+    
+    # Enviar pregunta a todos los jugadores
+    question_data = {
+        "id": question["id"],
+        "tipo": question["tipo"],
+        "duration": max(0, round(room["round_deadline"] - room["round_start_time"])),
+        "deadline": room["round_deadline"],
+        "es_imagen": question.get("es_imagen", False)
+    }
+    
+    # Agregar texto o imagen según el tipo de pregunta
+    if question.get("es_imagen", False):
+        question_data["pregunta"] = question["pregunta"]
+        # Convertir ruta relativa a URL absoluta si es necesario
+        imagen = question["imagen"]
+        if not imagen.startswith("http"):
+            question_data["imagen"] = f"/images/{imagen.replace('images/', '')}"
+        else:
+            question_data["imagen"] = imagen
+        # Dimensiones y miniatura borrosa para reservar el espacio mientras carga
+        if "imagen_meta" in question:
+            question_data["imagen_meta"] = question["imagen_meta"]
+    else:
+        question_data["texto"] = question["texto"]
+    
+    room["round_payload"] = question_data
+    refresh_snapshot_state(room)
+    sink.emit("round_start", question_data, room=room_audience(room_id))
+    
+    # Programar fin de ronda con un timer que podamos cancelar
+    if deadline is None:
+        room["round_timer"] = clock.call_later(ROUND_SECONDS, fire_round_timeout, room_id, room["round_number"])
+
+
+def fire_round_timeout(room_id: str, round_number: int):
+    """
+    Callback del timer de ronda: pasa el fin de ronda por el despachador de comandos
+    """
+    dispatch(room_id, round_timeout_command, round_number)
+
+
+def round_timeout_command(room_id: str, sink: EventSink, round_number: int):
+    """
+    Termina la ronda por tiempo, salvo que ya haya terminado (o sea otra ronda)
+    """
+    room = get_room(room_id)
+    if room and room["current_question"] and room["round_number"] == round_number:
+        end_round(room_id, sink)
+
+
+def collect_correct_answers(room: Dict, question: Dict,
+                            graded_answers: Optional[List] = None) -> Tuple[List[Dict], List[str]]:
+    """
+    Primer acierto de cada jugador (ordenados por momento de acierto) y los intentos
+    fallidos de la ronda. Si se pasa graded_answers, agrega cada intento con su veredicto
+    """
+    correct_answers = []
+    wrong_answers = []  # Para las estadísticas de la pregunta
+    
+    # Procesar todas las respuestas de todos los jugadores
+    for sid, answer_list in room["round_answers"].items():
+        if sid in room["players"]:
+            player_name = room["players"][sid]["name"]
+            
+            # Buscar la primera respuesta correcta de este jugador
+            first_correct = None
+            for answer_data in answer_list:
+                user_answer = answer_data["answer"]
+                is_correct = grade_room_answer(room, question, user_answer)
+                if graded_answers is not None:
+                    graded_answers.append((player_name, user_answer, is_correct,
+                                           round(answer_data["timestamp"] - room["round_start_time"], 2)))
+                
+                if is_correct:
+                    first_correct = {
+                        "sid": sid,
+                        "name": player_name,
+                        "answer": user_answer,
+                        "timestamp": answer_data["timestamp"]
+                    }
+                    break
+                wrong_answers.append(user_answer)
+            
+            if first_correct:
+                correct_answers.append(first_correct)
+    
+    # Ordenar por timestamp (primero en responder correctamente)
+    correct_answers.sort(key=lambda x: x["timestamp"])
+    return correct_answers, wrong_answers
+
+
+def clear_round_state(room: Dict):
+    """
+    Deja la sala sin ronda en curso
+    """
+    room["current_question"] = None
+    room["round_start_time"] = None
+    room["round_deadline"] = None
+    room["round_payload"] = None
+    room["round_answers"] = {}
+    room["round_correct_players"] = set()
+    room["round_aliases"] = []
+    room["player_submission_times"] = {}
+    invalidate_snapshot(room)
+
+
+def round_question_summary(question: Dict) -> Dict:
+    """
+    Pregunta de round_end: respuestas aceptadas y el texto (o la consigna de la imagen)
+    """
+    summary = {"respuestas_correctas": question["respuestas"]}
+    if question.get("es_imagen", False):
+        summary["pregunta"] = question["pregunta"]
+    else:
+        summary["texto"] = question["texto"]
+    return summary
+
+
+def end_round(room_id: str, sink: EventSink):
+    """
+    Finaliza la ronda actual y calcula puntuaciones
+    """
+    room = get_room(room_id)
+    if not room or not room["current_question"]:
+        return
+    
+    # Cancelar el timer si está activo
+    cancel_round_timer(room)
+    
+    question = room["current_question"]
+    graded_answers = [] if match_history is not None else None  # Para el historial
+    correct_answers, wrong_answers = collect_correct_answers(room, question, graded_answers)
+    
+    if question_stats is not None:
+        question_stats.record_round(
+            question["id"],
+            players=len(room["players"]),
+            attempts=room["round_activity"]["answers"],
+            correct_players=len(correct_answers),
+            first_correct_seconds=(correct_answers[0]["timestamp"] - room["round_start_time"]
+                                   if correct_answers and room["round_start_time"] else None),
+            wrong_answers=wrong_answers
+        )
+    
+    # Asignar puntos: 3 al primero, 1 a los demás
+    round_results = []
+    for i, answer in enumerate(correct_answers):
+        sid = answer["sid"]
+        is_first = (i == 0)
+        points = FIRST_CORRECT_POINTS if is_first else OTHER_CORRECT_POINTS
+        
+        room["players"][sid]["score"] += points
+        
+        round_results.append({
+            "rank": i + 1,
+            "name": answer["name"],
+            "answer": answer["answer"],
+            "points": points,
+            "is_first": is_first
+        })
+    
+    # Verificar si alguien ganó
+    winner = None
+    for sid, player_data in room["players"].items():
+        if player_data["score"] >= room["target_points"]:
+            winner = player_data["name"]
+            room["game_finished"] = True
+            room["winner"] = winner
+            room["finished_at"] = clock.now()
+            break
+    
+    if match_history is not None:
+        match_history.record_round(
+            room_id,
+            (room["round_number"], question["id"], room["round_start_time"], clock.now(),
+             tuple(graded_answers), tuple((result["name"], result["points"]) for result in round_results)),
+            {player["name"]: player["score"] for player in room["players"].values()}
+        )
+        if winner:
+            match_history.finish_match(room_id, winner, room["finished_at"])
+    
+    # Preparar datos del resultado
+    round_end_data = {
+        "question": round_question_summary(question),
+        "results": round_results,
+        "game_finished": room["game_finished"],
+        "winner": winner
+    }
+    
+    # En salas grandes no se envían todas las puntuaciones a todos: solo el top-K
+    # compartido, y cada jugador recibe luego su posición en un mensaje propio
+    ranking = None
+    if is_large_room(room):
+        ranking = rank_players(room)
+        round_end_data["results"] = round_results[:LEADERBOARD_TOP_K]
+        round_end_data["leaderboard"] = [
+            {"rank": entry["rank"], "name": entry["name"], "score": entry["score"]}
+            for entry in ranking[:LEADERBOARD_TOP_K]
+        ]
+        round_end_data["total_players"] = len(ranking)
+    else:
+        round_end_data["scores"] = {player["name"]: player["score"] for player in room["players"].values()}
+    
+    # Enviar resultados
+    sink.emit("round_end", round_end_data, room=room_audience(room_id))
+    
+    if ranking is not None:
+        points_by_sid = {answer["sid"]: result["points"] for answer, result in zip(correct_answers, round_results)}
+        for entry in ranking:
+            sink.emit("round_rank", {
+                "rank": entry["rank"],
+                "score": entry["score"],
+                "points": points_by_sid.get(entry["sid"], 0),
+                "total_players": len(ranking)
+            }, room=entry["sid"])
+    
+    # Limpiar estado de ronda
+    clear_round_state(room)
+    index_room(room)
+    
+    if room["on_round_end"] is not None:
+        room["on_round_end"](room_id, sink)
+
+
+def invalidate_snapshot(room: Dict):
+    """
+    Marca el estado de la sala como desactualizado (se rearma al próximo pedido).
+    Se usa cuando cambian muchas puntuaciones a la vez (fin de ronda, nueva partida)
+    """
+    room["snapshot"] = None
+    room["snapshot_json"] = None
+
+
+def room_snapshot(room: Dict) -> Dict:
+    """
+    Estado completo de la sala (leaderboard, jugadores) para quien entra tarde o se
+    reconecta. Se arma una vez por partida o ronda y después se parchea con cada
+    jugador que entra o sale, así las uniones no vuelven a ordenar a toda la sala.
+    La ronda en curso va aparte (current_round_payload) porque el tiempo restante
+    cambia a cada segundo
+    """
+    if room["snapshot"] is None:
+        ranking = rank_players(room)
+        room["snapshot"] = {
+            "roster_version": room["roster_version"],
+            "game_started": room["game_started"],
+            "game_finished": room["game_finished"],
+            "winner": room["winner"],
+            "target_points": room["target_points"],
+            "round_number": room["round_number"],
+            "total_players": len(ranking),
+            "leaderboard": [
+                {"rank": entry["rank"], "name": entry["name"], "score": entry["score"]}
+                for entry in ranking[:LEADERBOARD_TOP_K]
+            ],
+            # En salas grandes la lista completa no se envía (igual que en round_end)
+            "players": None if is_large_room(room) else [dict(player) for player in room["players"].values()]
+        }
+    return room["snapshot"]
+
+
+def room_snapshot_json(room: Dict) -> str:
+    """
+    room_snapshot ya serializado: se codifica una vez por cambio y el mismo texto se
+    envía a todos los que entran hasta el próximo cambio
+    """
+    if room["snapshot_json"] is None:
+        room["snapshot_json"] = json.dumps(room_snapshot(room), ensure_ascii=False)
+    return room["snapshot_json"]
+
+
+def snapshot_changed(room: Dict, snapshot: Dict):
+    """
+    Deja al estado parcheado con la versión actual de jugadores y descarta su serialización
+    """
+    snapshot["roster_version"] = room["roster_version"]
+    room["snapshot_json"] = None
+
+
+def patch_snapshot_join(room: Dict, player: Dict):
+    """
+    Suma un jugador al estado ya armado. Un jugador nuevo tiene 0 puntos y queda
+    último en el ranking, así que las posiciones de los demás no cambian
+    """
+    snapshot = room["snapshot"]
+    if snapshot is None:
+        return
+    if player["score"] or is_large_room(room) != (snapshot["players"] is None):
+        # Vuelve con puntos o la sala cruzó el umbral de sala grande: se rearma
+        invalidate_snapshot(room)
+        return
+    
+    leaderboard = snapshot["leaderboard"]
+    if len(leaderboard) < LEADERBOARD_TOP_K:
+        # Con menos de K entradas el leaderboard ya tiene a todos los jugadores
+        last = leaderboard[-1] if leaderboard else None
+        rank = last["rank"] if last and last["score"] == 0 else snapshot["total_players"] + 1
+        leaderboard.append({"rank": rank, "name": player["name"], "score": 0})
+    snapshot["total_players"] += 1
+    if snapshot["players"] is not None:
+        snapshot["players"].append(dict(player))
+    snapshot_changed(room, snapshot)
+
+
+def patch_snapshot_leave(room: Dict, player: Dict):
+    """
+    Quita un jugador del estado ya armado. Si estaba en un leaderboard recortado
+    hace falta el siguiente del ranking y se rearma
+    """
+    snapshot = room["snapshot"]
+    if snapshot is None:
+        return
+    leaderboard = snapshot["leaderboard"]
+    shown = any(entry["name"] == player["name"] for entry in leaderboard)
+    if (shown and len(leaderboard) < snapshot["total_players"]) or \
+            is_large_room(room) != (snapshot["players"] is None):
+        invalidate_snapshot(room)
+        return
+    
+    if shown:
+        # El leaderboard tiene a todos: se quita la entrada y se recalculan las posiciones
+        remaining = [entry for entry in leaderboard if entry["name"] != player["name"]]
+        previous_score = None
+        rank = 0
+        for position, entry in enumerate(remaining, start=1):
+            if entry["score"] != previous_score:
+                rank = position
+                previous_score = entry["score"]
+            entry["rank"] = rank
+        snapshot["leaderboard"] = remaining
+    snapshot["total_players"] -= 1
+    if snapshot["players"] is not None:
+        snapshot["players"] = [entry for entry in snapshot["players"] if entry["name"] != player["name"]]
+    snapshot_changed(room, snapshot)
+
+
+def refresh_snapshot_state(room: Dict):
+    """
+    Actualiza en el estado ya armado los datos de la partida que cambian al empezar
+    una ronda (las puntuaciones y los jugadores siguen iguales)
+    """
+    snapshot = room["snapshot"]
+    if snapshot is None:
+        return
+    snapshot.update(
+        game_started=room["game_started"],
+        game_finished=room["game_finished"],
+        winner=room["winner"],
+        target_points=room["target_points"],
+        round_number=room["round_number"]
+    )
+    room["snapshot_json"] = None
+
+
+def current_round_payload(room: Dict) -> Optional[Dict]:
+    """
+    Datos de round_start de la ronda en curso con el tiempo restante calculado en el servidor
+    """
+    if not room["round_payload"]:
+        return None
+    remaining = max(0, int(room["round_deadline"] - clock.now()))
+    return {**room["round_payload"], "duration": remaining}
+
+
+def is_large_room(room: Dict) -> bool:
+    """
+    Indica si la sala debe usar resultados compactos (top-K + posición personal)
+    """
+    return LARGE_ROOM_THRESHOLD > 0 and len(room["players"]) > LARGE_ROOM_THRESHOLD
+
+
+def rank_players(room: Dict) -> List[Dict]:
+    """
+    Ordena a los jugadores por puntuación asignando posiciones con empates
+    (dos jugadores con los mismos puntos comparten posición)
+    """
+    ordered = sorted(room["players"].items(), key=lambda item: item[1]["score"], reverse=True)
+    
+    ranking = []
+    previous_score = None
+    rank = 0
+    for position, (sid, player_data) in enumerate(ordered, start=1):
+        if player_data["score"] != previous_score:
+            rank = position
+            previous_score = player_data["score"]
+        ranking.append({
+            "sid": sid,
+            "rank": rank,
+            "name": player_data["name"],
+            "score": player_data["score"]
+        })
+    
+    return ranking
+
+
+def is_rate_limited(room: Dict, sid: str) -> bool:
+    """
+    Verifica si un jugador está enviando demasiadas respuestas (antispam)
+    """
+    current_time = clock.now()
+    
+    if sid not in room["player_submission_times"]:
+        room["player_submission_times"][sid] = []
+    
+    # Filtrar timestamps de la última segundo
+    recent_submissions = [
+        t for t in room["player_submission_times"][sid]
+        if current_time - t < 1.0
+    ]
+    
+    room["player_submission_times"][sid] = recent_submissions
+    
+    return len(recent_submissions) >= MAX_SUBMISSIONS_PER_SECOND
+
+
+def check_round_completion(room_id: str, sink: EventSink):
+    """
+    Verifica si todos los jugadores han acertado para terminar la ronda anticipadamente
+    """
+    room = get_room(room_id)
+    if not room or not room["current_question"]:
+        return
+    
+    # Los aciertos de quien se desconectó quedan guardados por si vuelve, pero no
+    # cuentan para cerrar la ronda
+    total_players = len(room["players"])
+    correct_players = sum(1 for sid in room["round_correct_players"] if sid in room["players"])
+    
+    # Si todos los jugadores han acertado, terminar la ronda (en una partida masiva
+    # decide el coordinador, que mira todos los fragmentos)
+    if correct_players >= total_players:
+        if room["on_all_correct"] is not None:
+            room["on_all_correct"](room_id, sink)
+        else:
+            end_round(room_id, sink)
+
+
+def regrade_round(room: Dict, alias_normalized: str) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """
+    Re-evalúa de una vez todos los intentos de la ronda contra una respuesta recién
+    aceptada. Devuelve los jugadores que ahora aciertan (sid, intento) y los que ya
+    habían acertado pero con un intento estrictamente anterior que ahora también vale
+    (su acierto se adelanta). Se llama antes de agregar la respuesta, así el acierto
+    actual de cada jugador sale de las respuestas que ya valían. Los intentos
+    repetidos se comparan una sola vez
+    """
+    from rapidfuzz.process import cdist
+    
+    owners: List[Tuple[str, int]] = []  # (sid, posición del intento) de cada intento
+    guess_index: Dict[str, int] = {}  # intento normalizado -> columna en la comparación
+    columns: List[int] = []
+    question = room["current_question"]
+    for sid, answer_list in room["round_answers"].items():
+        if sid not in room["players"]:
+            continue
+        # Quien ya acertó solo puede adelantarse con intentos anteriores a su acierto
+        # actual (que puede venir de otra respuesta aceptada antes en la ronda)
+        candidates = answer_list
+        if sid in room["round_correct_players"]:
+            current = next((answer_data for answer_data in answer_list
+                            if grade_room_answer(room, question, answer_data["answer"])), None)
+            candidates = [answer_data for answer_data in answer_list
+                          if current is not None and answer_data["timestamp"] < current["timestamp"]]
+        for position, answer_data in enumerate(candidates):
+            guess = normalize_text(answer_data["answer"])
+            columns.append(guess_index.setdefault(guess, len(guess_index)))
+            owners.append((sid, position))
+    
+    if not owners:
+        return [], []
+    
+    scores = cdist([alias_normalized], list(guess_index), scorer=(fuzz or load_fuzzy_matcher()).ratio,
+                   score_cutoff=FUZZY_MATCH_THRESHOLD)[0]
+    
+    first_match: Dict[str, int] = {}
+    for (sid, position), column in zip(owners, columns):
+        if scores[column] and sid not in first_match:
+            first_match[sid] = position
+    
+    newly_correct, retimed = [], []
+    for sid, position in first_match.items():
+        if sid in room["round_correct_players"]:
+            retimed.append(sid)
+        else:
+            newly_correct.append((sid, room["round_answers"][sid][position]["answer"]))
+    return newly_correct, retimed
+
+
+def get_reap_reason(room: Dict, now: float) -> Optional[str]:
+    """
+    Determina si una sala debe cerrarse y por qué
+    """
+    idle = now - room["last_activity"]
+    
+    if not room["players"] and idle >= ROOM_EMPTY_TTL:
+        return "empty"
+    
+    if room["game_finished"] and room["finished_at"] is not None and now - room["finished_at"] >= ROOM_FINISHED_TTL:
+        return "finished"
+    
+    if not room["current_question"] and idle >= ROOM_IDLE_TTL:
+        return "idle"
+    
+    return None
+
+
+def close_room(room_id: str, sink: EventSink, reason: str):
+    """
+    Cierra una sala: cancela su timer, avisa a los clientes y libera su estado
+    """
+    room = game_state["rooms"].pop(room_id, None)
+    if not room:
+        return
+    
+    cancel_round_timer(room)
+    
+    for sid in room["spectators"]:
+        game_state["spectators"].pop(sid, None)
+    game_state["spectator_dirty_rooms"].discard(room_id)
+    unindex_room(room_id)
+    
+    if match_history is not None:
+        match_history.archive(room_id, reason, clock.now())
+    
+    sink.emit("room_closed", {"room_id": room_id, "reason": reason}, room=room_audience(room_id))
+    sink.close_room(room_id)
+    sink.close_room(spectator_room(room_id))
+    
+    log(f"🧹 Sala {room_id} cerrada ({reason})")
+    
+    if room["on_close"] is not None:
+        room["on_close"](room, sink)
+
+
+def mark_spectator_activity(room_id: str, room: Dict, answers: int = 0, correct: int = 0):
+    """
+    Acumula actividad de la ronda; solo se agenda un envío si hay espectadores mirando
+    """
+    activity = room["round_activity"]
+    activity["answers"] += answers
+    activity["correct"] += correct
+    
+    if room["spectators"]:
+        game_state["spectator_dirty_rooms"].add(room_id)
+
+
+def build_spectator_update(room: Dict) -> Dict:
+    """
+    Resumen agregado del estado de una sala para espectadores
+    """
+    return {
+        "players": len(room["players"]),
+        "spectators": len(room["spectators"]),
+        "answers": room["round_activity"]["answers"],
+        "correct": room["round_activity"]["correct"],
+        "deadline": room["round_deadline"]
+    }
+
+
+def leave_room_command(room_id: str, sink: EventSink, sid: str):
+    """
+    Quita a un jugador (o espectador) de la sala al desconectarse
+    """
+    room = get_room(room_id)
+    if not room:
+        return
+    
+    # Los espectadores no están en room["players"]: basta con quitarlos de su sala
+    if sid in room["spectators"]:
+        room["spectators"].discard(sid)
+        if game_state["spectators"].get(sid) == room_id:
+            del game_state["spectators"][sid]
+    
+    if sid not in room["players"]:
+        return
+    
+    player = room["players"][sid]
+    player_name = player["name"]
+    
+    # Con un token de sesión puede volver dentro de RECONNECT_GRACE con sus puntos
+    # (los torneos y las partidas masivas tienen su propia forma de reconexión)
+    token = room["session_tokens"].pop(sid, None)
+    if token is not None and not room["tournament"] and not room["mega"]:
+        prune_departed(room)
+        room["departed"][player_name.lower()] = {
+            "sid": sid,
+            "score": player["score"],
+            "token": token,
+            "left_at": clock.now()
+        }
+    
+    remove_player_from_room(room_id, sid)
+    
+    # Si la sala sigue abierta, notificar a los demás y revisar si ya acertaron todos
+    if get_room(room_id):
+        sink.emit("player_left", {"name": player_name}, room=room_id)
+        sink.emit("players_update", {"players": list(room["players"].values())}, room=room_id)
+        if room["players"]:
+            check_round_completion(room_id, sink)
+
+
+def join_room_command(room_id: str, sink: EventSink, sid: str, player_name: str, token: Optional[str] = None):
+    """
+    Agrega un jugador a la sala y avisa al resto. Si vuelve con el mismo nombre y
+    token de sesión antes de RECONNECT_GRACE (o antes de que se note que su conexión
+    anterior se cayó) recupera sus puntos y sus respuestas de la ronda en curso
+    """
+    room = get_room(room_id)
+    if not room:
+        sink.error(sid, "Sala no encontrada")
+        return
+    
+    if room["tournament"]:
+        sink.error(sid, "Las salas de torneo son solo para los inscriptos (puedes mirarla)")
+        return
+    
+    if room["mega"]:
+        sink.error(sid, "Esta sala es parte de una partida masiva: únete a la partida")
+        return
+    
+    # Si vuelve con su token antes de que se note la caída de su conexión anterior,
+    # el jugador pasa al nuevo sid y la conexión vieja deja de recibir eventos
+    live_sid = next((player_sid for player_sid, player in room["players"].items()
+                     if player["name"].lower() == player_name.lower()), None)
+    moved = live_sid not in (None, sid) and token is not None and room["session_tokens"].get(live_sid) == token
+    if moved:
+        move_player(room, live_sid, sid)
+        sink.leave_room(live_sid, room_id)
+    else:
+        if is_room_full(room):
+            sink.error(sid, "La sala está llena")
+            return
+        
+        # El nombre de un jugador desconectado queda reservado mientras puede volver
+        departed = prune_departed(room).get(player_name.lower())
+        if departed is not None and departed["token"] != token:
+            sink.error(sid, "Nombre de jugador ya en uso")
+            return
+        
+        # Intentar agregar jugador
+        if not add_player_to_room(room_id, sid, player_name, departed["score"] if departed else 0):
+            sink.error(sid, "Nombre de jugador ya en uso")
+            return
+        if token is not None:
+            room["session_tokens"][sid] = token
+        if departed is not None:
+            restore_departed(room, sid, player_name)
+    
+    # Si estaba mirando esta sala, deja de ser espectador
+    if sid in room["spectators"]:
+        room["spectators"].discard(sid)
+        game_state["spectators"].pop(sid, None)
+        sink.leave_room(sid, spectator_room(room_id))
+    
+    # Unir jugador a la sala de Socket.IO
+    sink.enter_room(sid, room_id)
+    touch_room(room)
+    
+    # Confirmar unión junto con el estado actual de la sala (puntuaciones ya
+    # serializadas y la ronda en curso), así quien entra a mitad de ronda puede jugarla
+    sink.emit("room_joined", {
+        "room_id": room_id,
+        "player_name": player_name,
+        "is_host": room["host"] == sid,
+        "game_started": room["game_started"],
+        "state": room_snapshot_json(room),
+        "round": current_round_payload(room)
+    }, room=sid)
+    
+    # Notificar a otros jugadores (quien solo cambió de conexión no se anuncia de nuevo)
+    if not moved:
+        sink.emit("player_joined", {"name": player_name}, room=room_id)
+    sink.emit("players_update", {"players": list(room["players"].values())}, room=room_id)
+    
+    log(f"👤 {player_name} se unió a la sala {room_id}")
+
+
+def move_round_state(room: Dict, old_sid: str, sid: str):
+    """
+    Pasa al nuevo sid lo que el jugador ya hizo en la ronda en curso
+    """
+    for key in ("round_answers", "player_submission_times"):
+        if old_sid in room[key]:
+            room[key][sid] = room[key].pop(old_sid)
+    if old_sid in room["round_correct_players"]:
+        room["round_correct_players"].discard(old_sid)
+        room["round_correct_players"].add(sid)
+
+
+def restore_departed(room: Dict, sid: str, player_name: str):
+    """
+    Devuelve a un jugador desconectado lo que ya hizo en la ronda en curso
+    """
+    old_sid = room["departed"].pop(player_name.lower())["sid"]
+    move_round_state(room, old_sid, sid)
+    log(f"🔄 {player_name} recuperó su lugar en la sala {room['id']}")
+
+
+def move_player(room: Dict, old_sid: str, sid: str):
+    """
+    Pasa a un nuevo sid un jugador que sigue en la sala (con sus puntos, su token y
+    lo que hizo en la ronda), sin cambiar su lugar en la lista de jugadores
+    """
+    players = list(room["players"].items())
+    room["players"].clear()
+    room["players"].update((sid if player_sid == old_sid else player_sid, player)
+                           for player_sid, player in players)
+    room["session_tokens"][sid] = room["session_tokens"].pop(old_sid)
+    move_round_state(room, old_sid, sid)
+    if room["host"] == old_sid:
+        room["host"] = sid
+    index_room(room)
+    log(f"🔄 {room['players'][sid]['name']} recuperó su lugar en la sala {room['id']}")
+
+
+def watch_room_command(room_id: str, sink: EventSink, sid: str):
+    """
+    Registra a un espectador y le envía el estado actual de la sala
+    """
+    room = get_room(room_id)
+    if not room:
+        sink.error(sid, "Sala no encontrada")
+        return
+    
+    if sid in room["players"]:
+        sink.error(sid, "Ya estás jugando en esta sala")
+        return
+    
+    sink.enter_room(sid, spectator_room(room_id))
+    room["spectators"].add(sid)
+    game_state["spectators"][sid] = room_id
+    
+    # El mismo estado que reciben los jugadores que llegan tarde; la ronda en curso
+    # se envía con el tiempo restante calculado en el servidor
+    sink.emit("spectator_joined", {
+        "room_id": room_id,
+        "game_started": room["game_started"],
+        "state": room_snapshot_json(room),
+        "round": current_round_payload(room),
+        **build_spectator_update(room)
+    }, room=sid)
+    
+    log(f"👀 Espectador se unió a la sala {room_id} ({len(room['spectators'])} mirando)")
+
+
+def unwatch_room_command(room_id: str, sink: EventSink, sid: str):
+    """
+    Quita a un espectador de la sala que estaba mirando
+    """
+    room = get_room(room_id)
+    if room:
+        room["spectators"].discard(sid)
+    if game_state["spectators"].get(sid) == room_id:
+        del game_state["spectators"][sid]
+    sink.leave_room(sid, spectator_room(room_id))
+
+
+def start_game_command(room_id: str, sink: EventSink, sid: str):
+    """
+    Reinicia puntuaciones e inicia la primera ronda
+    """
+    room = get_room(room_id)
+    if not room:
+        sink.error(sid, "Sala no encontrada")
+        return
+    
+    if room["host"] != sid:
+        sink.error(sid, "Solo el host puede iniciar el juego")
+        return
+    
+    if len(room["players"]) < 1:
+        sink.error(sid, "Se necesita al menos 1 jugador")
+        return
+    
+    if room["game_started"]:
+        sink.error(sid, "El juego ya está iniciado")
+        return
+    
+    # Iniciar juego
+    room["game_started"] = True
+    room["game_finished"] = False
+    room["winner"] = None
+    room["finished_at"] = None
+    
+    # Reiniciar puntuaciones y lista de preguntas usadas
+    for player in room["players"].values():
+        player["score"] = 0
+    room["used_questions"] = set()  # Resetear preguntas usadas
+    invalidate_snapshot(room)
+    index_room(room)
+    if match_history is not None:
+        match_history.start_match(room_id, clock.now())
+    
+    sink.emit("game_started", {}, room=room_audience(room_id))
+    
+    # Iniciar primera ronda
+    start_round(room_id, sink)
+    
+    log(f"🎮 Juego iniciado en sala {room_id}")
+
+
+def next_round_command(room_id: str, sink: EventSink, sid: str):
+    """
+    Inicia la siguiente ronda si el juego está activo y no hay otra en curso
+    """
+    room = get_room(room_id)
+    if not room:
+        sink.error(sid, "Sala no encontrada")
+        return
+    
+    if room["host"] != sid:
+        sink.error(sid, "Solo el host puede iniciar rondas")
+        return
+    
+    if not room["game_started"] or room["game_finished"]:
+        sink.error(sid, "El juego no está activo")
+        return
+    
+    if room["current_question"]:
+        sink.error(sid, "Ya hay una ronda en curso")
+        return
+    
+    # Iniciar nueva ronda
+    start_round(room_id, sink)
+
+
+def submit_answer_command(room_id: str, sink: EventSink, sid: str, answer: str):
+    """
+    Registra y evalúa un intento de respuesta
+    """
+    room = get_room(room_id)
+    if not room:
+        sink.error(sid, "Sala no encontrada")
+        return
+    
+    if sid not in room["players"]:
+        sink.error(sid, "No estás en esta sala")
+        return
+    
+    if not room["current_question"]:
+        sink.error(sid, "No hay ronda activa")
+        return
+    
+    # Verificar si el jugador ya acertó en esta ronda
+    if sid in room["round_correct_players"]:
+        sink.error(sid, "Ya acertaste en esta ronda")
+        return
+    
+    # Verificar límite de spam
+    if is_rate_limited(room, sid):
+        sink.error(sid, "Enviando respuestas muy rápido, espera un momento")
+        return
+    
+    if not answer:
+        sink.error(sid, "La respuesta no puede estar vacía")
+        return
+    
+    # Registrar timestamp de envío para antispam
+    current_time = clock.now()
+    if sid not in room["player_submission_times"]:
+        room["player_submission_times"][sid] = []
+    room["player_submission_times"][sid].append(current_time)
+    
+    # Inicializar lista de respuestas si no existe
+    if sid not in room["round_answers"]:
+        room["round_answers"][sid] = []
+    
+    # Agregar nueva respuesta (descartando las más antiguas si se supera el límite).
+    # El acierto es siempre el último intento, así que no se descarta, pero los
+    # intentos fallidos que se descartan ya no se pueden re-evaluar con accept_alias
+    answer_data = {
+        "answer": answer,
+        "timestamp": current_time
+    }
+    player_answers = room["round_answers"][sid]
+    player_answers.append(answer_data)
+    if len(player_answers) > MAX_ANSWERS_PER_PLAYER:
+        del player_answers[0]
+    touch_room(room)
+    
+    player_name = room["players"][sid]["name"]
+    
+    # Verificar si la respuesta es correcta
+    grading_started = time.perf_counter()
+    is_correct = grade_room_answer(room, room["current_question"], answer)
+    if live_stats is not None:
+        live_stats.record_answer(is_correct, time.perf_counter() - grading_started)
+    
+    mark_spectator_activity(room_id, room, answers=1, correct=1 if is_correct else 0)
+    
+    # Notificar a otros que alguien respondió (sin revelar si es correcta)
+    sink.emit("player_answered", {"name": player_name}, room=room_id)
+    
+    if is_correct:
+        # Marcar jugador como que ya acertó
+        room["round_correct_players"].add(sid)
+        
+        # Confirmar respuesta correcta
+        sink.emit("answer_correct", {"answer": answer}, room=sid)
+        
+        # Notificar a otros que alguien acertó
+        sink.emit("player_got_correct", {"name": player_name}, room=room_id)
+        
+        # Verificar si todos han acertado para terminar la ronda
+        check_round_completion(room_id, sink)
+    else:
+        # Confirmar recepción de respuesta incorrecta
+        sink.emit("answer_incorrect", {"answer": answer}, room=sid)
+    
+    log(f"📝 {player_name} respondió: {answer} ({'✓' if is_correct else '✗'})")
+
+
+def accept_alias_command(room_id: str, sink: EventSink, sid: str, alias: str):
+    """
+    El host acepta una respuesta que el banco no tenía y se re-evalúan los intentos
+    de la ronda. Con persist_alias (SHARE_HOST_ALIASES) se agrega a la pregunta para
+    todas las salas y se guarda en el banco; si no, vale solo en esta ronda de la sala.
+    Los puntos se asignan al terminar la ronda por orden de acierto, así que quien
+    acertó antes con la nueva respuesta queda primero. Solo se re-evalúan los
+    últimos MAX_ANSWERS_PER_PLAYER intentos de cada jugador (los demás ya se descartaron)
+    """
+    room = get_room(room_id)
+    if not room:
+        sink.error(sid, "Sala no encontrada")
+        return
+    
+    if room["host"] != sid:
+        sink.error(sid, "Solo el host puede aceptar respuestas")
+        return
+    
+    question = room["current_question"]
+    if not question:
+        sink.error(sid, "No hay ronda activa")
+        return
+    
+    alias = alias.strip()
+    alias_normalized = normalize_text(alias)
+    if not alias_normalized:
+        sink.error(sid, "La respuesta no puede estar vacía")
+        return
+    
+    if alias_normalized in question["respuestas_normalizadas"] or alias_normalized in room["round_aliases"]:
+        sink.error(sid, "Esa respuesta ya es válida")
+        return
+    
+    newly_correct, retimed = regrade_round(room, alias_normalized)
+    
+    if persist_alias is not None:
+        question["respuestas"].append(alias)
+        question["respuestas_normalizadas"].append(alias_normalized)
+        verdict_cache.discard_question(question["id"])
+        persist_alias(question["id"], alias)
+    else:
+        room["round_aliases"].append(alias_normalized)
+    
+    for player_sid, answer in newly_correct:
+        room["round_correct_players"].add(player_sid)
+        sink.emit("answer_correct", {"answer": answer, "alias": alias}, room=player_sid)
+        sink.emit("player_got_correct", {"name": room["players"][player_sid]["name"]}, room=room_id)
+    if newly_correct:
+        mark_spectator_activity(room_id, room, correct=len(newly_correct))
+    
+    sink.emit("alias_accepted", {
+        "alias": alias,
+        "newly_correct": [room["players"][player_sid]["name"] for player_sid, _ in newly_correct],
+        "retimed": [room["players"][player_sid]["name"] for player_sid in retimed]
+    }, room=room_audience(room_id))
+    
+    log(f"➕ Respuesta '{alias}' aceptada en sala {room_id} "
+        f"({len(newly_correct)} nuevos aciertos, {len(retimed)} adelantados)")
+    
+    # Si con esto acertaron todos, la ronda termina
+    check_round_completion(room_id, sink)
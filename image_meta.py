@@ -0,0 +1,177 @@
+"""
+Metadatos de imágenes del banco de preguntas de Trivia LAN
+Calcula para cada imagen sus dimensiones y una miniatura borrosa en base64 que el
+cliente muestra mientras descarga la imagen real. Los resultados se guardan en un
+archivo JSON y solo se recalculan si la imagen cambió
+
+Uso (precálculo offline, opcional: el servidor también lo hace al arrancar):
+    python image_meta.py
+"""
+
+import base64
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from config import FILES_CONFIG
+
+IMAGES_DIR = os.path.join("data", "images")
+PLACEHOLDER_WIDTH = 16  # Ancho en píxeles de la miniatura (el cliente la estira y desenfoca)
+
+# Pillow se importa recién al procesar la primera imagen: importar este módulo no lo carga
+_pillow: Optional[Dict] = None
+
+
+def pillow() -> Optional[Dict]:
+    """
+    Módulos de Pillow y formato de la miniatura, o None si Pillow no está instalado
+    """
+    global _pillow
+    if _pillow is None:
+        try:
+            from PIL import Image, ImageFilter, features
+        except ImportError:  # Pillow es opcional: sin él las preguntas no llevan metadatos
+            _pillow = {}
+        else:
+            # WebP deja la miniatura en ~100 bytes; si Pillow no lo soporta se usa JPEG optimizado (~350)
+            if features.check("webp"):
+                placeholder = ("WEBP", "image/webp", {"quality": 40})
+            else:
+                placeholder = ("JPEG", "image/jpeg", {"quality": 40, "optimize": True})
+            _pillow = {"Image": Image, "ImageFilter": ImageFilter, "placeholder": placeholder}
+    return _pillow or None
+
+
+def image_path(imagen: str, images_dir: str = IMAGES_DIR) -> str:
+    """
+    Ruta local de una imagen del CSV (mismo criterio que el servidor para /images)
+    """
+    return os.path.join(images_dir, imagen.replace("images/", "", 1))
+
+
+def compute_image_meta(path: str) -> Dict:
+    """
+    Dimensiones y miniatura borrosa (data URI) de una imagen
+    """
+    modules = pillow()
+    placeholder_format, placeholder_mime, placeholder_options = modules["placeholder"]
+    with modules["Image"].open(path) as image:
+        width, height = image.size
+        thumbnail = image.convert("RGB")
+        thumbnail.thumbnail((PLACEHOLDER_WIDTH, max(1, PLACEHOLDER_WIDTH * height // width)))
+        thumbnail = thumbnail.filter(modules["ImageFilter"].GaussianBlur(1))
+
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, format=placeholder_format, **placeholder_options)
+
+    return {
+        "width": width,
+        "height": height,
+        "placeholder": f"data:{placeholder_mime};base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+    }
+
+
+class ImageMetaCache:
+    """
+    Metadatos calculados, guardados en disco entre reinicios. Cada entrada recuerda
+    el tamaño y la fecha de modificación del archivo para detectar cambios
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as file:
+                    self.entries = json.load(file)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Caché de imágenes ilegible, se recalcula: {e}")
+
+    def get(self, path: str) -> Optional[Dict]:
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        stat = os.stat(path)
+        if entry["mtime_ns"] != stat.st_mtime_ns or entry["bytes"] != stat.st_size:
+            return None
+        return entry["meta"]
+
+    def put(self, path: str, meta: Dict):
+        stat = os.stat(path)
+        self.entries[path] = {"mtime_ns": stat.st_mtime_ns, "bytes": stat.st_size, "meta": meta}
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file)
+        os.replace(temporary, self.path)
+        self.dirty = False
+
+
+def annotate_questions(questions: List[Dict], images_dir: str = IMAGES_DIR,
+                       cache_path: str = FILES_CONFIG["IMAGE_META_CACHE"], workers: int = 4) -> int:
+    """
+    Agrega 'imagen_meta' a las preguntas con imagen local. Usa la caché en disco y
+    calcula en paralelo solo las imágenes nuevas o modificadas. Devuelve cuántas calculó
+    """
+    if pillow() is None:
+        return 0
+
+    cache = ImageMetaCache(cache_path)
+    by_path: Dict[str, List[Dict]] = {}
+    for question in questions:
+        imagen = question.get("imagen")
+        if question.get("es_imagen") and imagen and not imagen.startswith("http"):
+            path = image_path(imagen, images_dir)
+            if os.path.isfile(path):
+                by_path.setdefault(path, []).append(question)
+
+    missing = []
+    for path, path_questions in by_path.items():
+        meta = cache.get(path)
+        if meta is None:
+            missing.append(path)
+        else:
+            for question in path_questions:
+                question["imagen_meta"] = meta
+
+    def compute(path: str) -> Optional[Dict]:
+        try:
+            return compute_image_meta(path)
+        except Exception as e:
+            print(f"⚠️ No se pudo procesar {path}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, meta in zip(missing, executor.map(compute, missing)):
+            if meta is None:
+                continue
+            cache.put(path, meta)
+            for question in by_path[path]:
+                question["imagen_meta"] = meta
+
+    try:
+        cache.save()
+    except OSError as e:
+        print(f"⚠️ No se pudo guardar la caché de imágenes: {e}")
+
+    return len(missing)
+
+
+if __name__ == "__main__":
+    from game_engine import load_questions
+
+    if pillow() is None:
+        print("❌ Instala Pillow para calcular metadatos de imágenes (pip install pillow)")
+    else:
+        questions = load_questions()
+        computed = annotate_questions(questions)
+        annotated = sum(1 for question in questions if "imagen_meta" in question)
+        print(f"🖼️ {annotated} preguntas con metadatos ({computed} imágenes calculadas, "
+              f"el resto desde {FILES_CONFIG['IMAGE_META_CACHE']})")
@@ -0,0 +1,139 @@
+"""
+Presupuesto de tiempo de importación de Trivia LAN
+Importa cada módulo en un proceso nuevo con `python -X importtime`, informa cuánto
+tardó y qué dependencias pesan más, y falla si supera su presupuesto o si carga
+alguna dependencia que solo debería importarse al usarse (pandas, Pillow, rapidfuzz)
+
+Uso:
+    python import_time.py                      # game_engine y server con sus presupuestos
+    python import_time.py server --budget-ms 900 --top 15
+    python import_time.py --json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+# Presupuesto (ms) de cada módulo, medido en frío. server incluye FastAPI y Socket.IO
+IMPORT_BUDGETS_MS = {
+    "game_engine": 250,
+    "simulation": 300,
+    "server": 1500,
+}
+
+# Dependencias que no deben cargarse al importar: se importan en el primer uso o en
+# el arranque del servidor (lifespan)
+LAZY_MODULES = {"pandas", "numpy", "PIL", "rapidfuzz", "uvicorn"}
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(output: str) -> List[Dict]:
+    """
+    Convierte la salida de -X importtime en una lista de
+    {name, depth, self_ms, cumulative_ms}
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue  # Encabezado ("self [us] | cumulative | imported package")
+        stripped = name.lstrip(" ")
+        entries.append({
+            "name": stripped,
+            "depth": (len(name) - len(stripped) - 1) // 2,
+            "self_ms": self_us / 1000,
+            "cumulative_ms": cumulative_us / 1000
+        })
+    return entries
+
+
+def measure(module: str, runs: int = 3) -> Dict:
+    """
+    Importa el módulo `runs` veces (cada una en un proceso nuevo) y se queda con
+    la más rápida, que es la menos afectada por ruido del sistema
+    """
+    best: Optional[List[Dict]] = None
+    best_ms = None
+    for _ in range(max(1, runs)):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"No se pudo importar {module}: {result.stderr.strip().splitlines()[-1:]}")
+        entries = parse_importtime(result.stderr)
+        total = next((entry["cumulative_ms"] for entry in entries
+                      if entry["name"] == module and entry["depth"] == 0), None)
+        if total is not None and (best_ms is None or total < best_ms):
+            best, best_ms = entries, total
+
+    if best is None:
+        raise RuntimeError(f"-X importtime no informó el módulo {module}")
+
+    loaded = {entry["name"].split(".")[0] for entry in best}
+    # -X importtime lista cada módulo después de sus dependencias: las directas son las
+    # de profundidad 1 entre la línea del módulo y la anterior de profundidad 0
+    position = next(index for index, entry in enumerate(best) if entry["name"] == module and entry["depth"] == 0)
+    children = []
+    for entry in reversed(best[:position]):
+        if entry["depth"] == 0:
+            break
+        if entry["depth"] == 1:
+            children.append(entry)
+    heaviest = sorted(children, key=lambda entry: entry["cumulative_ms"], reverse=True)
+    return {
+        "module": module,
+        "ms": round(best_ms, 1),
+        "heaviest": [{"name": entry["name"], "ms": round(entry["cumulative_ms"], 1)} for entry in heaviest],
+        "eager": sorted(LAZY_MODULES & loaded)
+    }
+
+
+def check(modules: Dict[str, float], runs: int = 3) -> List[Dict]:
+    """
+    Mide cada módulo y marca si cumple su presupuesto y no carga dependencias diferidas
+    """
+    results = []
+    for module, budget in modules.items():
+        result = measure(module, runs)
+        result["budget_ms"] = budget
+        result["ok"] = result["ms"] <= budget and not result["eager"]
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el tiempo de importación y lo compara con un presupuesto")
+    parser.add_argument("modules", nargs="*", help="Módulos a medir (por defecto los de IMPORT_BUDGETS_MS)")
+    parser.add_argument("--budget-ms", type=float, help="Presupuesto para todos los módulos indicados")
+    parser.add_argument("--runs", type=int, default=3, help="Importaciones por módulo (se usa la más rápida)")
+    parser.add_argument("--top", type=int, default=8, help="Dependencias más pesadas a mostrar")
+    parser.add_argument("--json", action="store_true", help="Imprimir solo el resultado en JSON")
+    args = parser.parse_args()
+
+    names = args.modules or list(IMPORT_BUDGETS_MS)
+    modules = {name: args.budget_ms or IMPORT_BUDGETS_MS.get(name, 500) for name in names}
+    results = check(modules, args.runs)
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for result in results:
+            print(f"{'✅' if result['ok'] else '❌'} {result['module']}: {result['ms']} ms "
+                  f"(presupuesto {result['budget_ms']:.0f} ms)")
+            for dependency in result["heaviest"][:args.top]:
+                print(f"   {dependency['ms']:>8.1f} ms  {dependency['name']}")
+            if result["eager"]:
+                print(f"   ⚠️ Importa al cargar: {', '.join(result['eager'])} (deberían importarse al usarse)")
+
+    sys.exit(0 if all(result["ok"] for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
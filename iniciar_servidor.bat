@@ -17,9 +17,6 @@ if not exist ".venv" (
     exit /b 1
 )
 
-REM Activar entorno virtual e iniciar servidor
-".venv\Scripts\python.exe" -c "from server import load_questions; preguntas = load_questions(); print(f'✅ {len(preguntas)} preguntas cargadas')"
-
 echo.
 echo 🚀 Iniciando servidor en http://0.0.0.0:8000
 echo.
@@ -32,6 +29,7 @@ echo.
 echo ⏹️  Presiona Ctrl+C para detener el servidor
 echo.
 
-".venv\Scripts\python.exe" -m uvicorn server:asgi --host 0.0.0.0 --port 8000
+REM El lanzador lee SERVER_CONFIG de config.py (y variables TRIVIA_*) y carga las preguntas
+".venv\Scripts\python.exe" server.py
 
 pause
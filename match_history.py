@@ -0,0 +1,188 @@
+"""
+Historial de partidas de Trivia LAN
+Guarda por sala un registro compacto de cada ronda (pregunta, respuestas con su
+veredicto y puntos) y lo exporta como NDJSON o CSV en trozos, sin armar el volcado
+completo en memoria. Las salas cerradas pasan a un archivo acotado
+"""
+
+import asyncio
+import csv
+import io
+import json
+from collections import deque
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+# Columnas del CSV: una fila por respuesta y una por puntuación final de cada jugador
+CSV_COLUMNS = ["type", "room_id", "match", "round", "question_id", "player",
+               "answer", "correct", "seconds", "points"]
+
+
+class MatchHistory:
+    """
+    Historial de las salas abiertas y de las últimas `max_rooms` salas cerradas. Por
+    sala se guardan las últimas `max_matches_per_room` partidas y por partida las
+    últimas `max_rounds_per_match` rondas. Cada ronda se guarda como una tupla:
+    (ronda, id de pregunta, inicio, fin, respuestas, puntos), con respuestas
+    ((jugador, respuesta, correcta, segundos), ...) y puntos ((jugador, puntos), ...)
+    """
+
+    def __init__(self, max_rooms: int = 5000, max_matches_per_room: int = 50, max_rounds_per_match: int = 200):
+        self.max_matches_per_room = max_matches_per_room
+        self.max_rounds_per_match = max_rounds_per_match
+        self.live: Dict[str, Dict] = {}  # room_id -> historial de una sala abierta
+        self.archived: deque = deque(maxlen=max_rooms)  # Salas cerradas (las más viejas se descartan)
+        self.archived_total = 0
+
+    # --- Registro (lo llama el motor) -------------------------------------------
+
+    def _room(self, room_id: str) -> Dict:
+        entry = self.live.get(room_id)
+        if entry is None:
+            entry = {"room_id": room_id, "matches": deque(maxlen=self.max_matches_per_room),
+                     "match_count": 0, "closed_at": None, "close_reason": None}
+            self.live[room_id] = entry
+        return entry
+
+    def start_match(self, room_id: str, started_at: float):
+        """
+        Abre una partida nueva en la sala (las puntuaciones vuelven a cero)
+        """
+        entry = self._room(room_id)
+        entry["match_count"] += 1
+        entry["matches"].append({
+            "number": entry["match_count"],
+            "started_at": started_at,
+            "finished_at": None,
+            "winner": None,
+            "rounds": deque(maxlen=self.max_rounds_per_match),  # Las más viejas se descartan
+            "round_count": 0,  # Rondas jugadas (incluidas las descartadas)
+            "scores": {}
+        })
+
+    def record_round(self, room_id: str, round_record: Tuple, scores: Dict[str, int]):
+        """
+        Agrega una ronda terminada y actualiza las puntuaciones de la partida
+        """
+        entry = self._room(room_id)
+        if not entry["matches"]:
+            self.start_match(room_id, round_record[2])
+        match = entry["matches"][-1]
+        match["rounds"].append(round_record)
+        match["round_count"] += 1
+        match["scores"] = scores
+
+    def finish_match(self, room_id: str, winner: Optional[str], finished_at: float):
+        """
+        Marca la partida en curso como terminada
+        """
+        entry = self.live.get(room_id)
+        if entry and entry["matches"]:
+            entry["matches"][-1]["winner"] = winner
+            entry["matches"][-1]["finished_at"] = finished_at
+
+    def archive(self, room_id: str, reason: str, closed_at: float):
+        """
+        Pasa la sala al archivo al cerrarse (si jugó alguna ronda)
+        """
+        entry = self.live.pop(room_id, None)
+        if entry is None or not any(match["rounds"] for match in entry["matches"]):
+            return
+        entry["closed_at"] = closed_at
+        entry["close_reason"] = reason
+        self.archived.append(entry)
+        self.archived_total += 1
+
+    def stats(self) -> Dict:
+        return {
+            "live_rooms": len(self.live),
+            "archived_rooms": len(self.archived),
+            "archived_total": self.archived_total
+        }
+
+    # --- Exportación -------------------------------------------------------------
+
+    def rooms(self, room_id: Optional[str] = None) -> List[Dict]:
+        """
+        Salas a exportar (archivadas y abiertas). Solo copia las referencias: el
+        contenido se serializa sala por sala al exportar
+        """
+        if room_id is not None:
+            return [entry for entry in self.archived if entry["room_id"] == room_id] + \
+                   ([self.live[room_id]] if room_id in self.live else [])
+        return list(self.archived) + list(self.live.values())
+
+    @staticmethod
+    def ndjson_lines(entry: Dict) -> Iterator[str]:
+        """
+        Una línea por ronda y una por partida (puntuaciones finales o parciales)
+        """
+        room_id = entry["room_id"]
+        for match in list(entry["matches"]):
+            for round_number, question_id, started_at, ended_at, answers, points in list(match["rounds"]):
+                yield json.dumps({
+                    "type": "round",
+                    "room_id": room_id,
+                    "match": match["number"],
+                    "round": round_number,
+                    "question_id": question_id,
+                    "started_at": started_at,
+                    "ended_at": ended_at,
+                    "answers": [{"player": player, "answer": answer, "correct": correct, "seconds": seconds}
+                                for player, answer, correct, seconds in answers],
+                    "points": dict(points)
+                }, ensure_ascii=False) + "\n"
+            yield json.dumps({
+                "type": "match",
+                "room_id": room_id,
+                "match": match["number"],
+                "started_at": match["started_at"],
+                "finished_at": match["finished_at"],
+                "winner": match["winner"],
+                "rounds": match["round_count"],
+                "rounds_kept": len(match["rounds"]),
+                "scores": match["scores"],
+                "closed_at": entry["closed_at"],
+                "close_reason": entry["close_reason"]
+            }, ensure_ascii=False) + "\n"
+
+    @staticmethod
+    def csv_rows(entry: Dict) -> Iterator[List]:
+        """
+        Una fila por respuesta y una por puntuación final de cada jugador
+        """
+        room_id = entry["room_id"]
+        for match in list(entry["matches"]):
+            for round_number, question_id, _, _, answers, points in list(match["rounds"]):
+                awarded = dict(points)
+                for player, answer, correct, seconds in answers:
+                    yield ["answer", room_id, match["number"], round_number, question_id, player,
+                           answer, int(correct), seconds, awarded.get(player, 0) if correct else 0]
+            for player, score in match["scores"].items():
+                yield ["score", room_id, match["number"], "", "", player, "", "", "", score]
+
+    async def stream(self, export_format: str = "ndjson", room_id: Optional[str] = None,
+                     chunk_size: int = 64 * 1024) -> AsyncIterator[str]:
+        """
+        Genera la exportación en trozos de unos `chunk_size` caracteres (salas
+        completas), cediendo el event loop entre trozos para no frenar las partidas
+        """
+        rooms = self.rooms(room_id)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if export_format == "csv" else None
+        if writer is not None:
+            writer.writerow(CSV_COLUMNS)
+
+        for entry in rooms:
+            if writer is not None:
+                writer.writerows(self.csv_rows(entry))
+            else:
+                buffer.writelines(self.ndjson_lines(entry))
+
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                await asyncio.sleep(0)
+
+        if buffer.tell():
+            yield buffer.getvalue()
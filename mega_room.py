@@ -0,0 +1,569 @@
+"""
+Partidas masivas de Trivia LAN
+Una sola partida para miles de jugadores repartida en fragmentos: cada fragmento es
+una sala del motor (sala de Socket.IO, estado y actor propios) que evalúa y ordena a
+sus jugadores. El coordinador elige la pregunta, arranca y termina la ronda de todos
+los fragmentos a la vez y une sus resultados: el podio sale de los primeros aciertos
+de cada fragmento, el leaderboard de sus top-K y la posición de cada jugador de la
+suma de los histogramas de puntajes de los fragmentos
+"""
+
+import heapq
+import json
+from collections import Counter
+from typing import Dict, List, Optional
+
+import game_engine
+from config import GAME_CONFIG
+from game_engine import (
+    EventSink, add_player_to_room, clear_round_state, close_room, collect_correct_answers,
+    create_room, current_round_payload, game_state, get_random_question, get_room,
+    index_room, invalidate_snapshot, round_question_summary, spectator_room, start_round,
+    touch_room
+)
+
+MEGA_SHARD_SIZE = GAME_CONFIG["MEGA_SHARD_SIZE"]  # Jugadores por fragmento
+RESULTS_DELAY = GAME_CONFIG["RESULTS_DELAY"]  # Pausa entre rondas (las lanza el coordinador)
+
+
+def get_mega(mega_id: str) -> Optional[Dict]:
+    """
+    Obtiene una partida masiva por su ID
+    """
+    return game_state["mega_rooms"].get(mega_id)
+
+
+def create_mega(mega_id: str, host_sid: str, shard_size: int = MEGA_SHARD_SIZE) -> Dict:
+    """
+    Crea una partida masiva esperando jugadores
+    """
+    mega = {
+        "id": mega_id,
+        "host": host_sid,
+        "shard_size": max(1, shard_size),
+        "shards": [],  # IDs de las salas fragmento, en orden de creación
+        "players": {},  # sid -> (fragmento, nombre en minúsculas)
+        "names": set(),  # Nombres en minúsculas (únicos en toda la partida)
+        "status": "waiting",  # waiting | playing | finished
+        "target_points": game_engine.TARGET_POINTS_DEFAULT,
+        "used_questions": set(),
+        "round_number": 0,
+        "question": None,  # Pregunta de la ronda abierta (la misma en todos los fragmentos)
+        "last_question": None,  # Pregunta de la última ronda cerrada (para round_end)
+        "round_started_at": None,
+        "round_deadline": None,
+        "round_timer": None,  # Único timer de fin de ronda para todos los fragmentos
+        "pending_shards": set(),  # Fragmentos que todavía no informaron su fin de ronda
+        "reports": {},  # fragmento -> resultados locales de la ronda
+        "rank_by_score": {},  # puntaje -> posición global (última ronda)
+        "total_players": 0,
+        "leaderboard": [],
+        "rounds_played": 0,
+        "round_bonus": None,  # (fragmento, sid, puntos) del bonus de la última ronda
+        "winner": None,
+        "finished_at": None
+    }
+    game_state["mega_rooms"][mega_id] = mega
+    return mega
+
+
+def live_shards(mega: Dict) -> List[str]:
+    """
+    Fragmentos que siguen abiertos (el limpiador puede cerrar los que quedan vacíos)
+    """
+    mega["shards"] = [shard_id for shard_id in mega["shards"] if get_room(shard_id)]
+    return mega["shards"]
+
+
+def mega_audience(mega: Dict) -> List[str]:
+    """
+    Salas de Socket.IO de todos los fragmentos (jugadores y espectadores)
+    """
+    shards = live_shards(mega)
+    return shards + [spectator_room(shard_id) for shard_id in shards]
+
+
+def mega_stats(mega: Dict) -> Dict:
+    """
+    Resumen de la partida masiva
+    """
+    return {
+        "id": mega["id"],
+        "status": mega["status"],
+        "players": len(mega["players"]),
+        "shards": len(live_shards(mega)),
+        "shard_size": mega["shard_size"],
+        "round_number": mega["round_number"],
+        "rounds_played": mega["rounds_played"],
+        "leaderboard": mega["leaderboard"],
+        "winner": mega["winner"]
+    }
+
+
+def mega_state(mega: Dict) -> Dict:
+    """
+    Estado para quien entra tarde (mismo formato que room_snapshot en salas grandes)
+    """
+    return {
+        "game_started": mega["status"] != "waiting",
+        "game_finished": mega["status"] == "finished",
+        "winner": mega["winner"],
+        "target_points": mega["target_points"],
+        "round_number": mega["round_number"],
+        "total_players": len(mega["players"]),
+        "leaderboard": mega["leaderboard"],
+        "players": None
+    }
+
+
+# --- Jugadores -----------------------------------------------------------------------
+
+def open_shard(mega: Dict) -> str:
+    """
+    Primer fragmento con lugar; si están todos llenos se crea uno nuevo
+    """
+    for shard_id in live_shards(mega):
+        if len(get_room(shard_id)["players"]) < mega["shard_size"]:
+            return shard_id
+
+    shard_id = f"{mega['id']}~{len(mega['shards']) + 1}"
+    while get_room(shard_id):
+        shard_id += "+"
+    room = create_room(shard_id, None)
+    room["mega"] = mega["id"]
+    room["on_all_correct"] = shard_all_correct
+    room["target_points"] = mega["target_points"]
+    room["game_started"] = mega["status"] != "waiting"
+    room["round_number"] = mega["round_number"]
+    mega["shards"].append(shard_id)
+    index_room(room)
+    return shard_id
+
+
+def assign_shard_command(mega_id: str, sink: EventSink, sid: str, player_name: str) -> Optional[str]:
+    """
+    Reserva el nombre del jugador y le asigna un fragmento (el primero en unirse crea
+    la partida y es su host). Devuelve el fragmento; el jugador entra con join_shard_command
+    """
+    mega = get_mega(mega_id) or create_mega(mega_id, sid)
+
+    if mega["status"] == "finished":
+        sink.error(sid, "La partida ya terminó")
+        return None
+
+    if sid in mega["players"]:
+        sink.error(sid, "Ya estás en esta partida")
+        return None
+
+    if player_name.lower() in mega["names"]:
+        sink.error(sid, "Nombre de jugador ya en uso")
+        return None
+
+    shard_id = open_shard(mega)
+    mega["players"][sid] = (shard_id, player_name.lower())
+    mega["names"].add(player_name.lower())
+    return shard_id
+
+
+def join_shard_command(shard_id: str, sink: EventSink, mega_id: str, sid: str, player_name: str):
+    """
+    Agrega al jugador a su fragmento. Si el fragmento es nuevo y hay una ronda
+    abierta, la arranca con la pregunta y el vencimiento compartidos
+    """
+    mega = get_mega(mega_id)
+    room = get_room(shard_id)
+    if not mega or not room or mega["players"].get(sid, (None,))[0] != shard_id:
+        sink.error(sid, "Sala no encontrada")
+        return
+
+    add_player_to_room(shard_id, sid, player_name)
+    room["host"] = None  # Las rondas las lanza el coordinador
+    index_room(room)
+    sink.enter_room(sid, shard_id)
+    touch_room(room)
+
+    if mega["question"] is not None and not room["current_question"]:
+        room["round_number"] = mega["round_number"] - 1
+        start_round(shard_id, sink, question=mega["question"], deadline=mega["round_deadline"])
+
+    sink.emit("room_joined", {
+        "room_id": shard_id,
+        "mega_id": mega_id,
+        "player_name": player_name,
+        "is_host": mega["host"] == sid,
+        "game_started": mega["status"] != "waiting",
+        "state": json.dumps(mega_state(mega), ensure_ascii=False),
+        "round": current_round_payload(room)
+    }, room=sid)
+
+    # Solo el host ve cuántos se van uniendo (avisarles a todos sería N² mensajes)
+    if mega["host"] != sid:
+        sink.emit("mega_update", mega_stats(mega), room=mega["host"])
+
+    game_engine.log(f"👤 {player_name} se unió a la partida masiva {mega_id} ({shard_id})")
+
+
+def leave_mega_command(mega_id: str, sink: EventSink, sid: str):
+    """
+    Libera el nombre del jugador al desconectarse (su fragmento ya lo quitó de la
+    sala). Si era el host, el primero que queda pasa a serlo
+    """
+    mega = get_mega(mega_id)
+    if not mega or sid not in mega["players"]:
+        return
+
+    _, name = mega["players"].pop(sid)
+    mega["names"].discard(name)
+
+    if not mega["players"]:
+        close_mega(mega, sink, "empty")
+        return
+
+    if mega["host"] == sid:
+        mega["host"] = next(iter(mega["players"]))
+        sink.emit("mega_host", {"mega_id": mega_id, **mega_stats(mega)}, room=mega["host"])
+
+
+def close_mega(mega: Dict, sink: EventSink, reason: str):
+    """
+    Olvida la partida y pide a cada fragmento que se cierre con su propio actor
+    """
+    if mega["round_timer"] is not None:
+        mega["round_timer"].cancel()
+    for shard_id in live_shards(mega):
+        game_engine.dispatch(shard_id, close_room, reason)
+    game_state["mega_rooms"].pop(mega["id"], None)
+    if game_engine.match_history is not None:
+        game_engine.match_history.archive(mega["id"], reason, game_engine.clock.now())
+
+
+# --- Rondas ----------------------------------------------------------------------------
+
+def start_mega_command(mega_id: str, sink: EventSink, sid: str):
+    """
+    Inicia la partida en todos los fragmentos (solo el host)
+    """
+    mega = get_mega(mega_id)
+    if not mega:
+        sink.error(sid, "Partida no encontrada")
+        return
+
+    if mega["host"] != sid:
+        sink.error(sid, "Solo el host puede iniciar el juego")
+        return
+
+    if mega["status"] != "waiting":
+        sink.error(sid, "El juego ya está iniciado")
+        return
+
+    if not mega["players"]:
+        sink.error(sid, "Se necesita al menos 1 jugador")
+        return
+
+    # Cada fragmento se marca como iniciado en su actor, antes de que llegue la primera ronda
+    mega["status"] = "playing"
+    for shard_id in live_shards(mega):
+        game_engine.dispatch(shard_id, shard_game_start_command, mega_id)
+
+    if game_engine.match_history is not None:
+        game_engine.match_history.start_match(mega_id, game_engine.clock.now())
+
+    sink.emit("game_started", {}, room=mega_audience(mega))
+    fire_mega_round(mega_id, 0)
+
+    game_engine.log(f"🎮 Partida masiva {mega_id} iniciada con {len(mega['players'])} jugadores "
+                    f"en {len(mega['shards'])} fragmentos")
+
+
+def shard_game_start_command(shard_id: str, sink: EventSink, mega_id: str):
+    """
+    Marca el fragmento como iniciado
+    """
+    mega = get_mega(mega_id)
+    room = get_room(shard_id)
+    if not mega or not room or mega["status"] == "waiting":
+        return
+
+    room["game_started"] = True
+    invalidate_snapshot(room)
+    index_room(room)
+
+
+def fire_mega_round(mega_id: str, after_round: int):
+    """
+    Elige la pregunta, programa el único timer de fin de ronda y arranca la ronda en
+    cada fragmento a través de su propio despachador de comandos
+    """
+    mega = get_mega(mega_id)
+    if not mega or mega["status"] != "playing" or mega["round_number"] != after_round:
+        return
+
+    question = get_random_question(mega["used_questions"])
+    shards = live_shards(mega)
+    if not question or not shards:
+        return
+
+    clock = game_engine.clock
+    mega["used_questions"].add(question["id"])
+    mega["round_number"] += 1
+    mega["question"] = question
+    mega["round_started_at"] = clock.now()
+    mega["round_deadline"] = mega["round_started_at"] + game_engine.ROUND_SECONDS
+    mega["round_timer"] = clock.call_later(game_engine.ROUND_SECONDS, fire_mega_round_end,
+                                           mega_id, mega["round_number"])
+    for shard_id in shards:
+        game_engine.dispatch(shard_id, shard_round_start_command, mega_id, mega["round_number"])
+
+
+def shard_round_start_command(shard_id: str, sink: EventSink, mega_id: str, round_number: int):
+    """
+    Arranca en el fragmento la ronda abierta por el coordinador
+    """
+    mega = get_mega(mega_id)
+    room = get_room(shard_id)
+    if not mega or not room or mega["question"] is None or mega["round_number"] != round_number:
+        return
+    if room["current_question"] is not None and room["round_number"] == round_number:
+        return  # Ya la arrancó join_shard_command
+
+    room["round_number"] = round_number - 1
+    start_round(shard_id, sink, question=mega["question"], deadline=mega["round_deadline"])
+
+
+def round_complete(mega: Dict) -> bool:
+    """
+    Indica si acertaron todos los jugadores de todos los fragmentos
+    """
+    for shard_id in live_shards(mega):
+        room = get_room(shard_id)
+        # Los aciertos de quien se desconectó no cuentan (como en check_round_completion)
+        correct = sum(1 for sid in room["round_correct_players"] if sid in room["players"])
+        if room["players"] and (not room["current_question"] or correct < len(room["players"])):
+            return False
+    return True
+
+
+def shard_all_correct(shard_id: str, sink: EventSink):
+    """
+    Gancho de check_round_completion: acertaron todos en el fragmento. La ronda
+    termina antes de tiempo solo si pasa lo mismo en todos los fragmentos
+    """
+    mega = get_mega(get_room(shard_id)["mega"])
+    if mega and mega["question"] is not None and round_complete(mega):
+        fire_mega_round_end(mega["id"], mega["round_number"])
+
+
+def fire_mega_round_end(mega_id: str, round_number: int):
+    """
+    Cierra la ronda (por tiempo o porque acertaron todos) y pide a cada fragmento
+    sus resultados locales
+    """
+    mega = get_mega(mega_id)
+    if not mega or mega["question"] is None or mega["round_number"] != round_number:
+        return
+
+    if mega["round_timer"] is not None:
+        mega["round_timer"].cancel()
+        mega["round_timer"] = None
+    mega["last_question"] = mega["question"]
+    mega["question"] = None
+    mega["reports"] = {}
+    mega["pending_shards"] = set(live_shards(mega))
+    for shard_id in list(mega["pending_shards"]):
+        game_engine.dispatch(shard_id, shard_round_end_command, mega_id, round_number)
+
+
+def shard_round_report(room: Dict) -> Dict:
+    """
+    Evalúa la ronda en el fragmento: suma OTHER_CORRECT_POINTS a cada acierto (el
+    bonus del primero lo decide el coordinador) y resume lo que necesita para unir
+    los resultados: primeros aciertos, top-K, histograma de puntajes y, para el
+    historial, los intentos evaluados y las puntuaciones
+    """
+    top_k = game_engine.LEADERBOARD_TOP_K
+    question = room["current_question"]
+    graded = [] if game_engine.match_history is not None else None
+    correct, wrong = collect_correct_answers(room, question, graded) if question else ([], [])
+
+    points = {}
+    for answer in correct:
+        room["players"][answer["sid"]]["score"] += game_engine.OTHER_CORRECT_POINTS
+        points[answer["sid"]] = game_engine.OTHER_CORRECT_POINTS
+
+    report = {
+        "podium": [(answer["timestamp"], answer["sid"], answer["name"], answer["answer"], room["id"],
+                    room["players"][answer["sid"]]["score"])
+                   for answer in correct[:top_k]],
+        "correct": len(correct),
+        "attempts": room["round_activity"]["answers"],
+        "wrong": wrong,
+        "histogram": Counter(player["score"] for player in room["players"].values()),
+        "top": heapq.nlargest(top_k, ({"sid": sid, "name": player["name"], "score": player["score"]}
+                                      for sid, player in room["players"].items()),
+                              key=lambda entry: entry["score"]),
+        "points": points,
+        "graded": graded or [],
+        "scores": {player["name"]: player["score"] for player in room["players"].values()}
+                  if graded is not None else {}
+    }
+    clear_round_state(room)
+    index_room(room)
+    return report
+
+
+def shard_round_end_command(shard_id: str, sink: EventSink, mega_id: str, round_number: int):
+    """
+    Entrega los resultados locales del fragmento; el último en terminar une todos
+    """
+    mega = get_mega(mega_id)
+    if not mega or mega["round_number"] != round_number or shard_id not in mega["pending_shards"]:
+        return
+
+    room = get_room(shard_id)
+    if room:
+        mega["reports"][shard_id] = shard_round_report(room)
+    mega["pending_shards"].discard(shard_id)
+    if not mega["pending_shards"]:
+        merge_mega_round(mega, sink)
+
+
+def merge_mega_round(mega: Dict, sink: EventSink):
+    """
+    Une los resultados de los fragmentos: podio global por momento de acierto (el
+    primero recibe el bonus), leaderboard a partir de los top-K de cada fragmento y
+    posiciones a partir de la suma de sus histogramas. Corre en el actor del último
+    fragmento en informar: lo que cambia en cada fragmento (bonus, fin de la
+    partida) lo aplica su propio actor con shard_round_result_command
+    """
+    top_k = game_engine.LEADERBOARD_TOP_K
+    reports = mega["reports"]
+    question = mega["last_question"]
+
+    podium = list(heapq.merge(*(report["podium"] for report in reports.values())))[:top_k]
+    histogram = Counter()
+    for report in reports.values():
+        histogram.update(report["histogram"])
+    candidates = {entry["sid"]: entry for report in reports.values() for entry in report["top"]}
+
+    # Bonus del primero en acertar entre todos los fragmentos
+    bonus = game_engine.FIRST_CORRECT_POINTS - game_engine.OTHER_CORRECT_POINTS
+    mega["round_bonus"] = None
+    if podium and bonus:
+        _, first_sid, first_name, _, first_shard, first_score = podium[0]
+        histogram[first_score] -= 1
+        histogram[first_score + bonus] += 1
+        reports[first_shard]["points"][first_sid] = game_engine.FIRST_CORRECT_POINTS
+        reports[first_shard]["scores"][first_name] = first_score + bonus
+        candidates[first_sid] = {"sid": first_sid, "name": first_name, "score": first_score + bonus}
+        mega["round_bonus"] = (first_shard, first_sid, bonus)
+
+    # Posición de cada puntaje: 1 + jugadores con más puntos (empates comparten posición)
+    rank_by_score = {}
+    position = 1
+    for score in sorted(histogram, reverse=True):
+        if histogram[score] > 0:
+            rank_by_score[score] = position
+            position += histogram[score]
+    total_players = position - 1
+
+    leaderboard = [
+        {"rank": rank_by_score[entry["score"]], "name": entry["name"], "score": entry["score"]}
+        for entry in heapq.nlargest(top_k, candidates.values(), key=lambda entry: entry["score"])
+    ]
+    results = [
+        {"rank": index + 1, "name": name, "answer": answer, "is_first": index == 0,
+         "points": game_engine.FIRST_CORRECT_POINTS if index == 0 else game_engine.OTHER_CORRECT_POINTS}
+        for index, (_, _, name, answer, _, _) in enumerate(podium)
+    ]
+    winner = leaderboard[0]["name"] if leaderboard and leaderboard[0]["score"] >= mega["target_points"] else None
+
+    if game_engine.question_stats is not None:
+        game_engine.question_stats.record_round(
+            question["id"],
+            players=total_players,
+            attempts=sum(report["attempts"] for report in reports.values()),
+            correct_players=sum(report["correct"] for report in reports.values()),
+            first_correct_seconds=podium[0][0] - mega["round_started_at"] if podium else None,
+            wrong_answers=[answer for report in reports.values() for answer in report["wrong"]]
+        )
+
+    mega["rank_by_score"] = rank_by_score
+    mega["total_players"] = total_players
+    mega["leaderboard"] = leaderboard
+    mega["rounds_played"] += 1
+    now = game_engine.clock.now()
+
+    if winner:
+        mega["status"] = "finished"
+        mega["winner"] = winner
+        mega["finished_at"] = now
+
+    if game_engine.match_history is not None:
+        # Nombres únicos en toda la partida: cada jugador tiene a lo sumo un acierto
+        graded = tuple(answer for report in reports.values() for answer in report["graded"])
+        first_name = podium[0][2] if podium else None
+        scores = {}
+        for report in reports.values():
+            scores.update(report["scores"])
+        game_engine.match_history.record_round(
+            mega["id"],
+            (mega["round_number"], question["id"], mega["round_started_at"], now, graded,
+             tuple((player, game_engine.FIRST_CORRECT_POINTS if player == first_name else game_engine.OTHER_CORRECT_POINTS)
+                   for player, _, correct, _ in graded if correct)),
+            scores
+        )
+        if winner:
+            game_engine.match_history.finish_match(mega["id"], winner, now)
+
+    sink.emit("round_end", {
+        "question": round_question_summary(question),
+        "results": results,
+        "leaderboard": leaderboard,
+        "total_players": total_players,
+        "game_finished": winner is not None,
+        "winner": winner
+    }, room=mega_audience(mega))
+
+    # Cada fragmento aplica el resultado y avisa a sus jugadores su posición global
+    for shard_id in live_shards(mega):
+        game_engine.dispatch(shard_id, shard_round_result_command, mega["id"], mega["round_number"])
+
+    if not winner:
+        game_engine.clock.call_later(RESULTS_DELAY, fire_mega_round, mega["id"], mega["round_number"])
+
+    game_engine.log(f"🏁 Ronda {mega['round_number']} de la partida masiva {mega['id']}: "
+                    f"{sum(report['correct'] for report in reports.values())}/{total_players} aciertos")
+
+
+def shard_round_result_command(shard_id: str, sink: EventSink, mega_id: str, round_number: int):
+    """
+    Aplica en el fragmento lo que decidió el coordinador (bonus del primero en acertar
+    y fin de la partida) y envía a cada jugador su posición global y los puntos de la ronda
+    """
+    mega = get_mega(mega_id)
+    room = get_room(shard_id)
+    if not mega or not room or mega["round_number"] != round_number:
+        return
+
+    bonus = mega["round_bonus"]
+    if bonus is not None and bonus[0] == shard_id and bonus[1] in room["players"]:
+        room["players"][bonus[1]]["score"] += bonus[2]
+        invalidate_snapshot(room)
+    if mega["status"] == "finished" and not room["game_finished"]:
+        room["game_finished"] = True
+        room["winner"] = mega["winner"]
+        room["finished_at"] = mega["finished_at"]
+        invalidate_snapshot(room)
+        index_room(room)
+
+    report = mega["reports"].get(shard_id)
+    points = report["points"] if report else {}
+    rank_by_score = mega["rank_by_score"]
+    total_players = mega["total_players"]
+    for sid, player in room["players"].items():
+        sink.emit("round_rank", {
+            "rank": rank_by_score.get(player["score"], total_players),
+            "score": player["score"],
+            "points": points.get(sid, 0),
+            "total_players": total_players
+        }, room=sid)
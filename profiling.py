@@ -0,0 +1,232 @@
+"""
+Perfilado en caliente de Trivia LAN
+Herramientas para ver por qué el servidor está lento sin reiniciarlo: perfil de CPU
+del event loop por muestreo (pilas colapsadas para flamegraph) o con cProfile
+(pstats), fotos de memoria con tracemalloc, tamaño estimado de cada sala y un
+monitor del retraso del event loop. Los endpoints que las exponen están en server.py
+y solo responden con el token de administración
+"""
+
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Dict, Optional
+
+
+class LoopLagMonitor:
+    """
+    Mide cada `interval` segundos cuánto se atrasa el event loop en despertar una
+    tarea dormida: si un handler bloquea el loop, el retraso lo muestra
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 120):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=window)  # Últimos retrasos (segundos)
+        self.max_lag = 0.0
+        self.checks = 0
+
+    def record(self, lag: float):
+        self.samples.append(lag)
+        self.max_lag = max(self.max_lag, lag)
+        self.checks += 1
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - expected))
+
+    def stats(self) -> Dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"checks": 0, "interval": self.interval}
+        return {
+            "checks": self.checks,
+            "interval": self.interval,
+            "last_ms": round(self.samples[-1] * 1000, 2),
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 2),
+            "max_ms": round(self.max_lag * 1000, 2)
+        }
+
+
+# --- CPU ---------------------------------------------------------------------------
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float = 0.005, max_depth: int = 64) -> Counter:
+    """
+    Muestrea la pila del hilo `thread_id` cada `interval` segundos (se ejecuta en
+    otro hilo, así el loop no se detiene). Devuelve pila colapsada -> muestras
+    """
+    counts: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None and len(stack) < max_depth:
+            stack.append(frame_label(frame))
+            frame = frame.f_back
+        if stack:
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def collapsed_stacks(counts: Counter) -> str:
+    """
+    Formato "pila;de;llamadas muestras" de flamegraph.pl / speedscope
+    """
+    return "".join(f"{stack} {samples}\n" for stack, samples in counts.most_common())
+
+
+async def sample_event_loop(seconds: float, interval: float = 0.005) -> Counter:
+    """
+    Perfil por muestreo del hilo del event loop durante `seconds` segundos
+    """
+    return await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds, interval)
+
+
+async def cprofile_event_loop(seconds: float) -> pstats.Stats:
+    """
+    Perfil determinista (cProfile) de todo lo que corre en el event loop durante
+    `seconds` segundos. Es más preciso que el muestreo pero frena al servidor
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    return pstats.Stats(profiler)
+
+
+# Órdenes que acepta pstats (cumulative, tottime, calls, ...)
+PROFILE_SORTS = set(pstats.Stats.sort_arg_dict_default)
+
+
+def pstats_text(stats: pstats.Stats, sort: str = "cumulative", limit: int = 40) -> str:
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+def pstats_dump(stats: pstats.Stats) -> bytes:
+    """
+    Mismo formato que Profile.dump_stats (se abre con pstats.Stats(archivo) o snakeviz)
+    """
+    return marshal.dumps(stats.stats)
+
+
+# --- Memoria -------------------------------------------------------------------------
+
+CONTAINERS = (dict, list, tuple, set, frozenset, deque)
+
+
+def deep_size(obj, seen: Optional[set] = None) -> int:
+    """
+    Tamaño aproximado en bytes de un objeto y de los contenedores que tiene
+    adentro (dicts, listas, tuplas, sets); cada objeto se cuenta una sola vez
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, CONTAINERS):
+            pending.extend(item)
+    return total
+
+
+# Partes de la sala que crecen con los jugadores y las rondas
+ROOM_MEMORY_FIELDS = ("players", "round_answers", "used_questions")
+
+
+async def room_memory(rooms: Dict[str, Dict], top: int = 20, batch: int = 200) -> Dict:
+    """
+    Tamaño estimado de players, round_answers y used_questions de cada sala. Cede
+    el loop cada `batch` salas; devuelve los totales y las `top` salas más pesadas
+    """
+    totals = dict.fromkeys(ROOM_MEMORY_FIELDS, 0)
+    sizes = []
+    for index, (room_id, room) in enumerate(list(rooms.items()), start=1):
+        entry = {"room_id": room_id}
+        for field in ROOM_MEMORY_FIELDS:
+            entry[field] = deep_size(room[field])
+            totals[field] += entry[field]
+        entry["total"] = sum(entry[field] for field in ROOM_MEMORY_FIELDS)
+        sizes.append(entry)
+        if index % batch == 0:
+            await asyncio.sleep(0)
+
+    sizes.sort(key=lambda entry: entry["total"], reverse=True)
+    return {"rooms": len(sizes), "bytes": totals, "largest": sizes[:top]}
+
+
+class MemoryTracer:
+    """
+    Fotos de tracemalloc. La primera queda como base para comparar cuánto creció
+    la memoria desde entonces (hasta que se detiene el rastreo)
+    """
+
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+
+    def start(self, frames: int = 1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.baseline = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self.baseline = None
+
+    def snapshot(self, top: int = 20) -> Dict:
+        """
+        Líneas que más memoria tienen asignada y las que más crecieron desde la base.
+        Es costoso con muchas asignaciones: conviene llamarlo en un hilo aparte
+        """
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            "tracing": True,
+            "current_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "top": [{"where": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:top]]
+        }
+        if self.baseline is None:
+            self.baseline = snapshot
+        else:
+            result["growth"] = [
+                {"where": str(stat.traceback), "size_diff_kb": round(stat.size_diff / 1024, 1),
+                 "count_diff": stat.count_diff}
+                for stat in snapshot.compare_to(self.baseline, "lineno")[:top]
+            ]
+        return result
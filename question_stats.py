@@ -0,0 +1,191 @@
+"""
+Estadísticas por pregunta para Trivia LAN
+Acumula intentos, tasa de acierto, tiempo hasta el primer acierto y respuestas
+incorrectas más comunes en un archivo SQLite, escribiendo en segundo plano
+"""
+
+import asyncio
+import sqlite3
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS question_stats (
+    question_id INTEGER PRIMARY KEY,
+    rounds INTEGER NOT NULL DEFAULT 0,
+    players INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    correct_players INTEGER NOT NULL DEFAULT 0,
+    first_correct_rounds INTEGER NOT NULL DEFAULT 0,
+    first_correct_seconds REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS wrong_guesses (
+    question_id INTEGER NOT NULL,
+    guess TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (question_id, guess)
+) WITHOUT ROWID;
+"""
+
+
+class QuestionStatsStore:
+    """
+    Registro de resultados por pregunta. record_round() solo agrega a una lista en
+    memoria; run() vuelca los lotes a SQLite en un hilo para no frenar el event loop.
+    Las tasas de acierto se mantienen también en memoria para elegir preguntas
+    """
+
+    def __init__(self, path: str, normalize: Callable[[str], str], flush_interval: float = 2.0):
+        self.path = path
+        self.normalize = normalize
+        self.flush_interval = flush_interval
+        self.pending: List[Dict] = []
+        self.totals: Dict[int, Tuple[int, int]] = {}  # question_id -> (jugadores, aciertos)
+
+    # --- Escritura -------------------------------------------------------------
+
+    def record_round(self, question_id: int, players: int, attempts: int, correct_players: int,
+                     first_correct_seconds: Optional[float], wrong_answers: List[str]):
+        """
+        Agrega el resultado de una ronda (no bloquea: se escribe en el próximo volcado)
+        """
+        self.pending.append({
+            "question_id": question_id,
+            "players": players,
+            "attempts": attempts,
+            "correct_players": correct_players,
+            "first_correct_seconds": first_correct_seconds,
+            "wrong_answers": wrong_answers
+        })
+
+        seen_players, seen_correct = self.totals.get(question_id, (0, 0))
+        self.totals[question_id] = (seen_players + players, seen_correct + correct_players)
+
+    async def run(self):
+        """
+        Vuelca periódicamente los resultados pendientes a disco
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ Error guardando estadísticas de preguntas: {e}")
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        await asyncio.to_thread(self._write_batch, batch)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        return connection
+
+    def _write_batch(self, batch: List[Dict]):
+        rows = []
+        guesses: Counter = Counter()
+        for record in batch:
+            first_seconds = record["first_correct_seconds"]
+            rows.append((
+                record["question_id"], record["players"], record["attempts"],
+                record["correct_players"], 1 if first_seconds is not None else 0, first_seconds or 0.0
+            ))
+            for answer in record["wrong_answers"]:
+                guess = self.normalize(answer)
+                if guess:
+                    guesses[(record["question_id"], guess)] += 1
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany("""
+                    INSERT INTO question_stats (question_id, rounds, players, attempts, correct_players,
+                                                first_correct_rounds, first_correct_seconds)
+                    VALUES (?, 1, ?, ?, ?, ?, ?)
+                    ON CONFLICT(question_id) DO UPDATE SET
+                        rounds = rounds + 1,
+                        players = players + excluded.players,
+                        attempts = attempts + excluded.attempts,
+                        correct_players = correct_players + excluded.correct_players,
+                        first_correct_rounds = first_correct_rounds + excluded.first_correct_rounds,
+                        first_correct_seconds = first_correct_seconds + excluded.first_correct_seconds
+                """, rows)
+                connection.executemany("""
+                    INSERT INTO wrong_guesses (question_id, guess, count) VALUES (?, ?, ?)
+                    ON CONFLICT(question_id, guess) DO UPDATE SET count = count + excluded.count
+                """, [(question_id, guess, count) for (question_id, guess), count in guesses.items()])
+        finally:
+            connection.close()
+
+    # --- Lectura ---------------------------------------------------------------
+
+    async def load(self):
+        """
+        Carga en memoria los totales guardados (para la selección por dificultad)
+        """
+        self.totals = await asyncio.to_thread(self._read_totals)
+
+    def _read_totals(self) -> Dict[int, Tuple[int, int]]:
+        connection = self._connect()
+        try:
+            rows = connection.execute("SELECT question_id, players, correct_players FROM question_stats")
+            return {question_id: (players, correct) for question_id, players, correct in rows}
+        finally:
+            connection.close()
+
+    def correct_rate(self, question_id: int, min_players: int) -> Optional[float]:
+        """
+        Proporción de jugadores que acertaron, o None si aún no hay datos suficientes
+        """
+        players, correct = self.totals.get(question_id, (0, 0))
+        if players < min_players:
+            return None
+        return correct / players
+
+    async def query(self, question_id: Optional[int] = None, order: str = "hardest",
+                    limit: int = 50, top_wrong: int = 5) -> List[Dict]:
+        """
+        Estadísticas de una pregunta o de las más difíciles/fáciles
+        """
+        await self.flush()
+        return await asyncio.to_thread(self._query, question_id, order, limit, top_wrong)
+
+    def _query(self, question_id: Optional[int], order: str, limit: int, top_wrong: int) -> List[Dict]:
+        direction = "DESC" if order == "easiest" else "ASC"
+        sql = """
+            SELECT question_id, rounds, players, attempts, correct_players,
+                   first_correct_rounds, first_correct_seconds
+            FROM question_stats
+        """
+        params: tuple = ()
+        if question_id is not None:
+            sql += " WHERE question_id = ?"
+            params = (question_id,)
+        sql += f" ORDER BY CAST(correct_players AS REAL) / MAX(players, 1) {direction} LIMIT ?"
+        params += (limit,)
+
+        connection = self._connect()
+        try:
+            results = []
+            for (qid, rounds, players, attempts, correct, first_rounds,
+                 first_seconds) in connection.execute(sql, params).fetchall():
+                wrong = connection.execute(
+                    "SELECT guess, count FROM wrong_guesses WHERE question_id = ? ORDER BY count DESC LIMIT ?",
+                    (qid, top_wrong)
+                ).fetchall()
+                results.append({
+                    "question_id": qid,
+                    "rounds": rounds,
+                    "players": players,
+                    "attempts": attempts,
+                    "correct_rate": round(correct / players, 4) if players else None,
+                    "avg_seconds_to_first_correct": round(first_seconds / first_rounds, 2) if first_rounds else None,
+                    "top_wrong_guesses": [{"guess": guess, "count": count} for guess, count in wrong]
+                })
+            return results
+        finally:
+            connection.close()
@@ -0,0 +1,145 @@
+"""
+Directorio de salas de Trivia LAN
+Índice de las salas abiertas (jugadores, estado y host) que el motor actualiza al
+cambiar cada sala, así listar salas no recorre game_state["rooms"]. Las páginas se
+sirven ya serializadas desde una caché de vida corta: muchos teléfonos consultando
+la lista cuestan casi lo mismo que uno
+"""
+
+import json
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Estados de una sala en el directorio
+ROOM_STATES = ("waiting", "playing", "finished")
+
+
+def room_state(room: Dict) -> str:
+    """
+    Estado de la sala para el directorio: esperando, jugando o terminada
+    """
+    if room["game_finished"]:
+        return "finished"
+    return "playing" if room["game_started"] else "waiting"
+
+
+class RoomDirectory:
+    """
+    Índice room_id -> entrada del directorio. Cada cambio real incrementa `version`;
+    una página cacheada se reutiliza mientras la versión no cambie y, si cambió,
+    hasta `ttl` segundos después de la última vez que estaba al día (la lista puede
+    atrasarse como mucho ese tiempo)
+    """
+
+    def __init__(self, ttl: float = 1.0, max_pages: int = 256):
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.entries: Dict[str, Dict] = {}  # Orden de creación de las salas
+        self.version = 0
+        self.pages: Dict[Tuple, Tuple] = {}  # (estado, offset, limit) -> (creada, versión, página, JSON)
+        self.hits = 0
+        self.misses = 0
+        # Totales que se ajustan con cada cambio (para el panel de administración)
+        self.state_counts: Counter = Counter()
+        self.player_count = 0
+
+    # --- Índice (lo actualiza el motor) --------------------------------------
+
+    def update(self, room: Dict):
+        """
+        Actualiza la entrada de la sala; solo cuenta como cambio si algo difiere
+        """
+        host = room["players"].get(room["host"]) if room["host"] else None
+        entry = {
+            "room_id": room["id"],
+            "players": len(room["players"]),
+            "state": room_state(room),
+            "host": host["name"] if host else None,
+            "tournament": room["tournament"],
+            "mega": room["mega"]
+        }
+        previous = self.entries.get(room["id"])
+        if previous != entry:
+            if previous is not None:
+                self.uncount(previous)
+            self.entries[room["id"]] = entry
+            self.state_counts[entry["state"]] += 1
+            self.player_count += entry["players"]
+            self.version += 1
+
+    def remove(self, room_id: str):
+        entry = self.entries.pop(room_id, None)
+        if entry is not None:
+            self.uncount(entry)
+            self.version += 1
+
+    def uncount(self, entry: Dict):
+        self.state_counts[entry["state"]] -= 1
+        self.player_count -= entry["players"]
+
+    def totals(self) -> Dict:
+        """
+        Salas por estado y jugadores en total, sin recorrer el índice
+        """
+        return {
+            "rooms": len(self.entries),
+            "by_state": {state: self.state_counts[state] for state in ROOM_STATES},
+            "players": self.player_count
+        }
+
+    # --- Consulta ----------------------------------------------------------------
+
+    def build_page(self, state: Optional[str], offset: int, limit: int) -> Dict:
+        entries = list(self.entries.values())
+        if state is not None:
+            entries = [entry for entry in entries if entry["state"] == state]
+        return {
+            "total": len(entries),
+            "offset": offset,
+            "limit": limit,
+            "rooms": entries[offset:offset + limit]
+        }
+
+    def cached_page(self, now: float, state: Optional[str], offset: int, limit: int) -> Tuple[Dict, str]:
+        """
+        Página del directorio y su JSON (desde la caché si sigue vigente)
+        """
+        key = (state, offset, limit)
+        cached = self.pages.get(key)
+        if cached is not None and cached[1] == self.version:
+            # Sigue al día: el TTL vuelve a contar desde ahora
+            self.pages[key] = (now,) + cached[1:]
+            self.hits += 1
+            return cached[2], cached[3]
+        if cached is not None and now - cached[0] < self.ttl:
+            self.hits += 1
+            return cached[2], cached[3]
+
+        self.misses += 1
+        data = self.build_page(state, offset, limit)
+        body = json.dumps(data, ensure_ascii=False)
+        if len(self.pages) >= self.max_pages and key not in self.pages:
+            self.pages.clear()  # Demasiadas combinaciones distintas: se empieza de nuevo
+        self.pages[key] = (now, self.version, data, body)
+        return data, body
+
+    def page(self, now: float, state: Optional[str] = None, offset: int = 0, limit: int = 50) -> str:
+        """
+        Página serializada como JSON (para HTTP)
+        """
+        return self.cached_page(now, state, offset, limit)[1]
+
+    def page_data(self, now: float, state: Optional[str] = None, offset: int = 0, limit: int = 50) -> Dict:
+        """
+        Página como dict (para Socket.IO, que serializa por su cuenta)
+        """
+        return self.cached_page(now, state, offset, limit)[0]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "rooms": len(self.entries),
+            "version": self.version,
+            "cached_pages": len(self.pages),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
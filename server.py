@@ -4,39 +4,99 @@ Backend usando FastAPI + python-socketio
 """
 
 import asyncio
-import csv
-import json
 import os
-import random
+import secrets
 import time
-import unicodedata
+from contextlib import asynccontextmanager
 from typing import Dict, List, Optional, Set
 
-import pandas as pd
+# Momento en que empezó a importarse el servidor (para el reporte de arranque)
+IMPORT_STARTED = time.perf_counter()
+
 import socketio
-from fastapi import FastAPI
-from fastapi.responses import FileResponse
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from rapidfuzz import fuzz
 
-# Configuración del juego
-TARGET_POINTS_DEFAULT = 15  # Puntos necesarios para ganar
-ROUND_SECONDS = 30  # Duración de cada ronda en segundos
-FIRST_CORRECT_POINTS = 3  # Puntos para el primero que acierta
-OTHER_CORRECT_POINTS = 1  # Puntos para otros que aciertan
-MAX_SUBMISSIONS_PER_SECOND = 5  # Límite antispam
+from config import GAME_CONFIG, SERVER_CONFIG
+from dashboard import DashboardFeed
+from game_engine import (
+    EventSink, accept_alias_command, build_spectator_update, close_room, configure,
+    create_room, current_time, game_state, get_reap_reason, get_room, join_room_command,
+    leave_room_command, live_stats, match_history, next_round_command, question_stats,
+    reload_questions, room_directory, save_alias, spectator_room, start_game_command,
+    submit_answer_command, unwatch_room_command, verdict_cache, watch_room_command
+)
+from mega_room import (
+    assign_shard_command, get_mega, join_shard_command, leave_mega_command, mega_stats,
+    start_mega_command
+)
+from profiling import (
+    PROFILE_SORTS, LoopLagMonitor, MemoryTracer, collapsed_stacks, cprofile_event_loop, pstats_dump,
+    pstats_text, room_memory, sample_event_loop
+)
+from room_directory import ROOM_STATES
+from tournament import (
+    get_tournament, join_tournament_command, leave_tournament_command,
+    start_tournament_command, tournament_stats
+)
+from wire_format import WireServer
+
+# Configuración del servidor (las reglas del juego están en game_engine.py)
+REAPER_INTERVAL = GAME_CONFIG["REAPER_INTERVAL"]  # Frecuencia de revisión de salas
+SPECTATOR_FLUSH_INTERVAL = GAME_CONFIG["SPECTATOR_FLUSH_INTERVAL"]  # Resumen de actividad para espectadores
+ROOM_COMMAND_BATCH = GAME_CONFIG["ROOM_COMMAND_BATCH"]  # Comandos que procesa el actor de una sala por lote
+
+# Tareas de fondo del servidor (se cancelan al apagar)
+background_tasks: List[asyncio.Task] = []
+
+# Retraso del event loop (se informa en /health) y fotos de memoria para /admin
+loop_lag = LoopLagMonitor(interval=SERVER_CONFIG["LOOP_LAG_INTERVAL"])
+memory_tracer = MemoryTracer()
+
+# Solo un perfil de CPU a la vez
+profile_lock = asyncio.Lock()
 
-# Estado global del juego
-game_state = {
-    "rooms": {},  # room_id -> room_data
-    "questions": [],  # Lista de preguntas cargadas del CSV
-}
+# Foto agregada del servidor que reciben todos los paneles de /admin/dashboard
+dashboard_feed = DashboardFeed()
+DASHBOARD_INTERVAL = SERVER_CONFIG["DASHBOARD_INTERVAL"]
+
+# Transportes de Engine.IO permitidos (sin long-polling si WEBSOCKET_ONLY)
+TRANSPORTS = ["websocket"] if SERVER_CONFIG["WEBSOCKET_ONLY"] else ["polling", "websocket"]
+
+# Eventos que un cliente lento puede perderse (actividad) o recibir solo en su última
+# versión (listas y resúmenes). round_start, round_end y los mensajes personales se
+# entregan siempre
+DROPPABLE_EVENTS = {"player_answered", "player_got_correct", "player_joined", "player_left"}
+COLLAPSIBLE_EVENTS = {"players_update", "spectator_update"}
+
+# Configuración de Socket.IO (JSON o msgpack negociado por cliente)
+sio = WireServer(
+    cors_allowed_origins="*",
+    async_mode="asgi",
+    allow_msgpack=SERVER_CONFIG["ALLOW_MSGPACK"],
+    outbound_queue_limit=SERVER_CONFIG["OUTBOUND_QUEUE_LIMIT"],
+    droppable_events=DROPPABLE_EVENTS,
+    collapsible_events=COLLAPSIBLE_EVENTS,
+    transports=TRANSPORTS,
+    ping_interval=SERVER_CONFIG["PING_INTERVAL"],
+    ping_timeout=SERVER_CONFIG["PING_TIMEOUT"],
+    max_http_buffer_size=SERVER_CONFIG["MAX_HTTP_BUFFER_SIZE"]
+)
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    """
+    Arranque y apagado del servidor. Las preguntas se cargan aquí y no al importar
+    el módulo, así las herramientas y pruebas que lo importan arrancan rápido
+    """
+    await start_background_tasks()
+    yield
+    await stop_background_tasks()
 
-# Configuración de Socket.IO
-sio = socketio.AsyncServer(cors_allowed_origins="*", async_mode="asgi")
 
 # Configuración de FastAPI
-app = FastAPI(title="Trivia LAN Game Server")
+app = FastAPI(title="Trivia LAN Game Server", lifespan=lifespan)
 
 # Montar archivos estáticos
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -46,376 +106,346 @@ app.mount("/images", StaticFiles(directory="data/images"), name="images")
 asgi = socketio.ASGIApp(sio, app)
 
 
-def load_questions() -> List[Dict]:
+class RoomOutbox(EventSink):
     """
-    Carga las preguntas desde el archivo CSV (con soporte para imágenes)
+    Acciones de Socket.IO pendientes de una sala. Los comandos del motor solo cambian
+    el estado y anotan aquí lo que hay que enviar; el actor lo envía cuando el lote terminó
     """
-    questions = []
-    csv_path = os.path.join("data", "items_images.csv")
     
-    if not os.path.exists(csv_path):
-        print(f"⚠️ Archivo {csv_path} no encontrado, intentando con items.csv...")
-        csv_path = os.path.join("data", "items.csv")
-        
-        if not os.path.exists(csv_path):
-            print(f"⚠️ Archivo {csv_path} no encontrado")
-            return questions
+    # Eventos de los que solo importa la última versión dentro de un lote
+    COLLAPSIBLE_EVENTS = {"players_update"}
     
-    try:
-        df = pd.read_csv(csv_path)
-        
-        for _, row in df.iterrows():
-            # Dividir respuestas por punto y coma
-            respuestas = [resp.strip() for resp in str(row['respuestas']).split(';')]
-            
-            question = {
-                'id': int(row['id']),
-                'tipo': str(row['tipo']),
-                'respuestas': respuestas
-            }
-            
-            # Verificar si es formato con imágenes o texto
-            if 'imagen' in df.columns:
-                question['pregunta'] = str(row['pregunta'])
-                question['imagen'] = str(row['imagen'])
-                question['es_imagen'] = True
-            else:
-                question['texto'] = str(row['texto'])
-                question['es_imagen'] = False
-            
-            questions.append(question)
+    def __init__(self):
+        self.actions = []
+    
+    def emit(self, event: str, data: Dict, room):
+        self.actions.append(("emit", event, data, room))
+    
+    def enter_room(self, sid: str, room: str):
+        self.actions.append(("enter", sid, room))
+    
+    def leave_room(self, sid: str, room: str):
+        self.actions.append(("leave", sid, room))
+    
+    def close_room(self, room: str):
+        self.actions.append(("close", room))
+    
+    async def flush(self):
+        """
+        Ejecuta las acciones en orden, enviando solo la última versión de los
+        eventos colapsables para cada destino
+        """
+        actions, self.actions = self.actions, []
         
-        print(f"✅ Cargadas {len(questions)} preguntas desde {csv_path}")
+        last_index = {}
+        for index, action in enumerate(actions):
+            if action[0] == "emit" and action[1] in self.COLLAPSIBLE_EVENTS:
+                last_index[(action[1], str(action[3]))] = index
         
-    except Exception as e:
-        print(f"❌ Error al cargar preguntas: {e}")
-    
-    return questions
+        for index, action in enumerate(actions):
+            kind = action[0]
+            if kind == "emit":
+                _, event, data, room = action
+                if event in self.COLLAPSIBLE_EVENTS and last_index[(event, str(room))] != index:
+                    continue
+                await sio.emit(event, data, room=room)
+            elif kind == "enter":
+                await sio.enter_room(action[1], action[2])
+            elif kind == "leave":
+                await sio.leave_room(action[1], action[2])
+            elif kind == "close":
+                await sio.close_room(action[1])
 
 
-def normalize_text(text: str) -> str:
+async def run_room_command(room_id: str, command, *args):
     """
-    Normaliza texto eliminando tildes y convirtiendo a minúsculas
+    Encola un comando en el actor de la sala y espera su resultado. Todos los
+    cambios de estado de una sala pasan por aquí, así que nunca se intercalan
     """
-    # Remover tildes
-    text = unicodedata.normalize('NFD', text)
-    text = ''.join(char for char in text if unicodedata.category(char) != 'Mn')
-    # Convertir a minúsculas y eliminar espacios extra
-    return text.lower().strip()
+    room = get_room(room_id)
+    if not room:
+        return None
+    
+    if room["command_queue"] is None:
+        room["command_queue"] = asyncio.Queue()
+    
+    future = asyncio.get_running_loop().create_future()
+    room["command_queue"].put_nowait((command, args, future))
+    
+    if room["actor_task"] is None or room["actor_task"].done():
+        room["actor_task"] = asyncio.create_task(room_actor(room_id, room))
+    
+    return await future
 
 
-def check_answer(user_answer: str, correct_answers: List[str]) -> bool:
+async def room_actor(room_id: str, room: Dict):
     """
-    Verifica si la respuesta del usuario es correcta usando coincidencia difusa
+    Procesa los comandos de una sala de a uno por vez. Toma en lote los que ya
+    estén esperando y envía sus eventos juntos al terminar el lote
     """
-    user_normalized = normalize_text(user_answer)
+    queue = room["command_queue"]
     
-    for correct in correct_answers:
-        correct_normalized = normalize_text(correct)
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < ROOM_COMMAND_BATCH and not queue.empty():
+            batch.append(queue.get_nowait())
         
-        # Coincidencia exacta
-        if user_normalized == correct_normalized:
-            return True
+        outbox = RoomOutbox()
+        outcomes = []
+        for command, args, future in batch:
+            try:
+                outcomes.append((future, command(room_id, outbox, *args), None))
+            except Exception as e:
+                outcomes.append((future, None, e))
         
-        # Coincidencia difusa con umbral del 90%
-        similarity = fuzz.ratio(user_normalized, correct_normalized)
-        if similarity >= 90:
-            return True
-    
-    return False
-
-
-def create_room(room_id: str, host_sid: str) -> Dict:
-    """
-    Crea una nueva sala de juego
-    """
-    room_data = {
-        "id": room_id,
-        "host": host_sid,
-        "players": {},  # sid -> player_data
-        "game_started": False,
-        "current_question": None,
-        "round_start_time": None,
-        "round_timer_task": None,  # Tarea asyncio para cancelar
-        "target_points": TARGET_POINTS_DEFAULT,
-        "round_answers": {},  # sid -> lista de respuestas con timestamps
-        "round_correct_players": set(),  # jugadores que ya acertaron en esta ronda
-        "player_submission_times": {},  # sid -> lista de timestamps para antispam
-        "used_questions": set(),  # IDs de preguntas ya usadas
-        "game_finished": False,
-        "winner": None
-    }
-    
-    game_state["rooms"][room_id] = room_data
-    return room_data
+        try:
+            await outbox.flush()
+        except Exception as e:
+            print(f"❌ Error enviando eventos de la sala {room_id}: {e}")
+        
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        
+        # La sala fue eliminada por alguno de los comandos: el actor termina
+        if queue.empty() and get_room(room_id) is not room:
+            room["actor_task"] = None
+            return
 
 
-def get_room(room_id: str) -> Optional[Dict]:
+# Comandos disparados por timers del motor (fin de ronda) en vuelo
+timer_commands: Set[asyncio.Task] = set()
+
+
+def dispatch_room_command(room_id: str, command, *args):
     """
-    Obtiene los datos de una sala
+    Pasa por el actor de la sala los comandos que el motor dispara desde un timer
     """
-    return game_state["rooms"].get(room_id)
+    task = asyncio.create_task(run_room_command(room_id, command, *args))
+    timer_commands.add(task)
+    task.add_done_callback(timer_commands.discard)
+
 
+# Escrituras al CSV del banco en curso (respuestas aceptadas por un host)
+alias_writes: Set[asyncio.Task] = set()
 
-def add_player_to_room(room_id: str, sid: str, player_name: str) -> bool:
+
+async def write_alias(question_id: int, alias: str):
     """
-    Agrega un jugador a una sala
+    Escribe la respuesta en el CSV en un hilo (si falla solo se informa)
+    """
+    try:
+        await asyncio.to_thread(save_alias, question_id, alias)
+    except Exception as e:
+        print(f"❌ No se pudo guardar la respuesta '{alias}' de la pregunta {question_id}: {e}")
+
+
+def persist_alias_in_background(question_id: int, alias: str):
+    """
+    Guarda en el banco una respuesta aceptada por un host sin frenar el event loop
+    """
+    task = asyncio.create_task(write_alias(question_id, alias))
+    alias_writes.add(task)
+    task.add_done_callback(alias_writes.discard)
+
+
+configure(dispatch=dispatch_room_command,
+          persist_alias=persist_alias_in_background if GAME_CONFIG["SHARE_HOST_ALIASES"] else None)
+
+
+async def run_tournament_command(tournament_id: str, command, *args):
+    """
+    Ejecuta un comando de torneo (inscripción, inicio) y envía sus eventos. Solo
+    toca salas que el propio comando crea, así que no necesita pasar por un actor
+    """
+    outbox = RoomOutbox()
+    result = command(tournament_id, outbox, *args)
+    await outbox.flush()
+    return result
+
+
+async def run_mega_command(mega_id: str, command, *args):
+    """
+    Ejecuta un comando del coordinador de una partida masiva y envía sus eventos.
+    Lo que cambia dentro de un fragmento pasa por el actor de ese fragmento
+    """
+    outbox = RoomOutbox()
+    result = command(mega_id, outbox, *args)
+    await outbox.flush()
+    return result
+
+
+def remove_stale_players(room_id: str, outbox: RoomOutbox) -> int:
+    """
+    Elimina jugadores cuya conexión ya no existe (desconexiones no notificadas). Pasa
+    por leave_room_command como una desconexión normal: los demás se enteran y la
+    ronda termina si los que quedan ya acertaron
     """
     room = get_room(room_id)
     if not room:
-        return False
+        return 0
     
-    # Verificar que el nombre no esté en uso
-    for player_data in room["players"].values():
-        if player_data["name"].lower() == player_name.lower():
-            return False
+    stale = [sid for sid in room["players"] if not sio.manager.is_connected(sid, "/")]
+    for sid in stale:
+        leave_room_command(room_id, outbox, sid)
     
-    room["players"][sid] = {
-        "name": player_name,
-        "score": 0,
-        "connected": True
-    }
-    
-    return True
+    return len(stale)
 
 
-def remove_player_from_room(room_id: str, sid: str):
+def reap_room_command(room_id: str, outbox: RoomOutbox, now: float):
     """
-    Elimina un jugador de una sala
+    Quita jugadores sin conexión y cierra la sala si está inactiva, terminada o vacía
     """
+    remove_stale_players(room_id, outbox)
     room = get_room(room_id)
     if not room:
         return
     
-    if sid in room["players"]:
-        del room["players"][sid]
-    
-    # Si era el host, asignar nuevo host o eliminar sala
-    if room["host"] == sid:
-        if room["players"]:
-            # Asignar nuevo host al primer jugador
-            room["host"] = list(room["players"].keys())[0]
-        else:
-            # Eliminar sala vacía
-            del game_state["rooms"][room_id]
+    reason = get_reap_reason(room, now)
+    if reason:
+        close_room(room_id, outbox, reason)
 
 
-def get_random_question(used_questions: Set[int]) -> Optional[Dict]:
+async def reap_rooms():
     """
-    Obtiene una pregunta aleatoria que no haya sido usada
+    Revisa periódicamente las salas y cierra las inactivas, terminadas o vacías
     """
-    if not game_state["questions"]:
-        return None
-    
-    # Filtrar preguntas no usadas
-    available_questions = [q for q in game_state["questions"] if q["id"] not in used_questions]
-    
-    # Si no hay preguntas disponibles, reiniciar la lista
-    if not available_questions:
-        available_questions = game_state["questions"]
-        used_questions.clear()
-    
-    return random.choice(available_questions)
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        try:
+            now = current_time()
+            for room_id in list(game_state["rooms"].keys()):
+                await run_room_command(room_id, reap_room_command, now)
+        except Exception as e:
+            print(f"❌ Error en limpieza de salas: {e}")
 
 
-async def start_round(room_id: str):
+async def flush_spectator_updates():
     """
-    Inicia una nueva ronda en una sala
+    Envía a los espectadores, como máximo una vez por intervalo, el resumen de las
+    salas que tuvieron actividad (en vez de reenviarles cada evento individual)
     """
-    room = get_room(room_id)
-    if not room or room["game_finished"]:
-        return
-    
-    # Cancelar cualquier timer anterior
-    if room["round_timer_task"] and not room["round_timer_task"].done():
-        room["round_timer_task"].cancel()
-    
-    # Seleccionar pregunta aleatoria que no haya sido usada
-    question = get_random_question(room["used_questions"])
-    if not question:
-        await sio.emit("error", {"message": "No hay preguntas disponibles"}, room=room_id)
-        return
-    
-    # Marcar pregunta como usada
-    room["used_questions"].add(question["id"])
-    
-    # Configurar ronda
-    room["current_question"] = question
-    room["round_start_time"] = time.time()
-    room["round_answers"] = {}
-    room["round_correct_players"] = set()
-    room["player_submission_times"] = {}
-    
-    # Enviar pregunta a todos los jugadores
-    question_data = {
-        "id": question["id"],
-        "tipo": question["tipo"],
-        "duration": ROUND_SECONDS,
-        "es_imagen": question.get("es_imagen", False)
+    while True:
+        await asyncio.sleep(SPECTATOR_FLUSH_INTERVAL)
+        dirty_rooms = game_state["spectator_dirty_rooms"]
+        if not dirty_rooms:
+            continue
+        
+        game_state["spectator_dirty_rooms"] = set()
+        for room_id in dirty_rooms:
+            room = get_room(room_id)
+            if room and room["spectators"]:
+                try:
+                    await sio.emit("spectator_update", build_spectator_update(room),
+                                 room=spectator_room(room_id))
+                except Exception as e:
+                    print(f"❌ Error enviando resumen a espectadores: {e}")
+
+
+def dashboard_snapshot() -> Dict:
+    """
+    Estado agregado de todo el servidor. Sale de contadores que se actualizan con
+    cada cambio, así armarlo no depende de cuántas salas haya
+    """
+    directory = room_directory.totals()
+    return {
+        "time": time.time(),
+        "rooms": directory["rooms"],
+        "rooms_by_state": directory["by_state"],
+        "players": directory["players"],
+        "tournaments": len(game_state["tournaments"]),
+        "mega_rooms": len(game_state["mega_rooms"]),
+        "answers": live_stats.sample(time.perf_counter()),
+        "loop_lag": loop_lag.stats(),
+        "dashboards": dashboard_feed.subscribers
     }
-    
-    # Agregar texto o imagen según el tipo de pregunta
-    if question.get("es_imagen", False):
-        question_data["pregunta"] = question["pregunta"]
-        # Convertir ruta relativa a URL absoluta si es necesario
-        imagen = question["imagen"]
-        if not imagen.startswith("http"):
-            question_data["imagen"] = f"/images/{imagen.replace('images/', '')}"
-        else:
-            question_data["imagen"] = imagen
-    else:
-        question_data["texto"] = question["texto"]
-    
-    await sio.emit("round_start", question_data, room=room_id)
-    
-    # Programar fin de ronda con una tarea que podamos cancelar
-    room["round_timer_task"] = asyncio.create_task(schedule_round_end(room_id))
 
 
-async def schedule_round_end(room_id: str):
+async def publish_dashboard():
     """
-    Programa el fin de ronda después del tiempo límite
+    Publica la foto del panel una vez por intervalo (la misma para todos los paneles)
     """
-    try:
-        await asyncio.sleep(ROUND_SECONDS)
-        room = get_room(room_id)
-        if room and room["current_question"]:  # Solo terminar si la ronda sigue activa
-            await end_round(room_id)
-    except asyncio.CancelledError:
-        # La tarea fue cancelada, esto es normal cuando la ronda termina anticipadamente
-        pass
+    while True:
+        await asyncio.sleep(DASHBOARD_INTERVAL)
+        try:
+            dashboard_feed.publish(dashboard_snapshot())
+        except Exception as e:
+            print(f"❌ Error armando el panel de administración: {e}")
 
 
-async def end_round(room_id: str):
+async def flush_collapsed_events():
     """
-    Finaliza la ronda actual y calcula puntuaciones
+    Reintenta periódicamente los eventos colapsados de clientes lentos
     """
-    room = get_room(room_id)
-    if not room or not room["current_question"]:
-        return
-    
-    # Cancelar el timer si está activo
-    if room["round_timer_task"] and not room["round_timer_task"].done():
-        room["round_timer_task"].cancel()
-    
-    question = room["current_question"]
-    correct_answers = []
-    
-    # Procesar todas las respuestas de todos los jugadores
-    for sid, answer_list in room["round_answers"].items():
-        if sid in room["players"]:
-            player_name = room["players"][sid]["name"]
-            
-            # Buscar la primera respuesta correcta de este jugador
-            first_correct = None
-            for answer_data in answer_list:
-                user_answer = answer_data["answer"]
-                is_correct = check_answer(user_answer, question["respuestas"])
-                
-                if is_correct:
-                    first_correct = {
-                        "sid": sid,
-                        "name": player_name,
-                        "answer": user_answer,
-                        "timestamp": answer_data["timestamp"]
-                    }
-                    break
-            
-            if first_correct:
-                correct_answers.append(first_correct)
-    
-    # Ordenar por timestamp (primero en responder correctamente)
-    correct_answers.sort(key=lambda x: x["timestamp"])
-    
-    # Asignar puntos: 3 al primero, 1 a los demás
-    round_results = []
-    for i, answer in enumerate(correct_answers):
-        sid = answer["sid"]
-        is_first = (i == 0)
-        points = FIRST_CORRECT_POINTS if is_first else OTHER_CORRECT_POINTS
-        
-        room["players"][sid]["score"] += points
-        
-        round_results.append({
-            "rank": i + 1,
-            "name": answer["name"],
-            "answer": answer["answer"],
-            "points": points,
-            "is_first": is_first
-        })
-    
-    # Verificar si alguien ganó
-    winner = None
-    for sid, player_data in room["players"].items():
-        if player_data["score"] >= room["target_points"]:
-            winner = player_data["name"]
-            room["game_finished"] = True
-            room["winner"] = winner
-            break
-    
-    # Preparar datos del resultado
-    round_end_data = {
-        "question": {
-            "respuestas_correctas": question["respuestas"]
-        },
-        "results": round_results,
-        "scores": {player["name"]: player["score"] for player in room["players"].values()},
-        "game_finished": room["game_finished"],
-        "winner": winner
-    }
-    
-    # Agregar texto o pregunta según el tipo
-    if question.get("es_imagen", False):
-        round_end_data["question"]["pregunta"] = question["pregunta"]
+    while True:
+        await asyncio.sleep(SERVER_CONFIG["BACKPRESSURE_FLUSH_INTERVAL"])
+        try:
+            await sio.flush_collapsed()
+        except Exception as e:
+            print(f"❌ Error enviando eventos colapsados: {e}")
+
+
+def load_question_bank():
+    """
+    Carga las preguntas (y los metadatos de sus imágenes) en el estado del juego
+    """
+    print("🚀 Cargando preguntas del sistema...")
+    reload_questions()
+    if not game_state["questions"]:
+        print("⚠️ ADVERTENCIA: No se pudieron cargar preguntas. Verifica data/items.csv")
     else:
-        round_end_data["question"]["texto"] = question["texto"]
-    
-    # Enviar resultados
-    await sio.emit("round_end", round_end_data, room=room_id)
-    
-    # Limpiar estado de ronda
-    room["current_question"] = None
-    room["round_start_time"] = None
-    room["round_answers"] = {}
-    room["round_correct_players"] = set()
-    room["player_submission_times"] = {}
-    room["round_timer_task"] = None
+        print(f"✅ Sistema listo con {len(game_state['questions'])} preguntas")
 
 
-def is_rate_limited(room: Dict, sid: str) -> bool:
+async def start_background_tasks():
     """
-    Verifica si un jugador está enviando demasiadas respuestas (antispam)
+    Carga las preguntas y arranca las tareas de mantenimiento del servidor
     """
-    current_time = time.time()
-    
-    if sid not in room["player_submission_times"]:
-        room["player_submission_times"][sid] = []
-    
-    # Filtrar timestamps de la última segundo
-    recent_submissions = [
-        t for t in room["player_submission_times"][sid]
-        if current_time - t < 1.0
-    ]
-    
-    room["player_submission_times"][sid] = recent_submissions
-    
-    return len(recent_submissions) >= MAX_SUBMISSIONS_PER_SECOND
+    load_question_bank()
+    background_tasks.append(asyncio.create_task(reap_rooms()))
+    background_tasks.append(asyncio.create_task(flush_spectator_updates()))
+    background_tasks.append(asyncio.create_task(flush_collapsed_events()))
+    background_tasks.append(asyncio.create_task(question_stats.run()))
+    background_tasks.append(asyncio.create_task(loop_lag.run()))
+    background_tasks.append(asyncio.create_task(publish_dashboard()))
+    try:
+        await question_stats.load()
+    except Exception as e:
+        print(f"⚠️ No se pudieron cargar las estadísticas de preguntas: {e}")
+    print_startup_report()
 
 
-async def check_round_completion(room_id: str):
+def print_startup_report():
     """
-    Verifica si todos los jugadores han acertado para terminar la ronda anticipadamente
+    Muestra cuánto tardó el arranque y con qué componentes corre el servidor
     """
-    room = get_room(room_id)
-    if not room or not room["current_question"]:
-        return
+    loop_module = type(asyncio.get_running_loop()).__module__
+    loop_name = "uvloop" if loop_module.startswith("uvloop") else "asyncio"
+    ready_ms = (time.perf_counter() - IMPORT_STARTED) * 1000
     
-    total_players = len(room["players"])
-    correct_players = len(room["round_correct_players"])
-    
-    # Si todos los jugadores han acertado, terminar la ronda
-    if correct_players >= total_players:
-        await end_round(room_id)
+    print(f"⏱️ Servidor listo en {ready_ms:.0f} ms "
+          f"(importación {IMPORT_SECONDS * 1000:.0f} ms)")
+    print(f"   loop={loop_name} · transportes={'/'.join(TRANSPORTS)} · "
+          f"formatos={'/'.join(sio.wire_formats_offered)} · "
+          f"preguntas={len(game_state['questions'])}")
+
+
+async def stop_background_tasks():
+    """
+    Detiene las tareas de mantenimiento del servidor
+    """
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    await question_stats.flush()
+    if alias_writes:
+        await asyncio.gather(*alias_writes)
+
+
 @app.get("/")
 async def root():
     """
@@ -433,7 +463,241 @@ async def health():
     """
     Endpoint de salud
     """
-    return {"status": "ok", "rooms": len(game_state["rooms"]), "questions": len(game_state["questions"])}
+    return {
+        "status": "ok",
+        "rooms": len(game_state["rooms"]),
+        "questions": len(game_state["questions"]),
+        "wire": sio.wire_stats(),
+        "backpressure": sio.backpressure_stats(),
+        "verdict_cache": verdict_cache.stats(),
+        "history": match_history.stats(),
+        "directory": room_directory.stats(),
+        "loop_lag": loop_lag.stats()
+    }
+
+
+@app.get("/wire")
+async def wire():
+    """
+    Formatos de transmisión y transportes que ofrece el servidor
+    """
+    return {"formats": sio.wire_formats_offered, "transports": TRANSPORTS}
+
+
+@app.get("/stats/questions")
+async def questions_stats(order: str = "hardest", limit: int = 50):
+    """
+    Estadísticas de las preguntas más difíciles (order=hardest) o más fáciles (order=easiest)
+    """
+    return await question_stats.query(order=order, limit=max(1, min(limit, 500)))
+
+
+@app.get("/stats/questions/{question_id}")
+async def question_stats_detail(question_id: int):
+    """
+    Estadísticas de una pregunta: intentos, tasa de acierto, tiempo hasta el primer
+    acierto y respuestas incorrectas más comunes
+    """
+    results = await question_stats.query(question_id=question_id, limit=1, top_wrong=10)
+    if not results:
+        return {"question_id": question_id, "rounds": 0}
+    return results[0]
+
+
+def directory_page_args(state: Optional[str], offset: int, limit: int):
+    """
+    Valida el estado y acota offset/limit (así la caché no crece con valores arbitrarios)
+    """
+    if state is not None and state not in ROOM_STATES:
+        raise ValueError(f"Estado no válido ({', '.join(ROOM_STATES)})")
+    return state, max(0, offset), max(1, min(limit, GAME_CONFIG["DIRECTORY_PAGE_SIZE"]))
+
+
+@app.get("/rooms")
+async def rooms(state: Optional[str] = None, offset: int = 0, limit: int = GAME_CONFIG["DIRECTORY_PAGE_SIZE"]):
+    """
+    Directorio de salas abiertas (jugadores, estado y host), paginado. Se sirve desde
+    una caché de vida corta, así que puede atrasarse hasta DIRECTORY_CACHE_TTL segundos
+    """
+    try:
+        args = directory_page_args(state, offset, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=room_directory.page(current_time(), *args), media_type="application/json")
+
+
+# Formatos de /history/export: (tipo de contenido, extensión del archivo)
+HISTORY_FORMATS = {"ndjson": ("application/x-ndjson", "ndjson"), "csv": ("text/csv", "csv")}
+
+
+@app.get("/history/export")
+async def history_export(format: str = "ndjson", room_id: Optional[str] = None):
+    """
+    Exporta el historial de partidas (rondas, respuestas con su veredicto y
+    puntuaciones) como NDJSON o CSV. Se genera por partes mientras se envía
+    """
+    if format not in HISTORY_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato no soportado (ndjson o csv)")
+    
+    media_type, extension = HISTORY_FORMATS[format]
+    filename = f"historial-{room_id}.{extension}" if room_id else f"historial.{extension}"
+    return StreamingResponse(
+        match_history.stream(format, room_id),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.get("/tournaments")
+async def tournaments():
+    """
+    Resumen de todos los torneos (etapa, salas en juego y rondas/s agregadas)
+    """
+    return [tournament_stats(tournament) for tournament in game_state["tournaments"].values()]
+
+
+@app.get("/tournaments/{tournament_id}")
+async def tournament_detail(tournament_id: str):
+    """
+    Estado de un torneo y de las salas de su etapa actual
+    """
+    tournament = get_tournament(tournament_id)
+    if not tournament:
+        raise HTTPException(status_code=404, detail="Torneo no encontrado")
+    
+    rooms = []
+    for room_id in tournament["stage_rooms"]:
+        room = get_room(room_id)
+        if room:
+            rooms.append({
+                "room_id": room_id,
+                "players": len(room["players"]),
+                "round_number": room["round_number"],
+                "finished": room["game_finished"],
+                "winner": room["winner"]
+            })
+    return {**tournament_stats(tournament), "stage_rooms": rooms}
+
+
+@app.get("/mega/{mega_id}")
+async def mega_detail(mega_id: str):
+    """
+    Estado de una partida masiva: jugadores, fragmentos, ronda y leaderboard global
+    """
+    mega = get_mega(mega_id)
+    if not mega:
+        raise HTTPException(status_code=404, detail="Partida no encontrada")
+    return mega_stats(mega)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None), token: Optional[str] = None):
+    """
+    Los endpoints /admin solo responden con el token de SERVER_CONFIG["ADMIN_TOKEN"]
+    (encabezado X-Admin-Token o ?token=); sin token configurado no existen
+    """
+    expected = SERVER_CONFIG["ADMIN_TOKEN"]
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = x_admin_token or token or ""
+    if not secrets.compare_digest(supplied.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
+
+# Formatos de /admin/profile: modo -> formatos que acepta (el primero es el predeterminado)
+PROFILE_FORMATS = {"sample": ("collapsed",), "cprofile": ("text", "pstats")}
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def admin_profile(seconds: float = 10, mode: str = "sample", format: Optional[str] = None,
+                        interval_ms: float = 5, sort: str = "cumulative", limit: int = 40):
+    """
+    Perfil de CPU del event loop durante `seconds` segundos.
+    mode=sample (por defecto) muestrea la pila desde otro hilo y casi no frena al
+    servidor: devuelve pilas colapsadas para flamegraph.pl o speedscope.
+    mode=cprofile registra cada llamada (más preciso, pero más lento mientras dura):
+    format=text muestra las funciones más costosas y format=pstats descarga el perfil
+    """
+    if mode not in PROFILE_FORMATS:
+        raise HTTPException(status_code=400, detail="Modo no soportado (sample o cprofile)")
+    format = format or PROFILE_FORMATS[mode][0]
+    if format not in PROFILE_FORMATS[mode]:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado para {mode}")
+    if sort not in PROFILE_SORTS:
+        raise HTTPException(status_code=400, detail="Orden no soportado (ej: cumulative, tottime)")
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="Ya hay un perfil en curso")
+    
+    seconds = max(0.1, min(seconds, SERVER_CONFIG["PROFILE_MAX_SECONDS"]))
+    async with profile_lock:
+        if mode == "sample":
+            counts = await sample_event_loop(seconds, max(1.0, interval_ms) / 1000)
+            return PlainTextResponse(collapsed_stacks(counts))
+        
+        stats = await cprofile_event_loop(seconds)
+        if format == "pstats":
+            return Response(content=pstats_dump(stats), media_type="application/octet-stream",
+                            headers={"Content-Disposition": 'attachment; filename="trivia.pstats"'})
+        return PlainTextResponse(pstats_text(stats, sort, max(1, limit)))
+
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def admin_memory(top: int = 20):
+    """
+    Tamaño estimado de players, round_answers y used_questions por sala y, si el
+    rastreo está activo, las líneas con más memoria asignada (y cuánto crecieron
+    desde la primera foto)
+    """
+    top = max(1, min(top, 200))
+    return {
+        "rooms": await room_memory(game_state["rooms"], top),
+        "tracemalloc": await asyncio.to_thread(memory_tracer.snapshot, top)
+    }
+
+
+@app.post("/admin/memory/trace", dependencies=[Depends(require_admin)])
+async def admin_memory_trace_start(frames: int = 1):
+    """
+    Activa tracemalloc (cada asignación cuesta algo más mientras esté activo)
+    """
+    memory_tracer.start(max(1, min(frames, 25)))
+    return {"tracing": True}
+
+
+@app.delete("/admin/memory/trace", dependencies=[Depends(require_admin)])
+async def admin_memory_trace_stop():
+    """
+    Desactiva tracemalloc y descarta la foto base
+    """
+    memory_tracer.stop()
+    return {"tracing": False}
+
+
+@app.get("/admin/loop", dependencies=[Depends(require_admin)])
+async def admin_loop():
+    """
+    Retraso del event loop y tareas pendientes
+    """
+    return {**loop_lag.stats(), "tasks": len(asyncio.all_tasks())}
+
+
+@app.get("/admin/dashboard", dependencies=[Depends(require_admin)])
+async def admin_dashboard():
+    """
+    Panel en vivo (usa el mismo ?token= para conectarse a /admin/stream)
+    """
+    return FileResponse("static/admin.html")
+
+
+@app.get("/admin/stream", dependencies=[Depends(require_admin)])
+async def admin_stream():
+    """
+    Eventos SSE con la foto agregada del servidor, una vez por DASHBOARD_INTERVAL
+    """
+    return StreamingResponse(
+        dashboard_feed.stream(SERVER_CONFIG["DASHBOARD_STREAM_SECONDS"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @sio.event
@@ -451,18 +715,25 @@ async def disconnect(sid):
     """
     print(f"🔌 Cliente desconectado: {sid}")
     
+    spectated_room_id = game_state["spectators"].get(sid)
+    if spectated_room_id is not None:
+        await run_room_command(spectated_room_id, leave_room_command, sid)
+    
     # Remover jugador de todas las salas
     for room_id in list(game_state["rooms"].keys()):
         room = get_room(room_id)
         if room and sid in room["players"]:
-            player_name = room["players"][sid]["name"]
-            remove_player_from_room(room_id, sid)
-            
-            # Notificar a otros jugadores
-            await sio.emit("player_left", {"name": player_name}, room=room_id)
-            await sio.emit("players_update", 
-                         {"players": list(room["players"].values())}, 
-                         room=room_id)
+            await run_room_command(room_id, leave_room_command, sid)
+    
+    # Liberar el nombre en las partidas masivas (su fragmento ya lo quitó de la sala)
+    for mega_id, mega in list(game_state["mega_rooms"].items()):
+        if sid in mega["players"]:
+            await run_mega_command(mega_id, leave_mega_command, sid)
+    
+    # Dar de baja de los torneos que aún están en inscripción
+    for tournament_id, tournament in list(game_state["tournaments"].items()):
+        if sid in tournament["players"] and tournament["status"] == "registering":
+            await run_tournament_command(tournament_id, leave_tournament_command, sid)
 
 
 @sio.event
@@ -478,41 +749,64 @@ async def join_room(sid, data):
             await sio.emit("error", {"message": "Nombre de sala y jugador requeridos"}, room=sid)
             return
         
-        # Crear sala si no existe
-        room = get_room(room_id)
-        if not room:
-            room = create_room(room_id, sid)
+        # Token de sesión del cliente: permite recuperar el lugar al reconectarse
+        token = data.get("token")
+        if not isinstance(token, str) or not 0 < len(token) <= 64:
+            token = None
         
-        # Intentar agregar jugador
-        if not add_player_to_room(room_id, sid, player_name):
-            await sio.emit("error", {"message": "Nombre de jugador ya en uso"}, room=sid)
-            return
+        # Crear sala si no existe (solo si se pidió: create=False evita crear salas
+        # por un nombre mal escrito)
+        if not get_room(room_id):
+            if not data.get("create", True):
+                await sio.emit("error", {"message": "Sala no encontrada"}, room=sid)
+                return
+            create_room(room_id, sid)
         
-        # Unir jugador a la sala de Socket.IO
-        await sio.enter_room(sid, room_id)
+        await run_room_command(room_id, join_room_command, sid, player_name, token)
         
-        # Determinar si es el host
-        is_host = (room["host"] == sid)
+    except Exception as e:
+        print(f"❌ Error en join_room: {e}")
+        await sio.emit("error", {"message": "Error al unirse a la sala"}, room=sid)
+
+
+@sio.event
+async def list_rooms(sid, data):
+    """
+    Envía una página del directorio de salas (el mismo contenido que /rooms)
+    """
+    try:
+        data = data or {}
+        args = directory_page_args(data.get("state"), int(data.get("offset", 0)),
+                                   int(data.get("limit", GAME_CONFIG["DIRECTORY_PAGE_SIZE"])))
+        await sio.emit("room_list", room_directory.page_data(current_time(), *args), room=sid)
         
-        # Confirmar unión
-        await sio.emit("room_joined", {
-            "room_id": room_id,
-            "player_name": player_name,
-            "is_host": is_host,
-            "game_started": room["game_started"]
-        }, room=sid)
+    except (TypeError, ValueError):
+        await sio.emit("error", {"message": "Consulta de salas no válida"}, room=sid)
+
+
+@sio.event
+async def watch_room(sid, data):
+    """
+    Une a un espectador a una sala existente: no juega, no aparece en la lista de
+    jugadores y solo recibe inicio/fin de ronda y resúmenes agregados
+    """
+    try:
+        room_id = data.get("room_id", "").strip()
+        
+        if not get_room(room_id):
+            await sio.emit("error", {"message": "Sala no encontrada"}, room=sid)
+            return
         
-        # Notificar a otros jugadores
-        await sio.emit("player_joined", {"name": player_name}, room=room_id)
-        await sio.emit("players_update", 
-                     {"players": list(room["players"].values())}, 
-                     room=room_id)
+        # Un espectador mira una sola sala a la vez
+        previous_room_id = game_state["spectators"].get(sid)
+        if previous_room_id is not None and previous_room_id != room_id:
+            await run_room_command(previous_room_id, unwatch_room_command, sid)
         
-        print(f"👤 {player_name} se unió a la sala {room_id}")
+        await run_room_command(room_id, watch_room_command, sid)
         
     except Exception as e:
-        print(f"❌ Error en join_room: {e}")
-        await sio.emit("error", {"message": "Error al unirse a la sala"}, room=sid)
+        print(f"❌ Error en watch_room: {e}")
+        await sio.emit("error", {"message": "Error al unirse como espectador"}, room=sid)
 
 
 @sio.event
@@ -522,40 +816,12 @@ async def start_game(sid, data):
     """
     try:
         room_id = data.get("room_id")
-        room = get_room(room_id)
         
-        if not room:
+        if not get_room(room_id):
             await sio.emit("error", {"message": "Sala no encontrada"}, room=sid)
             return
         
-        if room["host"] != sid:
-            await sio.emit("error", {"message": "Solo el host puede iniciar el juego"}, room=sid)
-            return
-        
-        if len(room["players"]) < 1:
-            await sio.emit("error", {"message": "Se necesita al menos 1 jugador"}, room=sid)
-            return
-        
-        if room["game_started"]:
-            await sio.emit("error", {"message": "El juego ya está iniciado"}, room=sid)
-            return
-        
-        # Iniciar juego
-        room["game_started"] = True
-        room["game_finished"] = False
-        room["winner"] = None
-        
-        # Reiniciar puntuaciones y lista de preguntas usadas
-        for player in room["players"].values():
-            player["score"] = 0
-        room["used_questions"] = set()  # Resetear preguntas usadas
-        
-        await sio.emit("game_started", {}, room=room_id)
-        
-        # Iniciar primera ronda
-        await start_round(room_id)
-        
-        print(f"🎮 Juego iniciado en sala {room_id}")
+        await run_room_command(room_id, start_game_command, sid)
         
     except Exception as e:
         print(f"❌ Error en start_game: {e}")
@@ -569,26 +835,12 @@ async def next_round(sid, data):
     """
     try:
         room_id = data.get("room_id")
-        room = get_room(room_id)
         
-        if not room:
+        if not get_room(room_id):
             await sio.emit("error", {"message": "Sala no encontrada"}, room=sid)
             return
         
-        if room["host"] != sid:
-            await sio.emit("error", {"message": "Solo el host puede iniciar rondas"}, room=sid)
-            return
-        
-        if not room["game_started"] or room["game_finished"]:
-            await sio.emit("error", {"message": "El juego no está activo"}, room=sid)
-            return
-        
-        if room["current_question"]:
-            await sio.emit("error", {"message": "Ya hay una ronda en curso"}, room=sid)
-            return
-        
-        # Iniciar nueva ronda
-        await start_round(room_id)
+        await run_room_command(room_id, next_round_command, sid)
         
     except Exception as e:
         print(f"❌ Error en next_round: {e}")
@@ -604,100 +856,169 @@ async def submit_answer(sid, data):
         room_id = data.get("room_id")
         answer = data.get("answer", "").strip()
         
-        room = get_room(room_id)
-        if not room:
+        if not get_room(room_id):
             await sio.emit("error", {"message": "Sala no encontrada"}, room=sid)
             return
         
-        if sid not in room["players"]:
-            await sio.emit("error", {"message": "No estás en esta sala"}, room=sid)
+        await run_room_command(room_id, submit_answer_command, sid, answer)
+        
+    except Exception as e:
+        print(f"❌ Error en submit_answer: {e}")
+        await sio.emit("error", {"message": "Error al enviar respuesta"}, room=sid)
+
+
+@sio.event
+async def accept_alias(sid, data):
+    """
+    El host acepta como válida una respuesta que el banco no tenía (solo el host)
+    """
+    try:
+        room_id = data.get("room_id")
+        alias = data.get("alias", "").strip()
+        
+        if not get_room(room_id):
+            await sio.emit("error", {"message": "Sala no encontrada"}, room=sid)
             return
         
-        if not room["current_question"]:
-            await sio.emit("error", {"message": "No hay ronda activa"}, room=sid)
+        await run_room_command(room_id, accept_alias_command, sid, alias)
+        
+    except Exception as e:
+        print(f"❌ Error en accept_alias: {e}")
+        await sio.emit("error", {"message": "Error al aceptar la respuesta"}, room=sid)
+
+
+@sio.event
+async def join_tournament(sid, data):
+    """
+    Inscribe a un jugador en un torneo (lo crea si no existe)
+    """
+    try:
+        tournament_id = data.get("tournament_id", "").strip()
+        player_name = data.get("player_name", "").strip()
+        
+        if not tournament_id or not player_name:
+            await sio.emit("error", {"message": "Nombre de torneo y jugador requeridos"}, room=sid)
             return
         
-        # Verificar si el jugador ya acertó en esta ronda
-        if sid in room["round_correct_players"]:
-            await sio.emit("error", {"message": "Ya acertaste en esta ronda"}, room=sid)
+        await run_tournament_command(tournament_id, join_tournament_command, sid, player_name)
+        
+    except Exception as e:
+        print(f"❌ Error en join_tournament: {e}")
+        await sio.emit("error", {"message": "Error al inscribirse en el torneo"}, room=sid)
+
+
+@sio.event
+async def start_tournament(sid, data):
+    """
+    Inicia el torneo (solo el organizador puede hacerlo)
+    """
+    try:
+        tournament_id = data.get("tournament_id")
+        
+        if not get_tournament(tournament_id):
+            await sio.emit("error", {"message": "Torneo no encontrado"}, room=sid)
             return
         
-        # Verificar límite de spam
-        if is_rate_limited(room, sid):
-            await sio.emit("error", {"message": "Enviando respuestas muy rápido, espera un momento"}, room=sid)
+        await run_tournament_command(tournament_id, start_tournament_command, sid)
+        
+    except Exception as e:
+        print(f"❌ Error en start_tournament: {e}")
+        await sio.emit("error", {"message": "Error al iniciar el torneo"}, room=sid)
+
+
+@sio.event
+async def join_mega(sid, data):
+    """
+    Une a un jugador a una partida masiva (la crea si no existe): el coordinador le
+    asigna un fragmento y el actor de ese fragmento lo agrega
+    """
+    try:
+        mega_id = data.get("mega_id", "").strip()
+        player_name = data.get("player_name", "").strip()
+        
+        if not mega_id or not player_name:
+            await sio.emit("error", {"message": "Nombre de partida y jugador requeridos"}, room=sid)
             return
         
-        if not answer:
-            await sio.emit("error", {"message": "La respuesta no puede estar vacía"}, room=sid)
+        shard_id = await run_mega_command(mega_id, assign_shard_command, sid, player_name)
+        if shard_id:
+            await run_room_command(shard_id, join_shard_command, mega_id, sid, player_name)
+        
+    except Exception as e:
+        print(f"❌ Error en join_mega: {e}")
+        await sio.emit("error", {"message": "Error al unirse a la partida"}, room=sid)
+
+
+@sio.event
+async def start_mega(sid, data):
+    """
+    Inicia la partida masiva en todos sus fragmentos (solo el host)
+    """
+    try:
+        mega_id = data.get("mega_id")
+        
+        if not get_mega(mega_id):
+            await sio.emit("error", {"message": "Partida no encontrada"}, room=sid)
             return
         
-        # Registrar timestamp de envío para antispam
-        current_time = time.time()
-        if sid not in room["player_submission_times"]:
-            room["player_submission_times"][sid] = []
-        room["player_submission_times"][sid].append(current_time)
-        
-        # Inicializar lista de respuestas si no existe
-        if sid not in room["round_answers"]:
-            room["round_answers"][sid] = []
-        
-        # Agregar nueva respuesta
-        answer_data = {
-            "answer": answer,
-            "timestamp": current_time
-        }
-        room["round_answers"][sid].append(answer_data)
-        
-        player_name = room["players"][sid]["name"]
-        
-        # Verificar si la respuesta es correcta
-        is_correct = check_answer(answer, room["current_question"]["respuestas"])
-        
-        if is_correct:
-            # Marcar jugador como que ya acertó
-            room["round_correct_players"].add(sid)
-            
-            # Confirmar respuesta correcta
-            await sio.emit("answer_correct", {"answer": answer}, room=sid)
-            
-            # Notificar a otros que alguien acertó
-            await sio.emit("player_got_correct", {"name": player_name}, room=room_id)
-            
-            # Verificar si todos han acertado para terminar la ronda
-            await check_round_completion(room_id)
-        else:
-            # Confirmar recepción de respuesta incorrecta
-            await sio.emit("answer_incorrect", {"answer": answer}, room=sid)
-        
-        # Notificar a otros que alguien respondió (sin revelar si es correcta)
-        await sio.emit("player_answered", {"name": player_name}, room=room_id)
-        
-        print(f"📝 {player_name} respondió: {answer} ({'✓' if is_correct else '✗'})")
+        await run_mega_command(mega_id, start_mega_command, sid)
         
     except Exception as e:
-        print(f"❌ Error en submit_answer: {e}")
-        await sio.emit("error", {"message": "Error al enviar respuesta"}, room=sid)
+        print(f"❌ Error en start_mega: {e}")
+        await sio.emit("error", {"message": "Error al iniciar la partida"}, room=sid)
 
 
-# Cargar preguntas al inicializar (fuera del if __name__)
-print("🚀 Cargando preguntas del sistema...")
-game_state["questions"] = load_questions()
-if not game_state["questions"]:
-    print("⚠️ ADVERTENCIA: No se pudieron cargar preguntas. Verifica data/items.csv")
-else:
-    print(f"✅ Sistema listo con {len(game_state['questions'])} preguntas")
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
 
 
-# Inicializar servidor
-if __name__ == "__main__":
-    # Cargar preguntas al inicio
-    game_state["questions"] = load_questions()
+def module_available(name: str) -> bool:
+    """
+    Indica si un módulo opcional está instalado (sin importarlo)
+    """
+    import importlib.util
+    return importlib.util.find_spec(name) is not None
+
+
+def main():
+    """
+    Lanzador de producción: lee SERVER_CONFIG (y variables TRIVIA_*) y elige
+    uvloop/httptools cuando están instalados
+    """
+    import uvicorn
     
-    if not game_state["questions"]:
-        print("⚠️ No se pudieron cargar preguntas. Verifica el archivo data/items.csv")
+    workers = SERVER_CONFIG["WORKERS"]
+    if workers != 1:
+        # Las salas viven en memoria de un proceso: varios workers las partirían
+        print(f"⚠️ WORKERS={workers} no es compatible con el estado en memoria, se usa 1")
+        workers = 1
+    
+    loop = "uvloop" if os.name != "nt" and module_available("uvloop") else "asyncio"
+    http = "httptools" if module_available("httptools") else "h11"
+    log_level = "debug" if SERVER_CONFIG["DEBUG"] else SERVER_CONFIG["LOG_LEVEL"]
+    reload = SERVER_CONFIG["RELOAD"]
     
     print("🚀 Iniciando servidor...")
-    print("📡 Conecta desde el navegador a: http://IP-LAN:8000/")
+    print(f"📡 Conecta desde el navegador a: http://IP-LAN:{SERVER_CONFIG['PORT']}/")
+    print(f"   loop={loop} · http={http} · reload={reload}")
     
-    import uvicorn
-    uvicorn.run("server:asgi", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run(
+        # Con recarga uvicorn necesita la ruta de importación; sin ella se usa la app
+        # ya importada para no cargar el módulo dos veces
+        "server:asgi" if reload else asgi,
+        host=SERVER_CONFIG["HOST"],
+        port=SERVER_CONFIG["PORT"],
+        reload=reload,
+        loop=loop,
+        http=http,
+        ws="websockets",
+        ws_max_size=SERVER_CONFIG["MAX_HTTP_BUFFER_SIZE"],
+        ws_ping_interval=None,  # Engine.IO ya envía sus propios pings
+        backlog=SERVER_CONFIG["BACKLOG"],
+        timeout_keep_alive=SERVER_CONFIG["TIMEOUT_KEEP_ALIVE"],
+        log_level=log_level
+    )
+
+
+# Inicializar servidor
+if __name__ == "__main__":
+    main()
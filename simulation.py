@@ -0,0 +1,290 @@
+"""
+Simulación del motor de Trivia LAN con reloj virtual
+Juega miles de rondas con jugadores automáticos, sin red ni esperas reales, para
+perfilar el motor y comparar rendimiento entre versiones
+
+Uso:
+    python simulation.py --rounds 100000
+    python simulation.py --rounds 20000 --players 40 --profile
+    python simulation.py --rounds 100000 --json > bench_output.txt
+    python simulation.py --tournament 512 --players 8    # torneo de 512 jugadores en salas de 8
+    python simulation.py --mega 5000 --rounds 20         # partida masiva de 5000 jugadores
+    python simulation.py --players 5000 --rounds 20      # la misma partida en una sola sala
+"""
+
+import argparse
+import cProfile
+import json
+import pstats
+import random
+import time
+from collections import Counter
+from typing import Dict
+
+import game_engine
+from config import GAME_CONFIG
+from game_engine import (
+    EventSink, VirtualClock, configure, create_room, game_state, get_room,
+    join_room_command, next_round_command, reload_questions, run_command_now,
+    start_game_command, submit_answer_command
+)
+from mega_room import (
+    assign_shard_command, create_mega, join_shard_command, mega_stats, start_mega_command
+)
+from tournament import (
+    create_tournament, join_tournament_command, start_tournament_command, tournament_stats
+)
+
+
+class SimulationSink(EventSink):
+    """
+    Hace reaccionar a los jugadores automáticos. Con 8 jugadores el motor emite unos
+    32 eventos por ronda; solo round_start y round_end tienen efecto, del resto se
+    cuentan los que aparecen en el resumen y los demás se descartan
+    """
+
+    COUNTED_EVENTS = {"player_answered", "answer_correct"}
+
+    def __init__(self, simulation: "Simulation"):
+        self.simulation = simulation
+        self.counts = Counter()
+        self.events = 0
+
+    def emit(self, event: str, data: Dict, room):
+        self.events += 1
+        if event == "round_start":
+            self.simulation.on_round_start(room[0])
+        elif event == "round_end":
+            self.simulation.on_round_end(room[0], data)
+        elif event in self.COUNTED_EVENTS:
+            self.counts[event] += 1
+
+
+class Simulation:
+    """
+    Salas con jugadores automáticos: cada uno acierta con probabilidad `accuracy`
+    en un momento al azar de la ronda, después de `wrong_guesses` intentos fallidos
+    """
+
+    def __init__(self, rooms: int = 1, players: int = 8, accuracy: float = 0.6,
+                 wrong_guesses: int = 1, seed: int = 0):
+        self.rooms = rooms
+        self.players = players
+        self.accuracy = accuracy
+        self.wrong_guesses = wrong_guesses
+        self.rng = random.Random(seed)
+        random.seed(seed)  # Selección de preguntas del motor
+
+        self.clock = VirtualClock()
+        self.sink = SimulationSink(self)
+        self.rounds_played = 0
+        self.games_finished = 0
+
+        configure(clock=self.clock, default_sink=self.sink, dispatch=run_command_now,
+                  log=lambda *args, **kwargs: None, question_stats=None, match_history=None,
+                  room_directory=None, live_stats=None)
+
+    def setup(self):
+        game_state["rooms"].clear()
+        for room_number in range(self.rooms):
+            room_id = f"sim-{room_number}"
+            create_room(room_id, f"{room_id}-0")
+            for player_number in range(self.players):
+                run_command_now(room_id, join_room_command, f"{room_id}-{player_number}", f"bot{player_number}")
+            run_command_now(room_id, start_game_command, f"{room_id}-0")
+
+    def on_round_start(self, room_id: str):
+        room = get_room(room_id)
+        round_number = room["round_number"]
+        correct_answer = room["current_question"]["respuestas"][0]
+
+        for sid in room["players"]:
+            answer_at = self.rng.uniform(0.5, game_engine.ROUND_SECONDS * 0.9)
+            for guess in range(self.wrong_guesses):
+                # Los intentos fallidos se reparten antes del momento de acierto
+                self.clock.call_later(answer_at * (guess + 1) / (self.wrong_guesses + 1), self.answer,
+                                      room_id, round_number, sid, f"respuesta equivocada {guess}")
+            if self.rng.random() < self.accuracy:
+                self.clock.call_later(answer_at, self.answer, room_id, round_number, sid, correct_answer)
+
+    def answer(self, room_id: str, round_number: int, sid: str, answer: str):
+        room = get_room(room_id)
+        if room and room["current_question"] and room["round_number"] == round_number:
+            run_command_now(room_id, submit_answer_command, sid, answer)
+
+    def on_round_end(self, room_id: str, data: Dict):
+        self.rounds_played += 1
+        room = get_room(room_id)
+        if room["tournament"] or room["mega"]:
+            return  # Las rondas de torneos y partidas masivas las programa su coordinador
+        self.clock.call_later(GAME_CONFIG["RESULTS_DELAY"], self.next_round, room_id, data["game_finished"])
+
+    def next_round(self, room_id: str, game_finished: bool):
+        host = f"{room_id}-0"
+        if game_finished:
+            # Nueva partida en la misma sala
+            self.games_finished += 1
+            get_room(room_id)["game_started"] = False
+            run_command_now(room_id, start_game_command, host)
+        else:
+            run_command_now(room_id, next_round_command, host)
+
+    def run(self, rounds: int) -> Dict:
+        """
+        Juega hasta completar `rounds` rondas (entre todas las salas)
+        """
+        self.setup()
+        started = time.perf_counter()
+        while self.rounds_played < rounds and self.clock.run_next():
+            pass
+        elapsed = time.perf_counter() - started
+
+        return {
+            "rounds": self.rounds_played,
+            "games_finished": self.games_finished,
+            "rooms": self.rooms,
+            "players_per_room": self.players,
+            "seconds": round(elapsed, 3),
+            "rounds_per_second": round(self.rounds_played / elapsed, 1) if elapsed else None,
+            "virtual_hours": round(self.clock.now() / 3600, 1),
+            "answers": self.sink.counts["player_answered"],
+            "correct_answers": self.sink.counts["answer_correct"],
+            "events": self.sink.events
+        }
+
+
+    def run_tournament(self, entrants: int, rounds_per_match: int) -> Dict:
+        """
+        Juega un torneo completo de `entrants` jugadores en salas de `players`
+        """
+        game_state["rooms"].clear()
+        game_state["tournaments"].clear()
+        tournament_id = "sim-torneo"
+        create_tournament(tournament_id, "bot-0", room_size=self.players,
+                          rounds_per_match=rounds_per_match, start_delay=0)
+        for number in range(entrants):
+            join_tournament_command(tournament_id, self.sink, f"bot-{number}", f"bot{number}")
+
+        started = time.perf_counter()
+        start_tournament_command(tournament_id, self.sink, "bot-0")
+        while game_state["tournaments"][tournament_id]["status"] != "finished" and self.clock.run_next():
+            pass
+        elapsed = time.perf_counter() - started
+        stats = tournament_stats(game_state["tournaments"][tournament_id])
+
+        return {
+            "entrants": entrants,
+            "players_per_room": self.players,
+            "stages": stats["stage"],
+            "rounds": stats["rounds_played"],
+            "champion": stats["champion"],
+            "seconds": round(elapsed, 3),
+            "rounds_per_second": round(stats["rounds_played"] / elapsed, 1) if elapsed else None,
+            "virtual_minutes": round(stats["seconds"] / 60, 1),
+            "answers": self.sink.counts["player_answered"],
+            "events": self.sink.events
+        }
+
+    def run_mega(self, entrants: int, shard_size: int, rounds: int) -> Dict:
+        """
+        Juega `rounds` rondas de una partida masiva de `entrants` jugadores
+        repartidos en fragmentos de `shard_size`
+        """
+        game_state["rooms"].clear()
+        game_state["mega_rooms"].clear()
+        mega_id = "sim-masiva"
+        mega = create_mega(mega_id, "bot-0", shard_size=shard_size)
+        mega["target_points"] = float("inf")  # Se juegan exactamente `rounds` rondas
+        for number in range(entrants):
+            sid, player_name = f"bot-{number}", f"bot{number}"
+            shard_id = assign_shard_command(mega_id, self.sink, sid, player_name)
+            run_command_now(shard_id, join_shard_command, mega_id, sid, player_name)
+
+        started = time.perf_counter()
+        start_mega_command(mega_id, self.sink, "bot-0")
+        while self.rounds_played < rounds and self.clock.run_next():
+            pass
+        elapsed = time.perf_counter() - started
+        stats = mega_stats(mega)
+
+        return {
+            "entrants": entrants,
+            "shards": stats["shards"],
+            "rounds": stats["rounds_played"],
+            "seconds": round(elapsed, 3),
+            "ms_per_round": round(elapsed * 1000 / stats["rounds_played"], 1) if stats["rounds_played"] else None,
+            "leader": stats["leaderboard"][0] if stats["leaderboard"] else None,
+            "answers": self.sink.counts["player_answered"],
+            "events": self.sink.events
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simula partidas de Trivia LAN con reloj virtual")
+    parser.add_argument("--rounds", type=int, default=100_000, help="Rondas a jugar (entre todas las salas)")
+    parser.add_argument("--rooms", type=int, default=1, help="Salas simultáneas")
+    parser.add_argument("--players", type=int, default=8, help="Jugadores por sala")
+    parser.add_argument("--accuracy", type=float, default=0.6, help="Probabilidad de acierto de cada jugador")
+    parser.add_argument("--wrong-guesses", type=int, default=1, help="Intentos fallidos por jugador y ronda")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla para repetir la simulación")
+    parser.add_argument("--tournament", type=int, metavar="N",
+                        help="Jugar un torneo de N jugadores en salas de --players (en lugar de --rounds)")
+    parser.add_argument("--rounds-per-match", type=int, default=GAME_CONFIG["TOURNAMENT_ROUNDS_PER_MATCH"],
+                        help="Rondas por partida en modo torneo")
+    parser.add_argument("--mega", type=int, metavar="N",
+                        help="Jugar --rounds rondas de una partida masiva de N jugadores")
+    parser.add_argument("--shard-size", type=int, default=GAME_CONFIG["MEGA_SHARD_SIZE"],
+                        help="Jugadores por fragmento en modo partida masiva")
+    parser.add_argument("--profile", action="store_true", help="Perfilar con cProfile y mostrar las funciones más costosas")
+    parser.add_argument("--json", action="store_true", help="Imprimir solo el resumen en JSON")
+    args = parser.parse_args()
+
+    reload_questions()
+    if not game_state["questions"]:
+        print("❌ No hay preguntas para simular")
+        return
+
+    simulation = Simulation(args.rooms, args.players, args.accuracy, args.wrong_guesses, args.seed)
+
+    if args.tournament:
+        run, run_args = simulation.run_tournament, (args.tournament, args.rounds_per_match)
+    elif args.mega:
+        run, run_args = simulation.run_mega, (args.mega, args.shard_size, args.rounds)
+    else:
+        run, run_args = simulation.run, (args.rounds,)
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        summary = profiler.runcall(run, *run_args)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    else:
+        summary = run(*run_args)
+
+    if args.json:
+        print(json.dumps(summary))
+        return
+
+    if args.tournament:
+        print(f"🏆 Torneo de {summary['entrants']} jugadores: {summary['stages']} etapas, "
+              f"{summary['rounds']} rondas en {summary['seconds']} s "
+              f"({summary['rounds_per_second']} rondas/s entre todas las salas)")
+        print(f"   campeón={summary['champion']} · {summary['virtual_minutes']} min simulados · "
+              f"respuestas={summary['answers']} · eventos={summary['events']}")
+        return
+
+    if args.mega:
+        print(f"🌐 Partida masiva de {summary['entrants']} jugadores en {summary['shards']} fragmentos: "
+              f"{summary['rounds']} rondas en {summary['seconds']} s ({summary['ms_per_round']} ms por ronda)")
+        print(f"   líder={summary['leader']} · respuestas={summary['answers']} · eventos={summary['events']}")
+        return
+
+    print(f"🎲 {summary['rounds']} rondas en {summary['seconds']} s "
+          f"({summary['rounds_per_second']} rondas/s, {summary['virtual_hours']} h simuladas)")
+    print(f"   salas={summary['rooms']} · jugadores/sala={summary['players_per_room']} · "
+          f"partidas terminadas={summary['games_finished']}")
+    print(f"   respuestas={summary['answers']} · aciertos={summary['correct_answers']} · "
+          f"eventos={summary['events']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,62 @@ Pruebas básicas para el servidor de Trivia LAN
 
 import sys
 import os
+import json
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from server import load_questions, normalize_text, check_answer
+from contextlib import contextmanager
+
+from game_engine import load_questions, normalize_text, check_answer, rank_players, VerdictCache
+from question_stats import QuestionStatsStore
+import game_engine
+
+
+class RecordingSink(game_engine.EventSink):
+    """Guarda los eventos emitidos por el motor: (evento, datos, destino, momento)"""
+    
+    def __init__(self, clock=None):
+        self.clock = clock
+        self.events = []
+    
+    def emit(self, event, data, room):
+        self.events.append((event, data, room, self.clock.now() if self.clock else None))
+    
+    def sent(self, event, to=None):
+        """Datos de cada `event` emitido (solo los enviados a `to`, si se indica)"""
+        return [data for name, data, room, _ in self.events if name == event and (to is None or room == to)]
+
+
+@contextmanager
+def engine_config(**overrides):
+    """
+    Configura el motor para una prueba. Los comandos de los timers se ejecutan en el
+    momento salvo que se indique otro dispatch (importar server deja configurado el suyo).
+    Al salir restaura la configuración anterior y descarta las salas, torneos y
+    partidas masivas creados durante la prueba
+    """
+    previous = {name: getattr(game_engine, name) for name in game_engine.CONFIGURABLE}
+    existing = {key: set(game_engine.game_state[key]) for key in ("rooms", "tournaments", "mega_rooms")}
+    overrides.setdefault("dispatch", game_engine.run_command_now)
+    try:
+        game_engine.configure(**overrides)
+        if not game_engine.game_state["questions"]:
+            game_engine.reload_questions()
+        yield
+    finally:
+        game_engine.configure(**previous)
+        for key, kept in existing.items():
+            for created in set(game_engine.game_state[key]) - kept:
+                del game_engine.game_state[key][created]
+
+
+def report(checks):
+    """Muestra cada verificación (condición, descripción) y devuelve si pasaron todas"""
+    all_passed = True
+    for passed, description in checks:
+        print(f"{'✅' if passed else '❌'} {description}")
+        all_passed = all_passed and passed
+    return all_passed
+
 
 def test_load_questions():
     """Prueba la carga de preguntas desde CSV"""
@@ -78,6 +131,1140 @@ def test_check_answer():
     
     return all_passed
 
+def test_rank_players():
+    """Prueba el ranking con empates usado en salas grandes"""
+    print("\n🧪 Probando ranking de jugadores...")
+    
+    room = {"players": {
+        "a": {"name": "Ana", "score": 5},
+        "b": {"name": "Beto", "score": 9},
+        "c": {"name": "Caro", "score": 5},
+        "d": {"name": "Dani", "score": 1}
+    }}
+    
+    ranking = rank_players(room)
+    result = [(entry["name"], entry["rank"]) for entry in ranking]
+    expected = [("Beto", 1), ("Ana", 2), ("Caro", 2), ("Dani", 4)]
+    
+    if result == expected:
+        print(f"✅ Ranking: {result}")
+        return True
+    
+    print(f"❌ Ranking: {result} (esperado: {expected})")
+    return False
+
+def test_verdict_cache():
+    """Prueba la caché LRU de veredictos"""
+    print("\n🧪 Probando caché de veredictos...")
+    
+    cache = VerdictCache(max_size=2, ttl=60)
+    cache.put((1, "titanic"), True)
+    cache.put((1, "avatar"), False)
+    cache.get((1, "titanic"))          # acierto: pasa a ser la más reciente
+    cache.put((2, "gremlins"), True)   # desaloja (1, "avatar")
+    
+    checks = [
+        (cache.get((1, "avatar")) is None, "entrada menos usada desalojada"),
+        (cache.get((1, "titanic")) is True, "entrada reciente conservada"),
+        (cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1, "contadores de aciertos"),
+    ]
+    
+    return report(checks)
+
+def test_question_stats():
+    """Prueba el registro de estadísticas por pregunta"""
+    print("\n🧪 Probando estadísticas de preguntas...")
+    
+    import asyncio
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        store = QuestionStatsStore(os.path.join(tmp, "stats.sqlite3"), normalize=normalize_text)
+        store.record_round(7, players=4, attempts=6, correct_players=1,
+                           first_correct_seconds=3.0, wrong_answers=["Avatar", "avatar", "Alien"])
+        store.record_round(7, players=4, attempts=5, correct_players=3,
+                           first_correct_seconds=5.0, wrong_answers=["AVATAR"])
+        stats = asyncio.run(store.query(question_id=7))[0]
+    
+    checks = [
+        (stats["rounds"] == 2 and stats["attempts"] == 11, "rondas e intentos acumulados"),
+        (stats["correct_rate"] == 0.5, "tasa de acierto"),
+        (stats["avg_seconds_to_first_correct"] == 4.0, "tiempo medio al primer acierto"),
+        (stats["top_wrong_guesses"][0] == {"guess": "avatar", "count": 3}, "respuestas incorrectas normalizadas"),
+        (store.correct_rate(7, min_players=20) is None, "sin tasa con muestra insuficiente"),
+    ]
+    
+    return report(checks)
+
+def test_simulation():
+    """Prueba el motor con reloj virtual (partidas completas sin esperas reales)"""
+    print("\n🧪 Probando simulación con reloj virtual...")
+    
+    from simulation import Simulation
+    
+    with engine_config():
+        summary = Simulation(rooms=2, players=4, seed=1).run(300)
+    
+    checks = [
+        (summary["rounds"] == 300, "rondas jugadas"),
+        (summary["virtual_hours"] > 0 and summary["seconds"] < 10, "reloj virtual (sin esperas reales)"),
+        (0 < summary["correct_answers"] < summary["answers"], "aciertos y fallos registrados"),
+        (summary["games_finished"] > 0, "partidas completas"),
+    ]
+    
+    return report(checks)
+
+def test_question_bank_validator():
+    """Prueba el validador del banco de preguntas"""
+    print("\n🧪 Probando validador de CSV...")
+    
+    import tempfile
+    from verificar_csv import validate
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "banco.csv")
+        with open(csv_path, "w", encoding="utf-8") as file:
+            file.write("id,tipo,pregunta,imagen,respuestas\n"
+                       "1,película,¿Cuál?,images/no_existe.jpg,Titanic;titanic\n"
+                       "1,película,¿Cuál?,images/titanic.jpg,Titanik\n"
+                       "2,película,¿Cuál?,images/titanic.jpg,;\n")
+        result = validate([csv_path], images_dir=os.path.join("data", "images"))
+    
+    codes = {problem["code"] for problem in result["errors"] + result["warnings"]}
+    checks = [
+        ("duplicate_id" in codes, "ID repetido"),
+        ("image_not_found" in codes, "imagen faltante"),
+        ("duplicate_answer" in codes, "respuesta repetida"),
+        ("no_answers" in codes, "pregunta sin respuestas"),
+        (not result["ambiguous_pairs"], "mismo ID no se reporta como ambiguo"),
+    ]
+    
+    return report(checks)
+
+def test_late_join_snapshot():
+    """Prueba el estado enviado a quien entra a mitad de ronda"""
+    print("\n🧪 Probando entrada tardía...")
+    
+    sink = RecordingSink()
+    clock = game_engine.VirtualClock()
+    with engine_config(clock=clock, default_sink=sink, log=lambda *args: None, question_stats=None):
+        room = game_engine.create_room("tarde", "h")
+        game_engine.join_room_command("tarde", sink, "h", "Host")
+        game_engine.join_room_command("tarde", sink, "g", "Guía")
+        game_engine.start_game_command("tarde", sink, "h")
+        room["players"]["h"]["score"] = 3
+        game_engine.invalidate_snapshot(room)
+        clock.advance(10)
+        first = game_engine.room_snapshot(room)
+        second = game_engine.room_snapshot(room)
+        
+        # Las uniones parchean el estado armado en vez de volver a ordenar la sala
+        rankings = []
+        rank_players = game_engine.rank_players
+        game_engine.rank_players = lambda room: rankings.append(1) or rank_players(room)
+        try:
+            game_engine.join_room_command("tarde", sink, "t", "Tardío")
+            game_engine.join_room_command("tarde", sink, "u", "Último")
+            patched = json.loads(game_engine.room_snapshot_json(room))
+            game_engine.leave_room_command("tarde", sink, "g")
+            after_leave = json.loads(game_engine.room_snapshot_json(room))
+        finally:
+            game_engine.rank_players = rank_players
+        joined = sink.sent("room_joined", to="t")[0]
+        game_engine.invalidate_snapshot(room)
+        rebuilt = game_engine.room_snapshot(room)
+        game_engine.watch_room_command("tarde", sink, "e")
+        watched = sink.sent("spectator_joined", to="e")[0]
+    
+    state = json.loads(joined["state"])
+    checks = [
+        (first is second, "snapshot reutilizado mientras no cambia la sala"),
+        (joined["round"] is not None and joined["round"]["duration"] == game_engine.ROUND_SECONDS - 10, "ronda en curso con tiempo restante"),
+        ([player["name"] for player in state["players"]] == ["Host", "Guía", "Tardío"], "lista de jugadores incluye al que entra"),
+        (not rankings, "las uniones y salidas no vuelven a ordenar la sala"),
+        ([(entry["rank"], entry["name"]) for entry in patched["leaderboard"]] == [(1, "Host"), (2, "Guía"), (2, "Tardío"), (2, "Último")], "posiciones con empate del parche"),
+        (after_leave == rebuilt, "estado parcheado igual al rearmado"),
+        (rebuilt["roster_version"] == 5, "versión de la lista de jugadores"),
+        (json.loads(watched["state"]) == rebuilt and watched["round"] is not None, "el espectador recibe el mismo estado"),
+    ]
+    
+    return report(checks)
+
+def test_reconnect_grace():
+    """Prueba que un jugador que se reconecta con su token recupere sus puntos"""
+    print("\n🧪 Probando reconexión...")
+    
+    sink = RecordingSink()
+    clock = game_engine.VirtualClock()
+    with engine_config(clock=clock, default_sink=sink, log=lambda *args: None,
+                       question_stats=None, match_history=None):
+        room = game_engine.create_room("vuelta", "a")
+        game_engine.join_room_command("vuelta", sink, "a", "Ana", "token-ana")
+        game_engine.join_room_command("vuelta", sink, "b", "Beto", "token-beto")
+        game_engine.start_game_command("vuelta", sink, "a")
+        answer = room["current_question"]["respuestas"][0]
+        game_engine.submit_answer_command("vuelta", sink, "a", answer)
+        
+        # Ana se desconecta después de acertar y vuelve con otro sid
+        game_engine.leave_room_command("vuelta", sink, "a")
+        game_engine.join_room_command("vuelta", sink, "x", "Ana", "token-intruso")
+        game_engine.join_room_command("vuelta", sink, "a2", "Ana", "token-ana")
+        kept_answer = "a2" in room["round_correct_players"] and "a" not in room["round_answers"]
+        game_engine.submit_answer_command("vuelta", sink, "b", answer)
+        scores = {player["name"]: player["score"] for player in room["players"].values()}
+        game_engine.leave_room_command("vuelta", sink, "a2")
+        game_engine.join_room_command("vuelta", sink, "a3", "Ana", "token-ana")
+        restored = room["players"]["a3"]["score"]
+        leaderboard = json.loads(sink.sent("room_joined", to="a3")[0]["state"])["leaderboard"]
+        
+        # Si se van todos la sala espera el plazo; después el nombre queda libre
+        game_engine.leave_room_command("vuelta", sink, "a3")
+        game_engine.leave_room_command("vuelta", sink, "b")
+        kept_room = game_engine.get_room("vuelta") is room
+        clock.advance(game_engine.RECONNECT_GRACE)
+        game_engine.join_room_command("vuelta", sink, "z", "Beto")
+    
+    checks = [
+        (sink.sent("error", to="x") == [{"message": "Nombre de jugador ya en uso"}], "nombre reservado sin el token"),
+        (kept_answer, "acierto de la ronda pasa al nuevo sid"),
+        (len(sink.sent("round_end")) == 1 and scores["Ana"] > scores["Beto"] > 0, "el acierto recuperado suma puntos"),
+        (restored == scores["Ana"] and leaderboard[0]["name"] == "Ana", "puntos conservados tras reconectarse"),
+        (kept_room, "la sala sigue abierta mientras pueden volver"),
+        (room["players"].get("z", {}).get("score") == 0 and not room["departed"], "plazo vencido: el nombre queda libre"),
+    ]
+    
+    return report(checks)
+
+def test_reconnect_before_drop():
+    """Prueba que un jugador recupere su lugar aunque su conexión anterior siga abierta"""
+    print("\n🧪 Probando reconexión antes de notar la caída...")
+    
+    class MembershipSink(RecordingSink):
+        def leave_room(self, sid, room):
+            self.events.append(("leave", None, room, sid))
+    
+    sink = MembershipSink()
+    with engine_config(clock=game_engine.VirtualClock(), default_sink=sink, log=lambda *args: None,
+                       question_stats=None, match_history=None):
+        room = game_engine.create_room("corte", "a")
+        game_engine.join_room_command("corte", sink, "a", "Ana", "token-ana")
+        game_engine.join_room_command("corte", sink, "b", "Beto", "token-beto")
+        game_engine.start_game_command("corte", sink, "a")
+        room["players"]["a"]["score"] = 4
+        answer = room["current_question"]["respuestas"][0]
+        game_engine.submit_answer_command("corte", sink, "a", answer)
+        
+        # El servidor todavía no sabe que "a" se cayó cuando Ana vuelve como "a2"
+        game_engine.join_room_command("corte", sink, "x", "Ana", "token-intruso")
+        joined_before = len(sink.sent("player_joined"))
+        game_engine.join_room_command("corte", sink, "a2", "Ana", "token-ana")
+        moved = (list(room["players"]) == ["a2", "b"] and room["players"]["a2"]["score"] == 4
+                 and room["host"] == "a2" and room["session_tokens"] == {"a2": "token-ana", "b": "token-beto"}
+                 and "a2" in room["round_correct_players"] and "a" not in room["round_answers"])
+        joined = sink.sent("room_joined", to="a2")
+        old_left = ("leave", None, "corte", "a") in sink.events
+        
+        # La desconexión tardía de la conexión vieja ya no afecta al jugador
+        game_engine.leave_room_command("corte", sink, "a")
+        still_there = "a2" in room["players"] and not room["departed"]
+        game_engine.submit_answer_command("corte", sink, "b", answer)
+    
+    checks = [
+        (sink.sent("error", to="x") == [{"message": "Nombre de jugador ya en uso"}], "sin el token el nombre sigue ocupado"),
+        (moved, "puntos, token, host y acierto pasan al nuevo sid en el mismo lugar"),
+        (len(joined) == 1 and joined[0]["is_host"] and not sink.sent("error", to="a2"), "el jugador recibe el estado de la sala"),
+        (len(sink.sent("player_joined")) == joined_before, "no se anuncia como un jugador nuevo"),
+        (old_left, "la conexión vieja sale de la sala"),
+        (still_there, "la desconexión de la conexión vieja no lo saca"),
+        (len(sink.sent("round_end")) == 1, "la ronda termina con el acierto recuperado"),
+    ]
+    
+    return report(checks)
+
+def test_spectators():
+    """Prueba que los espectadores no jueguen y reciban un resumen acotado de la sala"""
+    print("\n🧪 Probando espectadores...")
+    
+    import asyncio
+    import server
+    
+    sink = RecordingSink()
+    with engine_config(clock=game_engine.VirtualClock(), default_sink=sink, log=lambda *args: None,
+                       question_stats=None, match_history=None):
+        room = game_engine.create_room("mirada", "a")
+        game_engine.join_room_command("mirada", sink, "a", "Ana")
+        game_engine.watch_room_command("mirada", sink, "e")
+        game_engine.watch_room_command("mirada", sink, "f")
+        game_engine.join_room_command("mirada", sink, "b", "Beto")
+        roster = [player["name"] for player in sink.sent("players_update", to="mirada")[-1]["players"]]
+        
+        game_engine.start_game_command("mirada", sink, "a")
+        answer = room["current_question"]["respuestas"][0]
+        for sid in ("a", "b"):
+            game_engine.submit_answer_command("mirada", sink, sid, "respuesta que no es")
+            game_engine.submit_answer_command("mirada", sink, sid, answer)
+        ended = len(sink.sent("round_end")) == 1
+        rejected = sink.sent("error", to="e")
+        game_engine.submit_answer_command("mirada", sink, "e", answer)
+        dirty = set(game_engine.game_state["spectator_dirty_rooms"])
+        
+        # Cuatro respuestas, un solo resumen por intervalo
+        updates = []
+        
+        async def record_emit(event, data, room=None, **kwargs):
+            if room == game_engine.spectator_room("mirada"):
+                updates.append((event, data))
+        
+        async def flush_twice():
+            task = asyncio.create_task(server.flush_spectator_updates())
+            await asyncio.sleep(server.SPECTATOR_FLUSH_INTERVAL * 2.5)
+            task.cancel()
+        
+        emit, interval = server.sio.emit, server.SPECTATOR_FLUSH_INTERVAL
+        try:
+            server.sio.emit, server.SPECTATOR_FLUSH_INTERVAL = record_emit, 0.02
+            asyncio.run(flush_twice())
+        finally:
+            server.sio.emit, server.SPECTATOR_FLUSH_INTERVAL = emit, interval
+        
+        # Un espectador que decide jugar deja de contar como espectador
+        game_engine.join_room_command("mirada", sink, "f", "Fede")
+        switched = ("f" in room["players"] and "f" not in room["spectators"]
+                    and "f" not in game_engine.game_state["spectators"])
+    
+    checks = [
+        (roster == ["Ana", "Beto"] and room["spectators"] == {"e"}, "los espectadores no aparecen en la lista de jugadores"),
+        (ended, "la ronda termina cuando aciertan todos los jugadores, sin esperar a los espectadores"),
+        (len(sink.sent("error", to="e")) == len(rejected) + 1, "un espectador no puede responder"),
+        ("mirada" in dirty, "la actividad de la ronda marca la sala para los espectadores"),
+        (updates == [("spectator_update", {"players": 2, "spectators": 2, "answers": 4, "correct": 2,
+                                           "deadline": room["round_deadline"]})],
+         "un solo resumen con las cuatro respuestas"),
+        (switched, "el espectador que se une como jugador deja de mirar"),
+    ]
+    
+    return report(checks)
+
+def test_image_meta():
+    """Prueba los metadatos de imágenes y su caché en disco"""
+    print("\n🧪 Probando metadatos de imágenes...")
+    
+    import tempfile
+    import image_meta
+    
+    if image_meta.pillow() is None:
+        print("⚠️ Pillow no está instalado, se omite")
+        return True
+    
+    questions = [{"id": 1, "es_imagen": True, "imagen": "images/titanic.jpg"},
+                 {"id": 2, "es_imagen": True, "imagen": "images/no_existe.jpg"}]
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, "image_meta.json")
+        first = image_meta.annotate_questions(questions, cache_path=cache_path)
+        second = image_meta.annotate_questions([dict(q) for q in questions], cache_path=cache_path)
+    
+    meta = questions[0].get("imagen_meta", {})
+    checks = [
+        (meta.get("width", 0) > 0 and meta.get("height", 0) > 0, "dimensiones"),
+        (meta.get("placeholder", "").startswith("data:image/") and len(meta["placeholder"]) < 1000, "miniatura en base64"),
+        ("imagen_meta" not in questions[1], "imagen faltante sin metadatos"),
+        (first == 1 and second == 0, "caché reutilizada entre reinicios"),
+    ]
+    
+    return report(checks)
+
+def test_tournament():
+    """Prueba un torneo con varias salas en paralelo y etapas sucesivas"""
+    print("\n🧪 Probando torneo...")
+    
+    import tournament
+    
+    clock = game_engine.VirtualClock()
+    sink = RecordingSink(clock)
+    with engine_config(clock=clock, default_sink=sink, dispatch=game_engine.run_command_now,
+                       log=lambda *args: None, question_stats=None):
+        tournament.create_tournament("copa", "j0", room_size=4, rounds_per_match=2, start_delay=1)
+        for number in range(10):
+            tournament.join_tournament_command("copa", sink, f"j{number}", f"Jugador{number}")
+        tournament.start_tournament_command("copa", sink, "j1")
+        not_organizer = sink.sent("error")
+        tournament.start_tournament_command("copa", sink, "j0")
+        first_stage = list(game_engine.game_state["tournaments"]["copa"]["stage_rooms"])
+        while game_engine.game_state["tournaments"]["copa"]["status"] != "finished" and clock.run_next():
+            pass
+        stats = tournament.tournament_stats(game_engine.game_state["tournaments"]["copa"])
+    
+    # Momento de inicio de cada ronda de la primera etapa, por sala
+    starts = {}
+    for event, data, to, at in sink.events:
+        if event == "round_start" and to[0] in first_stage:
+            starts.setdefault(to[0], []).append(at)
+    finished = sink.sent("tournament_finished")
+    checks = [
+        (len(not_organizer) == 1, "solo el organizador inicia"),
+        (len(first_stage) == 3, "10 jugadores en 3 salas de hasta 4"),
+        (len({tuple(times) for times in starts.values()}) == 1, "rondas sincronizadas entre salas"),
+        (stats["stage"] == 2 and stats["rounds_played"] == 3 * 2 + 2, "ganadores pasan a la final"),
+        (len(finished) == 1 and finished[0]["champion"] is not None, "campeón"),
+        (stats["rounds_per_second"] > 0, "rendimiento agregado"),
+    ]
+    
+    return report(checks)
+
+def test_tournament_cleanup():
+    """Prueba que una sala cerrada no frene la etapa y que el torneo terminado se olvide"""
+    print("\n🧪 Probando limpieza de torneos...")
+    
+    import tournament
+    
+    clock = game_engine.VirtualClock()
+    sink = RecordingSink(clock)
+    with engine_config(clock=clock, default_sink=sink, dispatch=game_engine.run_command_now,
+                       log=lambda *args: None, question_stats=None):
+        copa = tournament.create_tournament("copita", "j0", room_size=2, rounds_per_match=2, start_delay=1)
+        for number in range(4):
+            tournament.join_tournament_command("copita", sink, f"j{number}", f"Jugador{number}")
+        tournament.start_tournament_command("copita", sink, "j0")
+        clock.advance(1)
+        
+        # El limpiador cierra una sala a mitad de ronda: la otra sigue y define al campeón
+        closed, other = copa["stage_rooms"]
+        other_room = game_engine.get_room(other)
+        was_pending = closed in copa["pending_rooms"]
+        game_engine.close_room(closed, sink, "empty")
+        while copa["status"] != "finished" and clock.run_next():
+            pass
+        kept = tournament.get_tournament("copita") is copa
+        clock.advance(tournament.TOURNAMENT_FINISHED_TTL)
+    
+    finished = sink.sent("tournament_finished")
+    checks = [
+        (was_pending and copa["status"] == "finished", "la etapa no se traba por la sala cerrada"),
+        (len(finished) == 1 and finished[0]["champion"] == other_room["winner"] is not None, "el campeón sale de la sala que siguió"),
+        (kept and tournament.get_tournament("copita") is None, "el torneo terminado se olvida después del plazo"),
+    ]
+    
+    return report(checks)
+
+def test_match_history():
+    """Prueba el historial de partidas y su exportación por partes"""
+    print("\n🧪 Probando historial de partidas...")
+    
+    import asyncio
+    import csv
+    import json
+    from match_history import MatchHistory
+    
+    async def collect(history, export_format, chunk_size=64 * 1024):
+        return [chunk async for chunk in history.stream(export_format, chunk_size=chunk_size)]
+    
+    history = MatchHistory(max_rooms=2)
+    clock = game_engine.VirtualClock(start=1000.0)
+    with engine_config(clock=clock, log=lambda *args: None, question_stats=None, match_history=history):
+        sink = game_engine.EventSink()
+        for number in range(3):
+            room_id = f"historial-{number}"
+            game_engine.create_room(room_id, "h")
+            game_engine.join_room_command(room_id, sink, "h", "Ana")
+            game_engine.join_room_command(room_id, sink, "b", "Beto")
+            game_engine.start_game_command(room_id, sink, "h")
+            clock.advance(2)
+            correct = game_engine.get_room(room_id)["current_question"]["respuestas"][0]
+            game_engine.submit_answer_command(room_id, sink, "b", "otra cosa")
+            game_engine.submit_answer_command(room_id, sink, "h", correct)
+            clock.advance(30)
+            if number < 2:
+                game_engine.close_room(room_id, sink, "inactive")
+        
+        ndjson_chunks = asyncio.run(collect(history, "ndjson", chunk_size=1))
+        csv_chunks = asyncio.run(collect(history, "csv"))
+    
+    # Una partida larga solo conserva sus últimas rondas
+    capped = MatchHistory(max_rounds_per_match=2)
+    for number in range(1, 6):
+        capped.record_round("larga", (number, 1, float(number), number + 0.5, (), ()), {"Ana": number})
+    capped_lines = [json.loads(line) for line in "".join(asyncio.run(collect(capped, "ndjson"))).splitlines()]
+    
+    lines = [json.loads(line) for line in "".join(ndjson_chunks).splitlines()]
+    rounds = [line for line in lines if line["type"] == "round"]
+    matches = [line for line in lines if line["type"] == "match"]
+    rows = list(csv.DictReader("".join(csv_chunks).splitlines()))
+    first = rounds[0]
+    checks = [
+        (len(ndjson_chunks) == 3, "exportación por partes (una sala por parte)"),
+        (len(matches) == 3 and matches[0]["close_reason"] == "inactive" and matches[-1]["closed_at"] is None,
+         "salas cerradas archivadas y sala abierta incluida"),
+        ({(a["player"], a["correct"]) for a in first["answers"]} == {("Ana", True), ("Beto", False)}, "respuestas con veredicto"),
+        (first["points"] == {"Ana": 3} and matches[0]["scores"] == {"Ana": 3, "Beto": 0}, "puntos y puntuaciones"),
+        (first["answers"][0]["seconds"] == 2.0, "segundos desde el inicio de la ronda"),
+        (len([row for row in rows if row["type"] == "answer"]) == 6 and len([row for row in rows if row["type"] == "score"]) == 6, "CSV"),
+        (history.stats()["archived_rooms"] == 2, "archivo acotado"),
+        ([line["round"] for line in capped_lines if line["type"] == "round"] == [4, 5] and
+         capped_lines[-1]["rounds"] == 5 and capped_lines[-1]["rounds_kept"] == 2, "rondas acotadas por partida"),
+    ]
+    
+    return report(checks)
+
+def test_accept_alias():
+    """Prueba aceptar una respuesta a mitad de ronda y re-evaluar los intentos"""
+    print("\n🧪 Probando respuestas aceptadas por el host...")
+    
+    import tempfile
+    
+    sink = RecordingSink()
+    persisted = []
+    question = None
+    clock = game_engine.VirtualClock()
+    with engine_config(clock=clock, default_sink=sink, log=lambda *args: None, question_stats=None,
+                       match_history=None, persist_alias=lambda *args: persisted.append(args)):
+        try:
+            room = game_engine.create_room("alias", "a")
+            for sid, name in (("a", "Ana"), ("b", "Beto"), ("c", "Caro")):
+                game_engine.join_room_command("alias", sink, sid, name)
+            game_engine.start_game_command("alias", sink, "a")
+            question = room["current_question"]
+            correct = question["respuestas"][0]
+            
+            for delay, sid, answer in ((0.5, "c", "zzqx variantes"), (0.5, "b", "zzqx variante"),
+                                       (1, "c", correct), (1, "a", "ZZQX  variante"), (1, "b", "otra cosa")):
+                clock.advance(delay)
+                game_engine.submit_answer_command("alias", sink, sid, answer)
+            cached_before = game_engine.grade_answer(question, "zzqx variante")
+            game_engine.accept_alias_command("alias", sink, "b", "Zzqx variante")
+            game_engine.accept_alias_command("alias", sink, "a", "Zzqx variante")
+            cached_after = game_engine.grade_answer(question, "zzqx variante")
+        finally:
+            # La respuesta aceptada no debe quedar en el banco compartido por las demás pruebas
+            if question is not None and "Zzqx variante" in question["respuestas"]:
+                question["respuestas"].remove("Zzqx variante")
+                question["respuestas_normalizadas"].remove("zzqx variante")
+                game_engine.verdict_cache.discard_question(question["id"])
+    
+    accepted = sink.sent("alias_accepted")
+    round_end = sink.sent("round_end")
+    not_host = sink.sent("error", to="b")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "banco.csv")
+        original = ('id,tipo,texto,respuestas\n'
+                    '1,persona,"Texto, con coma",Uno\n'
+                    '2,"lugar","Dos líneas\nde texto",Dos;Segundo\n'
+                    '3,película,Tres,"Tres"\n')
+        with open(csv_path, "w", encoding="utf-8", newline="") as file:
+            file.write(original)
+        saved = game_engine.save_alias(2, "Segunda", csv_path)
+        repeated = game_engine.save_alias(2, "SEGUNDA", csv_path)
+        saved_quoted = game_engine.save_alias(3, "Tercera", csv_path)
+        with open(csv_path, encoding="utf-8", newline="") as file:
+            updated = file.read()
+    
+    checks = [
+        (len(not_host) == 1, "solo el host acepta respuestas"),
+        (not cached_before and cached_after, "caché de veredictos invalidada"),
+        (accepted and sorted(accepted[0]["newly_correct"]) == ["Ana", "Beto"], "nuevos aciertos"),
+        (accepted and accepted[0]["retimed"] == ["Caro"], "acierto adelantado"),
+        (persisted == [(question["id"], "Zzqx variante")], "respuesta guardada en el banco"),
+        (round_end and [(r["name"], r["points"]) for r in round_end[0]["results"]] == [("Caro", 3), ("Beto", 1), ("Ana", 1)],
+         "ronda terminada con puntos por orden de acierto"),
+        (saved and not repeated and saved_quoted and
+         updated == original.replace("Dos;Segundo", "Dos;Segundo;Segunda").replace('"Tres"', '"Tres;Tercera"'),
+         "CSV: solo cambia el campo de respuestas"),
+    ]
+    
+    return report(checks)
+
+def test_room_alias():
+    """Prueba que sin SHARE_HOST_ALIASES la respuesta aceptada valga solo en la ronda de la sala"""
+    print("\n🧪 Probando respuestas aceptadas solo en la sala...")
+    
+    sink = RecordingSink()
+    clock = game_engine.VirtualClock()
+    with engine_config(clock=clock, default_sink=sink, log=lambda *args: None, question_stats=None,
+                       match_history=None, persist_alias=None):
+        room = game_engine.create_room("alias-sala", "a")
+        for sid, name in (("a", "Ana"), ("b", "Beto")):
+            game_engine.join_room_command("alias-sala", sink, sid, name)
+        game_engine.start_game_command("alias-sala", sink, "a")
+        question = room["current_question"]
+        answers_before = list(question["respuestas"])
+        
+        for delay, sid, answer in ((0.5, "a", "qwv uno"), (0.5, "a", "qwv dos"),
+                                   (0.5, "a", question["respuestas"][0]), (0.5, "b", "qwv dos")):
+            clock.advance(delay)
+            game_engine.submit_answer_command("alias-sala", sink, sid, answer)
+        game_engine.accept_alias_command("alias-sala", sink, "a", "Qwv uno")
+        # Ana ya acertó con "qwv uno": "qwv dos" es posterior y no la adelanta
+        game_engine.accept_alias_command("alias-sala", sink, "a", "Qwv dos")
+        question_shared = question["respuestas"] != answers_before or game_engine.grade_answer(question, "qwv uno")
+        round_end = sink.sent("round_end")
+        next_round_aliases = list(room["round_aliases"])
+    
+    accepted = sink.sent("alias_accepted")
+    checks = [
+        (not question_shared, "la pregunta compartida no cambia"),
+        (len(accepted) == 2 and accepted[0]["retimed"] == ["Ana"], "acierto adelantado"),
+        (accepted[1]["retimed"] == [] and accepted[1]["newly_correct"] == ["Beto"], "sin adelanto con un intento posterior al acierto"),
+        (round_end and [r["name"] for r in round_end[0]["results"]] == ["Ana", "Beto"], "la ronda usa las respuestas de la sala"),
+        (next_round_aliases == [], "las respuestas se olvidan al terminar la ronda"),
+    ]
+    
+    return report(checks)
+
+def test_room_directory():
+    """Prueba el directorio de salas: índice incremental, páginas y caché"""
+    print("\n🧪 Probando directorio de salas...")
+    
+    import json
+    from room_directory import RoomDirectory
+    
+    sink = game_engine.EventSink()
+    clock = game_engine.VirtualClock()
+    directory = RoomDirectory(ttl=1.0)
+    with engine_config(clock=clock, default_sink=sink, log=lambda *args: None, question_stats=None,
+                       match_history=None, room_directory=directory):
+        for number in range(5):
+            game_engine.create_room(f"dir{number}", f"h{number}")
+            game_engine.join_room_command(f"dir{number}", sink, f"h{number}", f"Host{number}")
+        game_engine.join_room_command("dir0", sink, "p", "Pepe")
+        game_engine.start_game_command("dir1", sink, "h1")
+        
+        first = json.loads(directory.page(clock.now(), offset=0, limit=2))
+        playing = json.loads(directory.page(clock.now(), state="playing"))
+        
+        # Sin cambios: la misma página (mismo objeto) aunque pase el TTL
+        version = directory.version
+        body = directory.page(clock.now())
+        game_engine.touch_room(game_engine.get_room("dir0"))
+        clock.advance(5)
+        unchanged = directory.version == version and directory.page(clock.now()) is body
+        
+        # Con cambios: se sirve la página vieja hasta que vence el TTL
+        game_engine.remove_player_from_room("dir0", "h0")
+        stale = json.loads(directory.page(clock.now()))["rooms"][0]["host"]
+        clock.advance(1.5)
+        fresh = json.loads(directory.page(clock.now()))["rooms"][0]
+        
+        game_engine.close_room("dir2", sink, "test")
+        game_engine.remove_player_from_room("dir3", "h3")
+        remaining = [entry["room_id"] for entry in json.loads(directory.page(clock.now() + 2))["rooms"]]
+    
+    checks = [
+        (first["total"] == 5 and [entry["room_id"] for entry in first["rooms"]] == ["dir0", "dir1"], "paginación"),
+        (first["rooms"][0] == {"room_id": "dir0", "players": 2, "state": "waiting", "host": "Host0", "tournament": None,
+                                      "mega": None},
+         "jugadores, estado y host"),
+        ([entry["room_id"] for entry in playing["rooms"]] == ["dir1"], "filtro por estado"),
+        (unchanged, "sin cambios la página cacheada se reutiliza"),
+        (stale == "Host0" and fresh["host"] == "Pepe" and fresh["players"] == 1, "caché con TTL corto"),
+        (remaining == ["dir0", "dir1", "dir4"], "salas cerradas o vacías salen del índice"),
+    ]
+    
+    return report(checks)
+
+def test_profiling():
+    """Prueba las herramientas de perfilado: muestreo, tamaños por sala y retraso del loop"""
+    print("\n🧪 Probando herramientas de perfilado...")
+    
+    import asyncio
+    import threading
+    import time
+    import profiling
+    
+    # Muestreo de un hilo ocupado en una función conocida
+    def busy_loop(stop):
+        while not stop.is_set():
+            sum(range(1000))
+    
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,))
+    worker.start()
+    try:
+        counts = profiling.sample_stacks(worker.ident, 0.2, interval=0.002)
+    finally:
+        stop.set()
+        worker.join()
+    collapsed = profiling.collapsed_stacks(counts)
+    
+    # Tamaño estimado: una sala con más respuestas pesa más
+    def room(answers):
+        return {"players": {"a": {"name": "Ana", "score": 0}},
+                "round_answers": {"a": [{"answer": f"respuesta {i}", "timestamp": float(i)} for i in range(answers)]},
+                "used_questions": {1, 2, 3}}
+    memory = asyncio.run(profiling.room_memory({"chica": room(1), "grande": room(200)}, top=1))
+    
+    # Un bloqueo del event loop aparece como retraso
+    async def blocked_loop():
+        monitor = profiling.LoopLagMonitor(interval=0.01)
+        task = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.03)
+        time.sleep(0.1)
+        await asyncio.sleep(0.03)
+        task.cancel()
+        return monitor.stats()
+    lag = asyncio.run(blocked_loop())
+    
+    checks = [
+        ("busy_loop (test_sistema.py:" in collapsed and all(line.rsplit(" ", 1)[1].isdigit()
+                                                            for line in collapsed.splitlines()),
+         "pilas colapsadas del hilo muestreado"),
+        (memory["rooms"] == 2 and [entry["room_id"] for entry in memory["largest"]] == ["grande"], "sala más pesada"),
+        (memory["largest"][0]["round_answers"] > 200 * 100, "round_answers cuenta cada respuesta guardada"),
+        (profiling.deep_size([["x"] * 10]) < profiling.deep_size([["x%d" % i for i in range(10)]]),
+         "objetos compartidos se cuentan una vez"),
+        (lag["max_ms"] >= 80, "retraso del event loop"),
+    ]
+    
+    return report(checks)
+
+def test_mega_room():
+    """Prueba una partida masiva repartida en fragmentos: podio, posiciones y fin anticipado"""
+    print("\n🧪 Probando partidas masivas...")
+    
+    import mega_room
+    from match_history import MatchHistory
+    
+    # Los comandos de cada fragmento quedan en cola, como en el actor de su sala
+    pending = []
+    
+    def drain():
+        while pending:
+            shard_id, command, args = pending.pop(0)
+            game_engine.run_command_now(shard_id, command, *args)
+    
+    sink = RecordingSink()
+    clock = game_engine.VirtualClock()
+    history = MatchHistory()
+    with engine_config(clock=clock, default_sink=sink, log=lambda *args: None, question_stats=None,
+                       dispatch=lambda shard_id, command, *args: pending.append((shard_id, command, args)),
+                       match_history=history):
+        mega = mega_room.create_mega("masiva", "p0", shard_size=3)
+        for number in range(7):
+            shard_id = mega_room.assign_shard_command("masiva", sink, f"p{number}", f"Jugador{number}")
+            game_engine.run_command_now(shard_id, mega_room.join_shard_command, "masiva", f"p{number}",
+                                        f"Jugador{number}")
+        duplicate = mega_room.assign_shard_command("masiva", sink, "otro", "jugador3")
+        shard_sizes = [len(game_engine.get_room(shard_id)["players"]) for shard_id in mega["shards"]]
+        
+        mega_room.start_mega_command("masiva", sink, "p0")
+        started_by_actor = not any(game_engine.get_room(shard_id)["game_started"] for shard_id in mega["shards"])
+        drain()
+        started_by_actor = started_by_actor and all(game_engine.get_room(shard_id)["game_started"]
+                                                    for shard_id in mega["shards"])
+        round_starts = len(sink.sent("round_start"))
+        answer = mega["question"]["respuestas"][0]
+        
+        # El primero en acertar está en otro fragmento que los demás
+        for sid in ("p4", "p1", "p0"):
+            clock.advance(1)
+            game_engine.run_command_now(mega["players"][sid][0], game_engine.submit_answer_command, sid, answer)
+        clock.advance(game_engine.ROUND_SECONDS)
+        first_shard = game_engine.get_room(mega["players"]["p4"][0])
+        while pending and not sink.sent("round_end"):
+            shard_id, command, args = pending.pop(0)
+            game_engine.run_command_now(shard_id, command, *args)
+        # El último fragmento en informar une los resultados; el bonus lo suma el fragmento del primero
+        score_before = first_shard["players"]["p4"]["score"]
+        drain()
+        bonus_applied = score_before == 1 and first_shard["players"]["p4"]["score"] == 3
+        round_end = sink.sent("round_end")[-1]
+        ranks = sorted((data["rank"], data["score"]) for data in sink.sent("round_rank"))
+        
+        # Segunda ronda: si todos aciertan termina sin esperar el timer
+        clock.advance(mega_room.RESULTS_DELAY)
+        drain()
+        answer = mega["question"]["respuestas"][0]
+        started_at = clock.now()
+        for sid, (shard_id, _) in list(mega["players"].items()):
+            game_engine.run_command_now(shard_id, game_engine.submit_answer_command, sid, answer)
+        drain()
+        early = mega["rounds_played"] == 2 and clock.now() == started_at
+        
+        # Un acierto de quien se fue no cuenta para terminar la ronda antes de tiempo
+        other = mega_room.create_mega("chica", "q0", shard_size=2)
+        for number in range(3):
+            shard_id = mega_room.assign_shard_command("chica", sink, f"q{number}", f"Otro{number}")
+            game_engine.run_command_now(shard_id, mega_room.join_shard_command, "chica", f"q{number}",
+                                        f"Otro{number}")
+        mega_room.start_mega_command("chica", sink, "q0")
+        drain()
+        other_answer = other["question"]["respuestas"][0]
+        game_engine.run_command_now(other["players"]["q0"][0], game_engine.submit_answer_command, "q0", other_answer)
+        game_engine.run_command_now(other["players"]["q0"][0], game_engine.leave_room_command, "q0")
+        mega_room.leave_mega_command("chica", sink, "q0")
+        game_engine.run_command_now(other["players"]["q2"][0], game_engine.submit_answer_command, "q2", other_answer)
+        drain()
+        waits_for_present = other["question"] is not None
+        game_engine.run_command_now(other["players"]["q1"][0], game_engine.submit_answer_command, "q1", other_answer)
+        drain()
+        waits_for_present = waits_for_present and other["rounds_played"] == 1
+        
+        # Los fragmentos se cierran con sus propios actores
+        mega_room.close_mega(mega, sink, "test")
+        mega_room.close_mega(other, sink, "test")
+        closed_by_actor = all(game_engine.get_room(shard_id) for shard_id in mega["shards"])
+        drain()
+        exported = [json.loads(line) for line in history.ndjson_lines(history.rooms("masiva")[0])]
+        closed = closed_by_actor and not game_engine.game_state["mega_rooms"] and \
+            not any("~" in room_id for room_id in game_engine.game_state["rooms"])
+    
+    checks = [
+        (shard_sizes == [3, 3, 1] and duplicate is None, "jugadores repartidos en fragmentos, nombres únicos"),
+        (started_by_actor and round_starts == 3, "la partida y la ronda arrancan en todos los fragmentos"),
+        ([(entry["name"], entry["is_first"], entry["points"]) for entry in round_end["results"]] ==
+         [("Jugador4", True, 3), ("Jugador1", False, 1), ("Jugador0", False, 1)], "podio global entre fragmentos"),
+        (round_end["total_players"] == 7 and round_end["leaderboard"][0]["name"] == "Jugador4", "leaderboard global"),
+        (ranks == [(1, 3), (2, 1), (2, 1), (4, 0), (4, 0), (4, 0), (4, 0)], "posición global de cada jugador"),
+        (early, "fin anticipado cuando aciertan todos"),
+        (waits_for_present, "los aciertos de quien se fue no adelantan el fin de la ronda"),
+        (bonus_applied, "el bonus lo aplica el actor del fragmento"),
+        ([line["type"] for line in exported] == ["round", "round", "match"] and
+         exported[0]["points"] == {"Jugador4": 3, "Jugador1": 1, "Jugador0": 1} and
+         len(exported[1]["answers"]) == 7 and exported[2]["scores"]["Jugador4"] == exported[2]["scores"]["Jugador0"] == 4 and
+         exported[2]["close_reason"] == "test", "rondas en el historial exportable"),
+        (closed, "cierre de la partida"),
+    ]
+    
+    return report(checks)
+
+def test_dashboard():
+    """Prueba el panel en vivo: contadores de respuestas, totales del directorio y SSE compartido"""
+    print("\n🧪 Probando panel de administración...")
+    
+    import asyncio
+    import json
+    from dashboard import DashboardFeed, LiveStats
+    from room_directory import RoomDirectory, room_state
+    
+    sink = game_engine.EventSink()
+    stats = LiveStats()
+    directory = RoomDirectory()
+    with engine_config(clock=game_engine.VirtualClock(), default_sink=sink, log=lambda *args: None,
+                       question_stats=None, match_history=None, room_directory=directory, live_stats=stats):
+        for number in range(3):
+            game_engine.create_room(f"panel{number}", f"h{number}")
+            game_engine.join_room_command(f"panel{number}", sink, f"h{number}", f"Host{number}")
+        game_engine.join_room_command("panel0", sink, "p", "Pepe")
+        game_engine.start_game_command("panel0", sink, "h0")
+        game_engine.remove_player_from_room("panel2", "h2")
+        
+        answer = game_engine.get_room("panel0")["current_question"]["respuestas"][0]
+        game_engine.submit_answer_command("panel0", sink, "p", "respuesta equivocada")
+        game_engine.submit_answer_command("panel0", sink, "h0", answer)
+        
+        totals = directory.totals()
+        rooms = [game_engine.get_room(f"panel{number}") for number in range(3)]
+        recount = {state: sum(1 for room in rooms if room and room_state(room) == state)
+                   for state in ("waiting", "playing", "finished")}
+        players = sum(len(room["players"]) for room in rooms if room)
+        sample = stats.sample(0.0)
+    
+    second = stats.sample(2.0)
+    
+    async def read_feed():
+        feed = DashboardFeed()
+        feed.publish({"n": 1})
+        streams = [feed.stream(5), feed.stream(5)]
+        first = [await stream.__anext__() for stream in streams]
+        waiting = [asyncio.ensure_future(stream.__anext__()) for stream in streams]
+        await asyncio.sleep(0)
+        feed.publish({"n": 2})
+        frames = await asyncio.gather(*waiting)
+        subscribers = feed.subscribers
+        for stream in streams:
+            await stream.aclose()
+        return first, frames, subscribers, feed.subscribers
+    
+    first, frames, subscribers, closed = asyncio.run(read_feed())
+    
+    checks = [
+        (totals["by_state"] == recount and totals["rooms"] == 2, "salas por estado sin recorrer el índice"),
+        (totals["players"] == players == 3, "jugadores en total"),
+        (sample["total"] == 2 and sample["correct_rate"] == 0.5 and sample["grading_avg_ms"] > 0,
+         "respuestas, aciertos y latencia de evaluación"),
+        (second["per_second"] == 0.0 and second["total"] == 2 and second["grading_max_ms"] == 0.0,
+         "cada muestra cuenta desde la anterior"),
+        (first[0].startswith("retry:") and '"n": 1' in first[0], "el panel recibe la última foto al conectarse"),
+        (frames[0] is frames[1] and json.loads(frames[0].split("data: ")[1]) == {"n": 2},
+         "todos los paneles reciben el mismo texto ya serializado"),
+        (subscribers == 2 and closed == 0, "paneles conectados"),
+    ]
+    
+    return report(checks)
+
+async def connect_wire_clients(server, queries):
+    """
+    Conecta a un WireServer un cliente por cada query string, sin sockets reales.
+    Devuelve los sid de Socket.IO y la lista donde quedan los paquetes enviados
+    (eio_sid, paquete Engine.IO)
+    """
+    sent = []
+    
+    async def send(eio_sid, eio_pkt):
+        sent.append((eio_sid, eio_pkt))
+    
+    server._send_eio_packet = send
+    sids = []
+    for number, query in enumerate(queries):
+        eio_sid = f"eio-{number}"
+        await server._handle_eio_connect(eio_sid, {"QUERY_STRING": query})
+        await server._handle_eio_message(eio_sid, "0")
+        sids.append(server.manager.sid_from_eio_sid(eio_sid, "/"))
+    sent.clear()
+    return sids, sent
+
+def test_wire_format():
+    """Prueba que cada cliente reciba los broadcasts en su formato, codificados una vez por formato"""
+    print("\n🧪 Probando formato de transmisión...")
+    
+    import asyncio
+    from wire_format import WireServer, WirePacket
+    
+    server = WireServer(async_mode="asgi", allow_msgpack=True)
+    payload = {"question_id": 7, "texto": "¿Quién pintó el Guernica?", "duration": 30}
+    encodes = []
+    encode_eio_packets = server.encode_eio_packets
+    server.encode_eio_packets = lambda pkt, wire_format: encodes.append(wire_format) or encode_eio_packets(pkt, wire_format)
+    
+    async def broadcast():
+        sids, sent = await connect_wire_clients(server, ["", "wire=msgpack", "EIO=4&wire=json"])
+        for sid in sids:
+            await server.enter_room(sid, "sala")
+        encodes.clear()
+        await server.emit("round_start", payload, room="sala")
+        return sent
+    
+    sent = asyncio.run(broadcast())
+    received = {eio_sid: eio_pkt.data for eio_sid, eio_pkt in sent}
+    
+    checks = [
+        (server.wire_formats == {"eio-0": "json", "eio-1": "msgpack", "eio-2": "json"}, "formato negociado con ?wire="),
+        (len(sent) == 3, "un paquete por cliente"),
+        (isinstance(received["eio-0"], str) and isinstance(received["eio-1"], bytes), "JSON como texto y msgpack como binario"),
+        (all(WirePacket(encoded_packet=data).data == ["round_start", payload] for data in received.values()),
+         "cada cliente decodifica el mismo evento"),
+        (sorted(encodes) == ["json", "msgpack"], "el evento se codifica una sola vez por formato"),
+        (server.wire_stats() == {"msgpack": 1, "json": 2}, "clientes conectados por formato"),
+    ]
+    
+    return report(checks)
+
+def test_backpressure():
+    """Prueba que un cliente lento pierda o colapse solo los eventos que lo permiten"""
+    print("\n🧪 Probando contrapresión...")
+    
+    import asyncio
+    from types import SimpleNamespace
+    from wire_format import WireServer, WirePacket
+    
+    server = WireServer(async_mode="asgi", outbound_queue_limit=2, droppable_events={"player_answered"},
+                        collapsible_events={"players_update"})
+    backlog = [0]
+    
+    def events(sent):
+        return [WirePacket(encoded_packet=eio_pkt.data).data for eio_sid, eio_pkt in sent]
+    
+    async def slow_client():
+        (sid,), sent = await connect_wire_clients(server, [""])
+        server.eio.sockets["eio-0"] = SimpleNamespace(queue=SimpleNamespace(qsize=lambda: backlog[0]))
+        backlog[0] = 5
+        await server.emit("player_answered", {"name": "Ana"}, to=sid)
+        await server.emit("players_update", {"version": 1}, to=sid)
+        await server.emit("round_start", {"question_id": 1}, to=sid)
+        await server.emit("players_update", {"version": 2}, to=sid)
+        await server.emit("round_end", {"question_id": 1}, to=sid)
+        await server.flush_collapsed()
+        while_slow = events(sent)
+        stats_slow = server.backpressure_stats()
+        
+        backlog[0] = 0
+        sent.clear()
+        await server.flush_collapsed()
+        return while_slow, stats_slow, events(sent)
+    
+    while_slow, stats_slow, after = asyncio.run(slow_client())
+    stats = server.backpressure_stats()
+    
+    checks = [
+        (while_slow == [["round_start", {"question_id": 1}], ["round_end", {"question_id": 1}]],
+         "inicio y fin de ronda siempre llegan; lo demás espera o se descarta"),
+        (stats_slow["dropped"] == {"player_answered": 1}, "evento descartable perdido y contado"),
+        (stats_slow["collapsed"] == {"players_update": 1} and stats_slow["collapsed_pending"] == 1,
+         "la lista de jugadores anterior queda reemplazada por la última"),
+        (after == [["players_update", {"version": 2}]], "al vaciarse la cola se envía solo la última versión"),
+        (stats["collapsed_pending"] == 0 and stats["collapsed_flushed"] == 1, "métricas de lo colapsado enviado"),
+    ]
+    
+    return report(checks)
+
+def test_room_actor():
+    """Prueba que el actor de una sala serialice comandos concurrentes y agrupe sus eventos"""
+    print("\n🧪 Probando actor de sala...")
+    
+    import asyncio
+    import server
+    
+    emitted = []
+    closed = []
+    
+    async def record_emit(event, data, room=None, **kwargs):
+        emitted.append((event, data, room))
+    
+    async def record_membership(*args, **kwargs):
+        pass
+    
+    async def record_close(room, **kwargs):
+        closed.append(room)
+    
+    clock = game_engine.VirtualClock()
+    
+    async def play():
+        room = game_engine.create_room("actor", "a")
+        # Tres uniones que llegan juntas se procesan en un lote
+        await asyncio.gather(*(server.run_room_command("actor", game_engine.join_room_command, sid, name)
+                               for sid, name in (("a", "Ana"), ("b", "Beto"), ("c", "Caro"))))
+        roster_updates = [data for event, data, target in emitted if event == "players_update"]
+        
+        await server.run_room_command("actor", game_engine.start_game_command, "a")
+        answer = room["current_question"]["respuestas"][0]
+        for sid in ("a", "b"):
+            await server.run_room_command("actor", game_engine.submit_answer_command, sid, answer)
+        # El último acierto y el fin de la ronda por tiempo llegan a la vez
+        last_answer = asyncio.create_task(
+            server.run_room_command("actor", game_engine.submit_answer_command, "c", answer))
+        clock.advance(game_engine.ROUND_SECONDS)
+        await asyncio.gather(last_answer, *list(server.timer_commands))
+        
+        actor = room["actor_task"]
+        await server.run_room_command("actor", game_engine.close_room, "test")
+        return room, roster_updates, actor
+    
+    originals = (server.sio.emit, server.sio.enter_room, server.sio.leave_room, server.sio.close_room)
+    with engine_config(clock=clock, dispatch=server.dispatch_room_command, log=lambda *args: None,
+                       question_stats=None, match_history=None):
+        try:
+            server.sio.emit, server.sio.enter_room, server.sio.leave_room, server.sio.close_room = (
+                record_emit, record_membership, record_membership, record_close)
+            room, roster_updates, actor = asyncio.run(play())
+        finally:
+            server.sio.emit, server.sio.enter_room, server.sio.leave_room, server.sio.close_room = originals
+    
+    round_ends = [data for event, data, target in emitted if event == "round_end"]
+    errors = [data for event, data, target in emitted if event == "error"]
+    checks = [
+        (len(roster_updates) == 1 and len(roster_updates[0]["players"]) == 3,
+         "las uniones de un lote envían una sola lista de jugadores"),
+        (len([event for event, data, target in emitted if event == "room_joined"]) == 3, "cada jugador recibe su confirmación"),
+        (len(round_ends) == 1 and not errors, "la ronda termina una sola vez aunque el tiempo y el acierto lleguen juntos"),
+        (bool(round_ends) and round_ends[0]["scores"]["Caro"] > 0, "el acierto que llegó antes que el tiempo cuenta"),
+        ("actor" in closed and game_engine.get_room("actor") is None, "la sala se cierra"),
+        (actor is not None and actor.done() and room["actor_task"] is None, "el actor termina al cerrarse la sala"),
+    ]
+    
+    return report(checks)
+
+def test_reap_stale_players():
+    """Prueba que quitar jugadores sin conexión avise a la sala y cierre la ronda si corresponde"""
+    print("\n🧪 Probando limpieza de jugadores sin conexión...")
+    
+    import server
+    
+    sink = RecordingSink()
+    is_connected = server.sio.manager.is_connected
+    with engine_config(clock=game_engine.VirtualClock(), default_sink=sink, log=lambda *args: None,
+                       question_stats=None, match_history=None):
+        try:
+            # Solo "c" perdió la conexión sin avisar
+            server.sio.manager.is_connected = lambda sid, namespace: sid != "c"
+            room = game_engine.create_room("limpieza", "a")
+            for sid, name in (("a", "Ana"), ("b", "Beto"), ("c", "Caro")):
+                game_engine.join_room_command("limpieza", sink, sid, name)
+            game_engine.start_game_command("limpieza", sink, "a")
+            answer = room["current_question"]["respuestas"][0]
+            for sid in ("a", "b"):
+                game_engine.submit_answer_command("limpieza", sink, sid, answer)
+            round_open = room["current_question"] is not None
+            server.reap_room_command("limpieza", sink, game_engine.current_time())
+        finally:
+            server.sio.manager.is_connected = is_connected
+    
+    checks = [
+        (round_open and list(room["players"]) == ["a", "b"], "jugador sin conexión quitado"),
+        (sink.sent("player_left") == [{"name": "Caro"}], "los demás se enteran de que salió"),
+        (len(sink.sent("round_end")) == 1, "la ronda termina si los que quedan ya acertaron"),
+    ]
+    
+    return report(checks)
+
+def test_reap_reasons():
+    """Prueba que cada sala se cierre por su motivo justo al cumplirse su plazo"""
+    print("\n🧪 Probando motivos de cierre de salas...")
+    
+    import server
+    
+    sink = RecordingSink()
+    clock = game_engine.VirtualClock()
+    with engine_config(clock=clock, default_sink=sink, log=lambda *args: None,
+                       question_stats=None, match_history=None):
+        empty = game_engine.create_room("vacia", "a")
+        finished = game_engine.create_room("terminada", "a")
+        idle = game_engine.create_room("quieta", "a")
+        playing = game_engine.create_room("jugando", "a")
+        for room_id in ("terminada", "quieta", "jugando"):
+            game_engine.join_room_command(room_id, sink, "a", "Ana")
+        game_engine.start_game_command("jugando", sink, "a")
+        finished["game_finished"] = True
+        finished["finished_at"] = clock.now()
+        
+        start = clock.now()
+        reasons = {}
+        for name, room, ttl in (("empty", empty, game_engine.ROOM_EMPTY_TTL),
+                                ("finished", finished, game_engine.ROOM_FINISHED_TTL),
+                                ("idle", idle, game_engine.ROOM_IDLE_TTL)):
+            reasons[name] = (game_engine.get_reap_reason(room, start + ttl - 1),
+                             game_engine.get_reap_reason(room, start + ttl))
+        playing_reason = game_engine.get_reap_reason(playing, start + game_engine.ROOM_IDLE_TTL)
+        
+        is_connected = server.sio.manager.is_connected
+        try:
+            server.sio.manager.is_connected = lambda sid, namespace: True
+            server.reap_room_command("vacia", sink, start + game_engine.ROOM_EMPTY_TTL)
+            server.reap_room_command("quieta", sink, start + game_engine.ROOM_EMPTY_TTL)
+        finally:
+            server.sio.manager.is_connected = is_connected
+        empty_closed = game_engine.get_room("vacia") is None
+        idle_open = game_engine.get_room("quieta") is idle
+    
+    checks = [
+        (reasons["empty"] == (None, "empty"), "sala vacía se cierra al cumplir ROOM_EMPTY_TTL"),
+        (reasons["finished"] == (None, "finished"), "partida terminada se cierra al cumplir ROOM_FINISHED_TTL"),
+        (reasons["idle"] == (None, "idle"), "sala sin ronda se cierra al cumplir ROOM_IDLE_TTL"),
+        (playing_reason is None, "sala con ronda en curso no se cierra por inactividad"),
+        (empty_closed and idle_open, "la limpieza cierra solo la sala que ya cumplió su plazo"),
+    ]
+    
+    return report(checks)
+
+def test_import_budget():
+    """Prueba que importar el motor y el servidor sea rápido y sin efectos secundarios"""
+    print("\n🧪 Probando tiempo de importación...")
+    
+    import subprocess
+    from import_time import check
+    
+    engine = check({"game_engine": 250}, runs=1)[0]
+    result = subprocess.run(
+        [sys.executable, "-c", "import server, game_engine; print(len(game_engine.game_state['questions']))"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+    )
+    
+    checks = [
+        (not engine["eager"], "pandas, Pillow y rapidfuzz no se importan con el motor"),
+        (engine["ok"], f"motor importado en {engine['ms']} ms (presupuesto 250 ms)"),
+        (result.returncode == 0 and result.stdout.strip() == "0", "importar el servidor no carga preguntas"),
+    ]
+    
+    return report(checks)
+
 def test_csv_format():
     """Verifica el formato del archivo CSV"""
     print("\n🧪 Probando formato del CSV...")
@@ -88,26 +1275,29 @@ def test_csv_format():
         return False
     
     try:
-        import pandas as pd
-        df = pd.read_csv(csv_path)
+        import csv
+        with open(csv_path, newline="", encoding="utf-8") as file:
+            reader = csv.DictReader(file)
+            rows = list(reader)
+            columns = reader.fieldnames or []
         
         required_columns = ['id', 'tipo', 'texto', 'respuestas']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in required_columns if col not in columns]
         
         if missing_columns:
             print(f"❌ Columnas faltantes: {missing_columns}")
             return False
         
-        print(f"✅ CSV válido con {len(df)} filas")
-        print(f"   Columnas: {list(df.columns)}")
+        print(f"✅ CSV válido con {len(rows)} filas")
+        print(f"   Columnas: {list(columns)}")
         
         # Verificar que hay datos
-        if len(df) == 0:
+        if len(rows) == 0:
             print("⚠️ El CSV está vacío")
             return False
         
         # Verificar algunos tipos
-        tipos_unicos = df['tipo'].unique()
+        tipos_unicos = list(dict.fromkeys(row['tipo'] for row in rows))
         print(f"   Tipos de preguntas: {list(tipos_unicos)}")
         
         return True
@@ -125,7 +1315,32 @@ def main():
         test_csv_format,
         test_load_questions,
         test_normalize_text,
-        test_check_answer
+        test_check_answer,
+        test_rank_players,
+        test_verdict_cache,
+        test_question_stats,
+        test_simulation,
+        test_question_bank_validator,
+        test_late_join_snapshot,
+        test_reconnect_grace,
+        test_reconnect_before_drop,
+        test_spectators,
+        test_image_meta,
+        test_tournament,
+        test_tournament_cleanup,
+        test_match_history,
+        test_accept_alias,
+        test_room_alias,
+        test_room_directory,
+        test_profiling,
+        test_mega_room,
+        test_dashboard,
+        test_wire_format,
+        test_backpressure,
+        test_room_actor,
+        test_reap_stale_players,
+        test_reap_reasons,
+        test_import_budget
     ]
     
     passed = 0
@@ -0,0 +1,375 @@
+"""
+Torneos de Trivia LAN
+Reparte a los inscriptos en salas que juegan en paralelo. Un único timer del motor
+arranca la ronda de todas las salas de la etapa a la vez; cuando todas terminaron
+la partida, los ganadores pasan a la siguiente etapa hasta que queda un campeón
+"""
+
+import math
+import random
+from typing import Dict, List, Optional, Tuple
+
+import game_engine
+from config import GAME_CONFIG
+from game_engine import (
+    EventSink, add_player_to_room, create_room, current_round_payload, game_state,
+    get_room, index_room, invalidate_snapshot, rank_players, room_audience, room_snapshot_json, start_round
+)
+
+TOURNAMENT_ROOM_SIZE = GAME_CONFIG["TOURNAMENT_ROOM_SIZE"]  # Jugadores por sala en cada etapa
+TOURNAMENT_ROUNDS_PER_MATCH = GAME_CONFIG["TOURNAMENT_ROUNDS_PER_MATCH"]  # Rondas por partida
+TOURNAMENT_START_DELAY = GAME_CONFIG["TOURNAMENT_START_DELAY"]  # Espera antes de la primera ronda de cada etapa
+RESULTS_DELAY = GAME_CONFIG["RESULTS_DELAY"]  # Pausa entre rondas (igual que el botón "siguiente ronda")
+TOURNAMENT_FINISHED_TTL = GAME_CONFIG["ROOM_FINISHED_TTL"]  # Tiempo que se conserva un torneo terminado
+
+
+def tournament_channel(tournament_id: str) -> str:
+    """
+    Sala de Socket.IO con todos los inscriptos (avisos del torneo)
+    """
+    return f"tournament:{tournament_id}"
+
+
+def get_tournament(tournament_id: str) -> Optional[Dict]:
+    """
+    Obtiene un torneo por su ID
+    """
+    return game_state["tournaments"].get(tournament_id)
+
+
+def create_tournament(tournament_id: str, organizer_sid: str, room_size: int = TOURNAMENT_ROOM_SIZE,
+                      rounds_per_match: int = TOURNAMENT_ROUNDS_PER_MATCH,
+                      start_delay: float = TOURNAMENT_START_DELAY) -> Dict:
+    """
+    Crea un torneo en inscripción
+    """
+    tournament = {
+        "id": tournament_id,
+        "organizer": organizer_sid,
+        "players": {},  # sid -> nombre
+        "room_size": max(2, room_size),
+        "rounds_per_match": max(1, rounds_per_match),
+        "start_delay": start_delay,
+        "status": "registering",  # registering | running | finished
+        "stage": 0,
+        "stage_rooms": [],  # Salas de la etapa actual
+        "pending_rooms": set(),  # Salas que todavía juegan la ronda sincronizada en curso
+        "stage_winners": [],  # (sid, nombre) de los ganadores de la etapa actual
+        "rounds_played": 0,  # Rondas jugadas entre todas las salas
+        "started_at": None,
+        "finished_at": None,
+        "champion": None
+    }
+    game_state["tournaments"][tournament_id] = tournament
+    return tournament
+
+
+def tournament_stats(tournament: Dict) -> Dict:
+    """
+    Resumen del torneo, incluido el rendimiento agregado (rondas/s entre todas las salas)
+    """
+    elapsed = None
+    if tournament["started_at"] is not None:
+        elapsed = (tournament["finished_at"] or game_engine.clock.now()) - tournament["started_at"]
+
+    return {
+        "id": tournament["id"],
+        "status": tournament["status"],
+        "players": len(tournament["players"]),
+        "stage": tournament["stage"],
+        "rooms": len(tournament["stage_rooms"]),
+        "rooms_playing": sum(1 for room_id in tournament["stage_rooms"]
+                             if (room := get_room(room_id)) and not room["game_finished"]),
+        "rounds_played": tournament["rounds_played"],
+        "seconds": round(elapsed, 3) if elapsed is not None else None,
+        "rounds_per_second": round(tournament["rounds_played"] / elapsed, 3) if elapsed else None,
+        "champion": tournament["champion"]
+    }
+
+
+def join_tournament_command(tournament_id: str, sink: EventSink, sid: str, player_name: str):
+    """
+    Inscribe a un jugador (el primero en inscribirse crea el torneo y lo organiza)
+    """
+    tournament = get_tournament(tournament_id) or create_tournament(tournament_id, sid)
+
+    if tournament["status"] != "registering":
+        sink.error(sid, "El torneo ya comenzó")
+        return
+
+    if any(name.lower() == player_name.lower() for name in tournament["players"].values()):
+        sink.error(sid, "Nombre de jugador ya en uso")
+        return
+
+    tournament["players"][sid] = player_name
+    sink.enter_room(sid, tournament_channel(tournament_id))
+
+    sink.emit("tournament_joined", {
+        "tournament_id": tournament_id,
+        "player_name": player_name,
+        "is_organizer": tournament["organizer"] == sid,
+        "room_size": tournament["room_size"],
+        "rounds_per_match": tournament["rounds_per_match"]
+    }, room=sid)
+    sink.emit("tournament_update", {
+        "players": list(tournament["players"].values()),
+        **tournament_stats(tournament)
+    }, room=tournament_channel(tournament_id))
+
+    game_engine.log(f"🏆 {player_name} se inscribió en el torneo {tournament_id}")
+
+
+def leave_tournament_command(tournament_id: str, sink: EventSink, sid: str):
+    """
+    Da de baja a un jugador mientras el torneo está en inscripción (una vez iniciado,
+    quien se va simplemente abandona su sala)
+    """
+    tournament = get_tournament(tournament_id)
+    if not tournament or tournament["status"] != "registering" or sid not in tournament["players"]:
+        return
+
+    del tournament["players"][sid]
+    sink.leave_room(sid, tournament_channel(tournament_id))
+
+    if not tournament["players"]:
+        del game_state["tournaments"][tournament_id]
+        return
+
+    if tournament["organizer"] == sid:
+        tournament["organizer"] = next(iter(tournament["players"]))
+    sink.emit("tournament_update", {
+        "players": list(tournament["players"].values()),
+        "organizer": tournament["players"][tournament["organizer"]],
+        **tournament_stats(tournament)
+    }, room=tournament_channel(tournament_id))
+
+
+def start_tournament_command(tournament_id: str, sink: EventSink, sid: str):
+    """
+    Cierra la inscripción y arma las salas de la primera etapa (solo el organizador)
+    """
+    tournament = get_tournament(tournament_id)
+    if not tournament:
+        sink.error(sid, "Torneo no encontrado")
+        return
+
+    if tournament["organizer"] != sid:
+        sink.error(sid, "Solo el organizador puede iniciar el torneo")
+        return
+
+    if tournament["status"] != "registering":
+        sink.error(sid, "El torneo ya comenzó")
+        return
+
+    if len(tournament["players"]) < 2:
+        sink.error(sid, "Se necesitan al menos 2 jugadores")
+        return
+
+    tournament["status"] = "running"
+    tournament["started_at"] = game_engine.clock.now()
+    seed_stage(tournament, sink, list(tournament["players"].items()))
+
+    game_engine.log(f"🏆 Torneo {tournament_id} iniciado con {len(tournament['players'])} jugadores")
+
+
+def seed_stage(tournament: Dict, sink: EventSink, entrants: List[Tuple[str, str]]):
+    """
+    Reparte a los participantes en salas parejas (al azar) y programa la primera
+    ronda de todas con un solo timer
+    """
+    tournament_id = tournament["id"]
+    tournament["stage"] += 1
+    stage = tournament["stage"]
+
+    entrants = list(entrants)
+    random.shuffle(entrants)
+    room_count = math.ceil(len(entrants) / tournament["room_size"])
+    groups = [entrants[index::room_count] for index in range(room_count)]
+
+    # Sala de la etapa anterior de cada participante (para sacarlo de ahí)
+    previous_rooms = {sid: room_id for room_id in tournament["stage_rooms"]
+                      if (room := get_room(room_id)) for sid in room["players"]}
+    tournament["stage_rooms"] = []
+    tournament["stage_winners"] = []
+    for number, group in enumerate(groups, start=1):
+        room_id = f"{tournament_id}-e{stage}-{number}"
+        room = create_room(room_id, None)
+        room["tournament"] = tournament_id
+        room["on_round_end"] = tournament_round_ended
+        room["on_close"] = tournament_room_closed
+        room["game_started"] = True
+        tournament["stage_rooms"].append(room_id)
+        if game_engine.match_history is not None:
+            game_engine.match_history.start_match(room_id, game_engine.clock.now())
+
+        for sid, player_name in group:
+            add_player_to_room(room_id, sid, player_name)
+        # Nadie es host: las rondas las lanza el torneo
+        room["host"] = None
+        index_room(room)
+
+        for sid, player_name in group:
+            if sid in previous_rooms:
+                sink.leave_room(sid, previous_rooms[sid])
+            sink.enter_room(sid, room_id)
+            sink.emit("tournament_match", {
+                "tournament_id": tournament_id,
+                "stage": stage,
+                "room_id": room_id,
+                "player_name": player_name,
+                "is_host": False,
+                "game_started": True,
+                "state": room_snapshot_json(room),
+                "round": current_round_payload(room)
+            }, room=sid)
+
+    sink.emit("tournament_update", {
+        "rooms_created": len(groups),
+        "players_in_stage": len(entrants),
+        **tournament_stats(tournament)
+    }, room=tournament_channel(tournament_id))
+
+    game_engine.clock.call_later(tournament["start_delay"], fire_stage_round, tournament_id, stage)
+
+
+def fire_stage_round(tournament_id: str, stage: int):
+    """
+    Callback del timer del torneo: inicia la ronda en todas las salas que siguen
+    jugando, cada una a través de su propio despachador de comandos
+    """
+    tournament = get_tournament(tournament_id)
+    if not tournament or tournament["stage"] != stage or tournament["status"] != "running":
+        return
+
+    playing = [room_id for room_id in tournament["stage_rooms"]
+               if (room := get_room(room_id)) and not room["game_finished"]]
+    tournament["pending_rooms"] = set(playing)
+    for room_id in playing:
+        game_engine.dispatch(room_id, tournament_round_command, tournament_id)
+
+
+def tournament_round_command(room_id: str, sink: EventSink, tournament_id: str):
+    """
+    Inicia la siguiente ronda de una partida de torneo
+    """
+    room = get_room(room_id)
+    tournament = get_tournament(tournament_id)
+    if not tournament:
+        return
+
+    if not room or room["game_finished"] or room["current_question"]:
+        # La sala ya no puede jugar esta ronda: no debe frenar al resto
+        room_round_done(tournament, room_id, sink)
+        return
+
+    start_round(room_id, sink)
+    if not room["current_question"]:
+        # Sin preguntas disponibles: la partida termina con las puntuaciones actuales
+        finish_match(tournament, room_id, sink)
+        room_round_done(tournament, room_id, sink)
+
+
+def tournament_round_ended(room_id: str, sink: EventSink):
+    """
+    Gancho de end_round para salas de torneo: cierra la partida al llegar al límite
+    de rondas (o si alguien alcanzó el puntaje objetivo) y avisa al coordinador
+    """
+    room = get_room(room_id)
+    tournament = get_tournament(room["tournament"])
+    if not tournament:
+        return
+
+    tournament["rounds_played"] += 1
+    if room["game_finished"] or room["round_number"] >= tournament["rounds_per_match"]:
+        finish_match(tournament, room_id, sink)
+    room_round_done(tournament, room_id, sink)
+
+
+def tournament_room_closed(room: Dict, sink: EventSink):
+    """
+    Gancho de close_room para salas de torneo: la partida de una sala cerrada por el
+    limpiador (sin actividad o sin jugadores) queda sin ganador y no frena la etapa
+    """
+    tournament = get_tournament(room["tournament"])
+    if not tournament or room["id"] not in tournament["stage_rooms"]:
+        return
+
+    # Entre rondas ya hay un timer para las salas que siguen; solo si no queda
+    # ninguna hay que cerrar la etapa desde acá
+    if room["id"] in tournament["pending_rooms"] or \
+            (not tournament["pending_rooms"] and not stage_playing(tournament)):
+        room_round_done(tournament, room["id"], sink)
+
+
+def stage_playing(tournament: Dict) -> bool:
+    """
+    Indica si alguna sala de la etapa sigue abierta con la partida en juego
+    """
+    return any((room := get_room(room_id)) and not room["game_finished"]
+               for room_id in tournament["stage_rooms"])
+
+
+def forget_tournament(tournament_id: str, tournament: Dict):
+    """
+    Callback del timer: olvida un torneo terminado (si no lo reemplazó otro con el mismo ID)
+    """
+    if game_state["tournaments"].get(tournament_id) is tournament:
+        del game_state["tournaments"][tournament_id]
+
+
+def finish_match(tournament: Dict, room_id: str, sink: EventSink):
+    """
+    Registra al ganador de la sala (el de más puntos; en empate, el primero del ranking)
+    """
+    room = get_room(room_id)
+    ranking = rank_players(room)
+    winner = ranking[0] if ranking else None
+
+    room["game_finished"] = True
+    room["finished_at"] = game_engine.clock.now()
+    room["winner"] = winner["name"] if winner else None
+    invalidate_snapshot(room)
+    index_room(room)
+
+    if winner:
+        tournament["stage_winners"].append((winner["sid"], winner["name"]))
+    if game_engine.match_history is not None:
+        game_engine.match_history.finish_match(room_id, room["winner"], room["finished_at"])
+
+    sink.emit("match_finished", {
+        "tournament_id": tournament["id"],
+        "stage": tournament["stage"],
+        "winner": room["winner"],
+        "leaderboard": [{"rank": entry["rank"], "name": entry["name"], "score": entry["score"]}
+                        for entry in ranking[:game_engine.LEADERBOARD_TOP_K]]
+    }, room=room_audience(room_id))
+
+
+def room_round_done(tournament: Dict, room_id: str, sink: EventSink):
+    """
+    Marca la ronda de la sala como terminada. Cuando terminaron todas, programa la
+    siguiente ronda sincronizada o, si todas las partidas terminaron, la siguiente etapa
+    """
+    tournament["pending_rooms"].discard(room_id)
+    if tournament["pending_rooms"] or tournament["status"] != "running":
+        return
+
+    if stage_playing(tournament):
+        game_engine.clock.call_later(RESULTS_DELAY, fire_stage_round, tournament["id"], tournament["stage"])
+        return
+
+    winners = tournament["stage_winners"]
+    if len(winners) > 1:
+        seed_stage(tournament, sink, winners)
+        return
+
+    tournament["status"] = "finished"
+    tournament["finished_at"] = game_engine.clock.now()
+    tournament["champion"] = winners[0][1] if winners else None
+    stats = tournament_stats(tournament)
+    sink.emit("tournament_finished", stats, room=tournament_channel(tournament["id"]))
+    # Se conserva un rato para consultar el resultado (/tournaments) y después se olvida
+    game_engine.clock.call_later(TOURNAMENT_FINISHED_TTL, forget_tournament, tournament["id"], tournament)
+
+    game_engine.log(f"🏆 Torneo {tournament['id']} terminado: campeón {tournament['champion']} "
+                    f"({stats['rounds_played']} rondas, {stats['rounds_per_second']} rondas/s)")
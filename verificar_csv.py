@@ -1,35 +1,294 @@
-import pandas as pd
+"""
+Validador del banco de preguntas de Trivia LAN
+Recorre los CSV fila por fila y detecta IDs duplicados, imágenes faltantes o con
+tamaño inválido, respuestas vacías o repetidas y respuestas de preguntas distintas
+tan parecidas que el evaluador difuso las confundiría
+
+Uso:
+    python verificar_csv.py                          # data/items.csv y data/items_images.csv
+    python verificar_csv.py banco.csv --report reporte.json
+    python verificar_csv.py --report -               # reporte JSON por stdout
+"""
+
+import argparse
+import csv
+import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from rapidfuzz import fuzz
+from rapidfuzz.process import cdist
+
+from config import GAME_CONFIG
+from game_engine import normalize_text
+from image_meta import IMAGES_DIR, image_path
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow es opcional: sin él solo se verifica que la imagen exista
+    Image = None
+
+DEFAULT_FILES = [os.path.join("data", "items.csv"), os.path.join("data", "items_images.csv")]
+REQUIRED_COLUMNS = {"id", "tipo", "respuestas"}
+DEFAULT_WORKERS = os.cpu_count() or 4
+
+
+class Report:
+    """
+    Problemas encontrados: los errores impiden usar la pregunta, las advertencias no
+    """
+
+    def __init__(self):
+        self.errors: List[Dict] = []
+        self.warnings: List[Dict] = []
+        self.ambiguous: List[Dict] = []
+        self.images: Dict[str, Dict] = {}
+
+    def error(self, code: str, file: str, line: Optional[int], message: str, **extra):
+        self.errors.append({"code": code, "file": file, "line": line, "message": message, **extra})
+
+    def warning(self, code: str, file: str, line: Optional[int], message: str, **extra):
+        self.warnings.append({"code": code, "file": file, "line": line, "message": message, **extra})
+
+
+def inspect_image(path: str) -> Dict:
+    """
+    Verifica que la imagen exista y, si Pillow está instalado, lee sus dimensiones
+    (solo el encabezado, sin decodificar la imagen completa)
+    """
+    if not os.path.isfile(path):
+        return {"exists": False}
+
+    info = {"exists": True, "bytes": os.path.getsize(path)}
+    if Image is not None:
+        try:
+            with Image.open(path) as image:
+                info["width"], info["height"] = image.size
+        except Exception as e:
+            info["unreadable"] = str(e)
+    return info
+
+
+def scan_file(csv_path: str, report: Report, seen_ids: Dict[int, str],
+              answers: List[str], owners: List[int], images: Dict[str, List]) -> int:
+    """
+    Lee un CSV fila por fila validando cada pregunta. Acumula las respuestas
+    normalizadas (para la comparación difusa) y las imágenes a revisar
+    """
+    rows = 0
+    with open(csv_path, newline="", encoding="utf-8") as file:
+        reader = csv.DictReader(file)
+        columns = set(reader.fieldnames or [])
+        missing = REQUIRED_COLUMNS - columns
+        if "pregunta" not in columns and "texto" not in columns:
+            missing.add("texto/pregunta")
+        if missing:
+            report.error("missing_columns", csv_path, 1, f"Faltan columnas: {', '.join(sorted(missing))}")
+            return 0
+
+        for row in reader:
+            rows += 1
+            line = reader.line_num
+
+            try:
+                question_id = int(row["id"])
+            except (TypeError, ValueError):
+                report.error("invalid_id", csv_path, line, f"ID inválido: {row['id']!r}")
+                continue
+
+            if question_id in seen_ids:
+                report.error("duplicate_id", csv_path, line, f"ID {question_id} repetido",
+                             question_id=question_id, first_seen=seen_ids[question_id])
+            else:
+                seen_ids[question_id] = f"{csv_path}:{line}"
+
+            if not (row.get("texto") or row.get("pregunta") or "").strip():
+                report.error("empty_question", csv_path, line, "Pregunta sin texto", question_id=question_id)
+
+            raw_answers = (row.get("respuestas") or "").split(";")
+            normalized = [normalize_text(answer) for answer in raw_answers]
+            if not any(normalized):
+                report.error("no_answers", csv_path, line, "Pregunta sin respuestas", question_id=question_id)
+                continue
+            if not all(normalized):
+                report.warning("empty_answer", csv_path, line, "Respuesta vacía (';' sobrante)",
+                               question_id=question_id)
+
+            unique = []
+            for answer in normalized:
+                if not answer:
+                    continue
+                if answer in unique:
+                    report.warning("duplicate_answer", csv_path, line, f"Respuesta repetida: {answer!r}",
+                                   question_id=question_id)
+                    continue
+                unique.append(answer)
+                answers.append(answer)
+                owners.append(question_id)
+
+            imagen = (row.get("imagen") or "").strip()
+            if "imagen" in columns:
+                if not imagen:
+                    report.error("missing_image", csv_path, line, "Pregunta de imagen sin archivo",
+                                 question_id=question_id)
+                elif not imagen.startswith("http"):
+                    images.setdefault(imagen, []).append((csv_path, line, question_id))
+
+    return rows
+
+
+def check_images(images: Dict[str, List], images_dir: str, report: Report,
+                 min_size: int, max_size: int, workers: int):
+    """
+    Revisa todas las imágenes referenciadas en paralelo (es trabajo de disco)
+    """
+    paths = list(images.keys())
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda imagen: inspect_image(image_path(imagen, images_dir)), paths)
+
+        for imagen, info in zip(paths, results):
+            report.images[imagen] = info
+            for csv_path, line, question_id in images[imagen]:
+                if not info["exists"]:
+                    report.error("image_not_found", csv_path, line, f"No existe {image_path(imagen, images_dir)}",
+                                 question_id=question_id)
+                elif "unreadable" in info:
+                    report.error("image_unreadable", csv_path, line, f"Imagen ilegible: {info['unreadable']}",
+                                 question_id=question_id)
+                elif "width" in info:
+                    smallest, largest = min(info["width"], info["height"]), max(info["width"], info["height"])
+                    if smallest < min_size or largest > max_size:
+                        report.warning("image_size", csv_path, line,
+                                       f"Imagen de {info['width']}x{info['height']} fuera de {min_size}-{max_size} px",
+                                       question_id=question_id)
+
+
+def find_ambiguous_answers(answers: List[str], owners: List[int], threshold: int,
+                           batch_size: int, workers: int) -> List[Dict]:
+    """
+    Pares de respuestas de preguntas distintas con similitud >= threshold: quien
+    responda una podría recibir como correcta la otra. Compara por lotes de filas
+    para no armar la matriz completa de N x N en memoria
+    """
+    # fuzz.ratio = 200 * coincidencias / (largo1 + largo2), así que dos textos solo
+    # pueden llegar al umbral si el más largo mide como máximo largo * (200 - t) / t.
+    # Ordenando por largo, cada lote se compara solo con la ventana que puede alcanzarlo
+    order = sorted(range(len(answers)), key=lambda index: len(answers[index]))
+    answers = [answers[index] for index in order]
+    owners = [owners[index] for index in order]
+    lengths = np.fromiter((len(answer) for answer in answers), dtype=np.int64, count=len(answers))
+    owner_ids = np.asarray(owners)
+    stretch = (200 - threshold) / threshold if threshold > 0 else float("inf")
+
+    pairs = []
+    for start in range(0, len(answers), batch_size):
+        batch = answers[start:start + batch_size]
+        longest = lengths[start + len(batch) - 1] * stretch
+        end = len(answers) if longest == float("inf") else int(np.searchsorted(lengths, longest, side="right"))
+        # Solo hace falta comparar contra las respuestas siguientes (la matriz es simétrica)
+        scores = cdist(batch, answers[start:end], scorer=fuzz.ratio, score_cutoff=threshold,
+                       dtype=np.uint8, workers=workers)
+        rows, columns = np.nonzero(scores)
+        for row, column in zip(rows.tolist(), columns.tolist()):
+            i, j = start + row, start + column
+            if j <= i or owner_ids[i] == owner_ids[j]:
+                continue
+            pairs.append({
+                "question_ids": [owners[i], owners[j]],
+                "answers": [answers[i], answers[j]],
+                "similarity": int(scores[row, column])
+            })
+    return pairs
+
+
+def validate(paths: List[str], images_dir: str = IMAGES_DIR, threshold: int = GAME_CONFIG["FUZZY_MATCH_THRESHOLD"],
+             batch_size: int = 2000, workers: int = DEFAULT_WORKERS, min_size: int = 200, max_size: int = 4000) -> Dict:
+    """
+    Valida uno o más CSV y devuelve el reporte completo
+    """
+    started = time.perf_counter()
+    report = Report()
+    seen_ids: Dict[int, str] = {}
+    answers: List[str] = []
+    owners: List[int] = []
+    images: Dict[str, List] = {}
+
+    rows = 0
+    for csv_path in paths:
+        if not os.path.exists(csv_path):
+            report.error("file_not_found", csv_path, None, "Archivo no encontrado")
+            continue
+        rows += scan_file(csv_path, report, seen_ids, answers, owners, images)
+
+    check_images(images, images_dir, report, min_size, max_size, workers)
+    report.ambiguous = find_ambiguous_answers(answers, owners, threshold, batch_size, workers)
+
+    return {
+        "files": paths,
+        "summary": {
+            "questions": rows,
+            "answers": len(answers),
+            "images": len(images),
+            "errors": len(report.errors),
+            "warnings": len(report.warnings),
+            "ambiguous_pairs": len(report.ambiguous),
+            "seconds": round(time.perf_counter() - started, 3)
+        },
+        "threshold": threshold,
+        "errors": report.errors,
+        "warnings": report.warnings,
+        "ambiguous_pairs": report.ambiguous,
+        "images": report.images
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Valida los CSV del banco de preguntas")
+    parser.add_argument("files", nargs="*", help="CSV a validar (por defecto data/items.csv y data/items_images.csv)")
+    parser.add_argument("--images-dir", default=IMAGES_DIR, help="Directorio de imágenes")
+    parser.add_argument("--threshold", type=int, default=GAME_CONFIG["FUZZY_MATCH_THRESHOLD"],
+                        help="Similitud (0-100) a partir de la cual dos respuestas son ambiguas")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Respuestas por lote en la comparación difusa")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Hilos para imágenes y comparación difusa")
+    parser.add_argument("--min-size", type=int, default=200, help="Lado mínimo de las imágenes (px)")
+    parser.add_argument("--max-size", type=int, default=4000, help="Lado máximo de las imágenes (px)")
+    parser.add_argument("--report", help="Guardar el reporte JSON en este archivo ('-' = stdout)")
+    args = parser.parse_args()
+
+    files = args.files or [path for path in DEFAULT_FILES if os.path.exists(path)] or DEFAULT_FILES
+    result = validate(files, args.images_dir, args.threshold, args.batch_size, args.workers,
+                      args.min_size, args.max_size)
+
+    if args.report == "-":
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        summary = result["summary"]
+        print(f"🔍 {summary['questions']} preguntas, {summary['answers']} respuestas y "
+              f"{summary['images']} imágenes revisadas en {summary['seconds']} s")
+        for problem in result["errors"]:
+            print(f"❌ {problem['file']}:{problem['line']} {problem['message']}")
+        for problem in result["warnings"]:
+            print(f"⚠️ {problem['file']}:{problem['line']} {problem['message']}")
+        for pair in result["ambiguous_pairs"]:
+            print(f"🔀 Preguntas {pair['question_ids'][0]} y {pair['question_ids'][1]}: "
+                  f"{pair['answers'][0]!r} ~ {pair['answers'][1]!r} ({pair['similarity']}%)")
+        if Image is None:
+            print("ℹ️ Pillow no está instalado: no se verificaron dimensiones de imágenes")
+        if not result["errors"]:
+            print("✅ Sin errores")
+
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+            print(f"📄 Reporte guardado en {args.report}")
+
+    sys.exit(1 if result["errors"] else 0)
+
 
-print("🔍 Verificando archivo CSV...")
-
-csv_path = "data/items.csv"
-print(f"Buscando archivo: {os.path.abspath(csv_path)}")
-print(f"¿Existe el archivo? {os.path.exists(csv_path)}")
-
-if os.path.exists(csv_path):
-    try:
-        df = pd.read_csv(csv_path)
-        print(f"✅ CSV cargado exitosamente")
-        print(f"Filas: {len(df)}")
-        print(f"Columnas: {list(df.columns)}")
-        
-        # Mostrar primera pregunta
-        if len(df) > 0:
-            first_row = df.iloc[0]
-            print(f"\nPrimera pregunta:")
-            print(f"ID: {first_row['id']}")
-            print(f"Tipo: {first_row['tipo']}")
-            print(f"Texto: {first_row['texto']}")
-            print(f"Respuestas: {first_row['respuestas']}")
-        
-    except Exception as e:
-        print(f"❌ Error al leer CSV: {e}")
-else:
-    print("❌ Archivo CSV no encontrado")
-
-print("\n🔍 Verificando directorio actual...")
-print(f"Directorio actual: {os.getcwd()}")
-print(f"Contenido del directorio:")
-for item in os.listdir("."):
-    print(f"  - {item}")
+if __name__ == "__main__":
+    main()
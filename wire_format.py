@@ -0,0 +1,224 @@
+"""
+Formato de transmisión de Socket.IO para Trivia LAN
+Cada cliente negocia al conectarse JSON (por defecto) o msgpack (binario, más compacto)
+"""
+
+import asyncio
+from collections import Counter
+from typing import Dict, Iterable, List
+from urllib.parse import parse_qs
+
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+
+try:
+    import msgpack
+except ImportError:  # msgpack es opcional: sin él todos los clientes usan JSON
+    msgpack = None
+
+WIRE_JSON = "json"
+WIRE_MSGPACK = "msgpack"
+
+
+def available_formats(allow_msgpack: bool = True) -> List[str]:
+    """
+    Formatos que el servidor puede ofrecer, en orden de preferencia
+    """
+    if allow_msgpack and msgpack is not None:
+        return [WIRE_MSGPACK, WIRE_JSON]
+    return [WIRE_JSON]
+
+
+class WirePacket(packet.Packet):
+    """
+    Paquete Socket.IO que entiende ambos formatos: los mensajes de texto se
+    decodifican como JSON y los binarios como msgpack
+    """
+
+    def decode(self, encoded_packet):
+        if msgpack is not None and isinstance(encoded_packet, (bytes, bytearray)):
+            decoded = msgpack.loads(encoded_packet)
+            self.packet_type = decoded["type"]
+            self.data = decoded.get("data")
+            self.id = decoded.get("id")
+            self.namespace = decoded["nsp"]
+            return 0
+        return super().decode(encoded_packet)
+
+    def encode_as(self, wire_format: str):
+        """
+        Codifica el paquete en el formato indicado
+        """
+        if wire_format == WIRE_MSGPACK:
+            return msgpack.dumps(self._to_dict())
+        return self.encode()
+
+
+class WireManager(socketio.AsyncManager):
+    """
+    Gestor de clientes que serializa cada broadcast una sola vez por formato
+    (no una vez por destinatario) y entrega a cada cliente su versión
+    """
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None,
+                   callback=None, **kwargs):
+        if callback or namespace not in self.rooms:
+            return await super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                      callback=callback, **kwargs)
+
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        pkt = self.server.packet_class(packet.EVENT, namespace=namespace, data=[event] + data)
+        encoded: Dict[str, List[eio_packet.Packet]] = {}  # formato -> paquetes Engine.IO listos
+        tasks = []
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid in skip_sid:
+                continue
+
+            wire_format = self.server.wire_format(eio_sid)
+            if wire_format not in encoded:
+                encoded[wire_format] = self.server.encode_eio_packets(pkt, wire_format)
+            if not self.server.admit(eio_sid, event, encoded[wire_format]):
+                continue
+            for eio_pkt in encoded[wire_format]:
+                tasks.append(asyncio.create_task(self.server._send_eio_packet(eio_sid, eio_pkt)))
+
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+class WireServer(socketio.AsyncServer):
+    """
+    Servidor Socket.IO con formato de transmisión negociado por cliente.
+    El cliente pide msgpack con ?wire=msgpack en la URL de conexión; si no lo pide
+    (o msgpack no está instalado) se usa JSON.
+
+    También limita la cola de salida de cada conexión: cuando un cliente lento
+    acumula outbound_queue_limit paquetes sin enviar, los eventos descartables se
+    pierden y de los colapsables solo se guarda el último, que se envía cuando la
+    cola se vacía. El resto de los eventos siempre se entrega
+    """
+
+    def __init__(self, *args, allow_msgpack: bool = True, outbound_queue_limit: int = 0,
+                 droppable_events: Iterable[str] = (), collapsible_events: Iterable[str] = (),
+                 **kwargs):
+        kwargs.setdefault("client_manager", WireManager())
+        kwargs["serializer"] = WirePacket
+        super().__init__(*args, **kwargs)
+        self.wire_formats_offered = available_formats(allow_msgpack)
+        self.wire_formats: Dict[str, str] = {}  # eio_sid -> formato negociado
+
+        self.outbound_queue_limit = outbound_queue_limit  # 0 = sin límite
+        self.droppable_events = set(droppable_events)
+        self.collapsible_events = set(collapsible_events)
+        self.collapsed: Dict[str, Dict[str, List[eio_packet.Packet]]] = {}  # eio_sid -> evento -> paquetes
+        self.dropped_counts: Counter = Counter()  # evento -> mensajes descartados
+        self.collapsed_counts: Counter = Counter()  # evento -> mensajes reemplazados por uno posterior
+        self.collapsed_flushed = 0  # mensajes colapsados que se terminaron enviando
+
+    def outbound_backlog(self, eio_sid: str) -> int:
+        """
+        Paquetes en cola de salida de una conexión (todavía no escritos al socket)
+        """
+        socket = self.eio.sockets.get(eio_sid)
+        return socket.queue.qsize() if socket is not None else 0
+
+    def admit(self, eio_sid: str, event: str, eio_packets: List[eio_packet.Packet]) -> bool:
+        """
+        Decide si un evento se encola para un cliente o se descarta/colapsa por
+        contrapresión
+        """
+        if not self.outbound_queue_limit or (event not in self.droppable_events
+                                             and event not in self.collapsible_events):
+            return True
+
+        pending = self.collapsed.get(eio_sid)
+        if self.outbound_backlog(eio_sid) < self.outbound_queue_limit:
+            # Este envío reemplaza cualquier versión colapsada anterior del mismo evento
+            if pending and pending.pop(event, None) is not None and not pending:
+                del self.collapsed[eio_sid]
+            return True
+
+        if event in self.collapsible_events:
+            if pending is None:
+                pending = self.collapsed[eio_sid] = {}
+            if event in pending:
+                self.collapsed_counts[event] += 1
+            pending[event] = eio_packets
+        else:
+            self.dropped_counts[event] += 1
+        return False
+
+    async def flush_collapsed(self):
+        """
+        Envía la última versión de los eventos colapsados a los clientes cuya cola
+        ya bajó del límite
+        """
+        for eio_sid in list(self.collapsed.keys()):
+            if self.outbound_backlog(eio_sid) >= self.outbound_queue_limit:
+                continue
+
+            pending = self.collapsed.pop(eio_sid)
+            for eio_packets in pending.values():
+                for eio_pkt in eio_packets:
+                    await self._send_eio_packet(eio_sid, eio_pkt)
+                self.collapsed_flushed += 1
+
+    def backpressure_stats(self) -> Dict:
+        """
+        Métricas de mensajes descartados y colapsados por contrapresión
+        """
+        return {
+            "outbound_queue_limit": self.outbound_queue_limit,
+            "dropped": dict(self.dropped_counts),
+            "collapsed": dict(self.collapsed_counts),
+            "collapsed_pending": sum(len(pending) for pending in self.collapsed.values()),
+            "collapsed_flushed": self.collapsed_flushed
+        }
+
+    def wire_format(self, eio_sid: str) -> str:
+        return self.wire_formats.get(eio_sid, WIRE_JSON)
+
+    def encode_eio_packets(self, pkt: WirePacket, wire_format: str) -> List[eio_packet.Packet]:
+        """
+        Convierte un paquete Socket.IO en los mensajes Engine.IO a enviar
+        """
+        encoded_packet = pkt.encode_as(wire_format)
+        if not isinstance(encoded_packet, list):
+            encoded_packet = [encoded_packet]
+        return [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded_packet]
+
+    async def _send_packet(self, eio_sid, pkt):
+        for eio_pkt in self.encode_eio_packets(pkt, self.wire_format(eio_sid)):
+            await self._send_eio_packet(eio_sid, eio_pkt)
+
+    async def _handle_eio_connect(self, eio_sid, environ):
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        requested = query.get("wire", [WIRE_JSON])[0]
+        if requested in self.wire_formats_offered:
+            self.wire_formats[eio_sid] = requested
+        return await super()._handle_eio_connect(eio_sid, environ)
+
+    async def _handle_eio_disconnect(self, eio_sid):
+        try:
+            await super()._handle_eio_disconnect(eio_sid)
+        finally:
+            self.wire_formats.pop(eio_sid, None)
+            self.collapsed.pop(eio_sid, None)
+
+    def wire_stats(self) -> Dict[str, int]:
+        """
+        Cantidad de clientes conectados por formato
+        """
+        stats = {wire_format: 0 for wire_format in self.wire_formats_offered}
+        for eio_sid in self.environ:
+            stats[self.wire_format(eio_sid)] += 1
+        return stats